@@ -25,20 +25,28 @@ if __name__ == '__main__':
     ############################################################################
     mw.cmd.connect(controller.distribute_cmd)
     controller.log.connect(mw.update_log)
+    controller.error.connect(mw.update_error)
     controller.device_state.connect(mw.parse_state)
     controller.data.connect(mw.data)
+    controller.spectrum.connect(mw.spectrum)
 
     # Data and log management
     ############################################################################
-    # result = ExperimentResult()
-    # When logs are updated on GUI, update them in the result object
-    # mw.log_changed.connect(result.write_logs)
+    result = ExperimentResult()
+    # Each message logged on the GUI is appended to the result file, as is
+    # every device log record with its device and level
+    mw.log_added.connect(result.log)
+    controller.device_log.connect(result.log)
+    # Finished scans are stored as one dataset each
+    controller.scan_result.connect(result.write_scan)
+    # Later scans use the last stored time-zero calibration
+    controller.t0 = result.t0()
 
 
     # Cleanup on shutdown
     ############################################################################
     app.aboutToQuit.connect(controller.exit)
-    # app.aboutToQuit.connect(result.exit)
+    app.aboutToQuit.connect(result.exit)
 
     # MainWindow has it's own closeEvent slot which handles exiting
 
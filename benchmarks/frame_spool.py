@@ -0,0 +1,127 @@
+"""!
+@brief Throughput and CPU cost of spooling frames raw, against writing them
+compressed, plus recovery after a crash and consolidation.
+
+Frames have the structure of ZurichDaq frames: one 512x512 float64 plane per
+channel. Reports, for FrameSpool and for ExperimentResult stacks (gzip 1):
+- frames/s and MB/s written as fast as possible;
+- the CPU time per frame of the whole process.
+A child process is then killed (SIGKILL) while spooling, to show how many of
+its frames can still be read. Last, a spool is consolidated in a worker
+process. Run from the package root:
+
+    python -m benchmarks.frame_spool
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+from utilities.experimentresult import ExperimentResult
+from utilities.framespool import FrameSpool, consolidate_async, read_spool
+
+## @var CHILD
+# (str) Program of the killed child: spools frames until killed, printing the
+# number committed.
+CHILD = '''
+import sys
+import numpy as np
+from utilities.framespool import FrameSpool
+dtype = np.dtype([('d0_r', 'f8', (512, 512)), ('d0_theta', 'f8', (512, 512))])
+spool = FrameSpool(sys.argv[1], dtype, segment_frames=16)
+frame = np.zeros((), dtype)
+while True:
+    frame['d0_r'] = spool.count
+    spool.write(frame)
+    print(spool.count, flush=True)
+'''
+
+
+def _frames(count, channels, shape=(512, 512), seed=0):
+    """! A pool of structured test frames: smooth images plus noise."""
+    rng = np.random.default_rng(seed)
+    dtype = np.dtype([(f'd{i}_r', 'f8', shape) for i in range(channels)])
+    frames = np.zeros(count, dtype)
+    y, x = np.indices(shape)
+    image = 0.1 + np.exp(-((y - 200.)**2 + (x - 300.)**2)/(2*40.**2))
+    for field in dtype.names:
+        frames[field] = image + 0.01*rng.standard_normal((count, *shape))
+    return frames
+
+
+def _spool(directory, frames, count):
+    """! Spool count frames.
+    @return (tuple) Wall and CPU time in seconds.
+    """
+    start, cpu = time.perf_counter(), time.process_time()
+    spool = FrameSpool(directory, frames.dtype)
+    for i in range(count):
+        spool.write(frames[i % len(frames)], i, float(i))
+    spool.close()
+    return time.perf_counter() - start, time.process_time() - cpu
+
+
+def _compressed(path, frames, count):
+    """! Append count frames to gzip compressed stacks, one per channel.
+    @return (tuple) Wall and CPU time in seconds.
+    """
+    start, cpu = time.perf_counter(), time.process_time()
+    result = ExperimentResult(path, 'spoolbench')
+    for field in frames.dtype.names:
+        result.create_stack(field, frames.dtype[field].shape)
+    for i in range(count):
+        for field in frames.dtype.names:
+            result.append(field, frames[i % len(frames)][field], block=True)
+    result.exit()
+    return time.perf_counter() - start, time.process_time() - cpu
+
+
+def _crash(directory, frames=40):
+    """! Kill a spooling child process once it has committed frames.
+    @return (tuple) Frames committed before the kill and frames read back.
+    """
+    child = subprocess.Popen([sys.executable, '-c', CHILD, directory],
+                             stdout=subprocess.PIPE, text=True,
+                             env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    committed = 0
+    for line in child.stdout:
+        committed = int(line)
+        if committed >= frames:
+            break
+    child.kill()
+    child.wait()
+    header, read = read_spool(directory)
+    recovered = [(sequence, float(frame['d0_r'][0, 0])) for sequence, _, frame in read]
+    assert all(sequence == value for sequence, value in recovered)
+    return committed, len(recovered), header['complete']
+
+
+def main(count=200, channels=2):
+    frames = _frames(8, channels)
+    size = count*frames.dtype.itemsize
+    print(f'{count} frames of {channels} x 512 x 512 float64, {size / 1e6:.0f} MB')
+    print(f'\t{"":<18}{"frames/s":>10}{"MB/s":>10}{"CPU/frame":>13}')
+    with tempfile.TemporaryDirectory() as path:
+        for label, run in (('raw spool', lambda: _spool(os.path.join(path, 'spool'),
+                                                        frames, count)),
+                           ('gzip 1 stacks', lambda: _compressed(path, frames, count))):
+            wall, cpu = run()
+            print(f'\t{label:<18}{count / wall:10.1f}{size / wall / 1e6:10.1f}'
+                  f'{cpu / count * 1e3:10.2f} ms')
+
+        committed, recovered, complete = _crash(os.path.join(path, 'crashed'))
+        print(f'\tkilled while spooling: {committed} frames committed, '
+              f'{recovered} read back (spool complete: {complete})')
+
+        start = time.perf_counter()
+        future = consolidate_async(os.path.join(path, 'spool'), name='frames',
+                                   remove=True)
+        print(f'\tconsolidated {future.result()} frames in a worker process in '
+              f'{time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""!
+@brief End to end imaging benchmark against the simulated lock-in and its
+dataAcquisitionModule.
+
+ZurichLockin is opened through its normal discovery path with the ZI API
+replaced by ZiApiSimulator. Frames of every demodulator channel are then
+acquired for a fixed time at the default 512 x 512 pixels and 3 us dwell,
+and averaged as they arrive. Reports the frames delivered against those
+acquired, dropped frames and ring overruns, the delay from a frame's last
+sample to its delivery, and the SNR reached. Run from the package root:
+
+    python -m benchmarks.imaging_pipeline
+"""
+
+import time
+import numpy as np
+from PyQt5.QtCore import QCoreApplication, QTimer, Qt
+
+from control.devices import zurichlockin
+from control.devices.zurichlockin import ZurichLockin
+from control.devices.simulators.zisim import ZiApiSimulator, ZiServerSimulator
+from control.routines.frameaverage import FrameAverage
+
+
+def main(duration=10., noise=0.2):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    server = ZiServerSimulator(noise=noise)
+    zurichlockin.ziPython = ZiApiSimulator(server)
+    lockin = ZurichLockin()
+    print(lockin.open())
+
+    daq = lockin._daq
+    average = FrameAverage(lockin.frames, channel='d0_r')
+    latency = []
+    def arrived(slot, sequence, timestamp):
+        # Sample timestamps of the simulator count ticks of the monotonic clock
+        latency.append(time.monotonic() - timestamp)
+    daq.frame.connect(arrived, Qt.DirectConnection)
+    daq.frame.connect(average.consume, Qt.DirectConnection)
+
+    lockin.start_daq()
+    QTimer.singleShot(int(duration*1e3), lockin.stop_daq)
+    QTimer.singleShot(int(duration*1e3) + 200, app.quit)
+    app.exec_()
+    lockin._daq_thread.quit()
+    lockin._daq_thread.wait()
+
+    period = daq._daq.frame_period
+    rows, cols = daq.ring.dtype[0].shape
+    print(f'{len(daq.channels)} channels, {cols} x {rows} '
+          f'pixels, {period:.3f} s per frame, {duration:.0f} s')
+    print(f'\tframes acquired     {duration / period:8.1f}')
+    print(f'\tframes delivered    {daq.frames:8d}')
+    print(f'\tdropped / partial   {daq.dropped:8d}')
+    print(f'\tring overruns       {lockin.frames.overruns:8d}')
+    print(f'\tdelivery delay      {np.mean(latency) * 1e3:8.1f} ms mean, '
+          f'{np.max(latency) * 1e3:.1f} ms max')
+    print(f'\tmedian SNR          {np.nanmedian(average.snr):8.1f}')
+
+
+if __name__ == '__main__':
+    main()
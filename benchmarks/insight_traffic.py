@@ -0,0 +1,67 @@
+"""!
+@brief Benchmark of steady-state serial traffic generated by Insight status
+polling against the simulated Insight DS+.
+
+Compares reading every condition and the status word each cycle (the
+original behaviour) with the cached, status word gated polling, by counting
+the commands received by the simulator. A warning is raised partway through
+to show the history buffer being read only when the status bits change. Run
+from the package root:
+
+    python -m benchmarks.insight_traffic
+"""
+
+import time
+
+from control.devices.device import Device
+from control.devices.insight import Insight
+from control.devices.simulators.insightsim import InsightSimulator
+
+
+def _full_poll(device):
+    """! Every condition and the status word, as every cycle originally."""
+    device.query_many([f'{device.cmds[cmd]}?' for cmd in device.cmds] + ['*STB?'])
+
+
+def _gated_poll(device):
+    """! query_state whenever a parameter is due, as run by StatusReporter."""
+    if device.is_due():
+        device.query_state()
+
+
+def _traffic(poll, device, sim, duration, interval, fault_at=None):
+    """! Run a poll loop and count the commands the simulator receives.
+    @return (tuple) Commands per second, and the number of history reads.
+    """
+    sim.commands.clear()
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        if fault_at is not None and time.monotonic() - start > fault_at:
+            sim.set_fault('130', warning=True)
+            fault_at = None
+        device.submit(poll, device, priority=Device.STATUS).result()
+        time.sleep(interval)
+    history = sum(1 for cmd in sim.commands if cmd.upper().startswith('READ:AHIS'))
+    return len(sim.commands)/duration, history
+
+
+def main(duration=10., latency=0.002, link=0.004):
+    sim = InsightSimulator(latency=latency, link=link, warmup=0.).start()
+    device = Insight()
+    device.comport = sim.port
+    device.submit(device.open).result()
+    device.submit(device.parse_cmd, 'op_state', 'RUN').result()
+    time.sleep(0.5)
+    print(f'{device.name} steady state, {duration:.0f} s')
+    for label, poll, interval in (('full read every 0.5 s', _full_poll, 0.5),
+                                  ('status word gated', _gated_poll, 0.05)):
+        rate, history = _traffic(poll, device, sim, duration, interval,
+                                 fault_at=duration/2)
+        sim.clear_faults()
+        print(f'\t{label:<24}{rate:8.2f} commands/s{history:6d} history reads')
+    device.shutdown()
+    sim.stop()
+
+
+if __name__ == '__main__':
+    main()
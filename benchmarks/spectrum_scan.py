@@ -0,0 +1,85 @@
+"""!
+@brief End to end delay scans and sweeps against the simulated FCL200 and
+lock-in.
+
+Runs a 200 point spectral focusing scan through DelayScan, with the simulated
+lock-in signal following a Gaussian cross-correlation in stage position, and
+reports the scan time before and after calibrating the stage's motion model.
+The same spectrum is then acquired with continuous DelaySweeps at several
+velocities. Run from the package root:
+
+    python -m benchmarks.spectrum_scan
+"""
+
+import time
+import numpy as np
+
+from control.devices.delaystage import DelayStage
+from control.devices.zurichlockin import ZurichLockin
+from control.devices.simulators.delaystagesim import DelayStageSimulator
+from control.devices.simulators.zisim import ZiServerSimulator
+from control.routines.delayscan import DelayScan
+from control.routines.delaysweep import DelaySweep
+
+
+def _scan(stage, lockin, positions, dwell):
+    """! Run one scan.
+    @return (tuple) The spectrum and the scan time in seconds.
+    """
+    start = time.perf_counter()
+    data = DelayScan(stage, lockin, positions, dwell=dwell).run()
+    return data, time.perf_counter() - start
+
+
+def _sweep(stage, lockin, start, end, bins, vel):
+    """! Run one sweep.
+    @return (tuple) The spectrum and the sweep time in seconds.
+    """
+    begin = time.perf_counter()
+    data = DelaySweep(stage, lockin, start, end, bins, vel=vel).run()
+    return data, time.perf_counter() - begin
+
+
+def _peak(data):
+    """! Position of the maximum of R."""
+    return data['setpoint'][np.nanargmax(data['r'])]
+
+
+def main(steps=200, start=-1., end=1., dwell=0.01, latency=0.002, link=0.004,
+         settle=0.02, center=0.3, velocities=(1., 5., 20.)):
+    sim = DelayStageSimulator(latency=latency, link=link, settle=settle).start()
+    stage = DelayStage()
+    stage.comport = sim.port
+    stage.submit(stage.open).result()
+    stage.submit(stage.query_state).result()
+
+    # Signal follows the simulated stage position
+    server = ZiServerSimulator(
+        signal=lambda t: np.exp(-(sim.position_at(t) - center)**2/0.2),
+        noise=0.01)
+    lockin = ZurichLockin()
+    lockin.attach(server, server.devname)
+
+    positions = DelayScan.positions(start, end, steps)
+    print(f'{steps} point delay scan from {start} to {end} mm, {dwell * 1e3:.1f} ms '
+          f'dwell, {settle * 1e3:.1f} ms stage settling, peak at {center} mm')
+    data, elapsed = _scan(stage, lockin, positions, dwell)
+    print(f'\t{"step, uncalibrated":<24}{elapsed:8.2f} s{steps / elapsed:10.1f} '
+          f'points/s    peak {_peak(data):.3f} mm')
+    stage.calibrate_motion()
+    data, elapsed = _scan(stage, lockin, positions, dwell)
+    print(f'\t{"step, calibrated":<24}{elapsed:8.2f} s{steps / elapsed:10.1f} '
+          f'points/s    peak {_peak(data):.3f} mm')
+    for vel in velocities:
+        data, elapsed = _sweep(stage, lockin, start, end, steps, vel)
+        label = f'sweep, {vel:g} mm/s'
+        print(f'\t{label:<24}{elapsed:8.2f} s{steps / elapsed:10.1f} '
+              f'points/s    peak {_peak(data):.3f} mm')
+
+    stage.shutdown()
+    lockin.shutdown()
+    sim.stop()
+
+
+if __name__ == '__main__':
+    main()
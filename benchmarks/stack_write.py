@@ -0,0 +1,98 @@
+"""!
+@brief Write throughput of ExperimentResult image stacks.
+
+Appends 512x512 float64 frames to stacks with different chunk and compression
+settings through the background writer. Reports the write rate in frames/s
+and MB/s of raw frame data, the size on disk relative to the raw data, and the
+longest stall of another thread polling every millisecond while the stack is
+written, as the DAQ reader does. The frames are a smooth image, as from
+the simulated lock-in, plus noise. Run from the package root:
+
+    python -m benchmarks.stack_write
+"""
+
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+
+from utilities.experimentresult import ExperimentResult
+
+## @var SETTINGS
+# (list[tuple]) Label, frames per chunk, compression, gzip level, shuffle.
+SETTINGS = [('none, 1 frame/chunk', 1, None, None, False),
+            ('none, 8 frames/chunk', 8, None, None, False),
+            ('lzf, 1 frame/chunk', 1, 'lzf', None, True),
+            ('lzf, 8 frames/chunk', 8, 'lzf', None, True),
+            ('gzip 1, 1 frame/chunk', 1, 'gzip', 1, True),
+            ('gzip 1, 8 frames/chunk', 8, 'gzip', 1, True),
+            ('gzip 4, 1 frame/chunk', 1, 'gzip', 4, True),
+            ('gzip 1, no shuffle', 1, 'gzip', 1, False)]
+
+
+def _frames(count, shape, noise, seed=0):
+    """! A pool of test frames: Gaussian spots on a background, plus noise.
+    @return (np.ndarray) count x shape frames.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.indices(shape)
+    image = np.full(shape, 0.1)
+    for cy, cx in rng.uniform(0, shape[0], (20, 2)):
+        image += np.exp(-((y - cy)**2 + (x - cx)**2)/(2*15.**2))
+    return image + noise*rng.standard_normal((count, *shape))
+
+
+def _poll(stop, stalls):
+    """! Sleep 1 ms at a time until stop is set, recording the longest gap."""
+    last = time.perf_counter()
+    while not stop.is_set():
+        time.sleep(0.001)
+        now = time.perf_counter()
+        stalls.append(now - last)
+        last = now
+
+
+def _run(path, frames, count, chunk, compression, level, shuffle):
+    """! Write count frames to a new stack.
+    @return (tuple) Write time in s, longest stall of a polling thread in s and
+    stack size on disk in bytes.
+    """
+    result = ExperimentResult(path=path, name='stackbench')
+    result.create_stack('frames', frames.shape[1:], frames.dtype,
+                        chunk_frames=chunk, compression=compression,
+                        compression_opts=level, shuffle=shuffle)
+    stop, stalls = threading.Event(), []
+    poller = threading.Thread(target=_poll, args=(stop, stalls))
+    poller.start()
+    start = time.perf_counter()
+    for i in range(count):
+        result.append('frames', frames[i % len(frames)], block=True)
+    result.flush()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    poller.join()
+    dset = result.file['stacks/frames']
+    assert dset.shape[0] == count
+    stored = dset.id.get_storage_size()
+    result.exit()
+    return elapsed, max(stalls), stored
+
+
+def main(count=200, shape=(512, 512), noise=0.01):
+    frames = _frames(16, shape, noise)
+    raw = count*frames[0].nbytes
+    print(f'{count} frames of {shape[0]}x{shape[1]} {frames.dtype}, '
+          f'{raw / 1e6:.0f} MB raw, queue of {ExperimentResult.queue_size}')
+    print(f'\t{"":<26}{"frames/s":>10}{"MB/s":>10}{"max stall":>12}{"size":>8}')
+    with tempfile.TemporaryDirectory() as path:
+        for label, chunk, compression, level, shuffle in SETTINGS:
+            elapsed, stall, stored = _run(path, frames, count, chunk,
+                                           compression, level, shuffle)
+            print(f'\t{label:<26}{count / elapsed:10.1f}{raw / elapsed / 1e6:10.1f}'
+                  f'{stall * 1e3:9.2f} ms{stored / raw:8.0%}')
+            os.remove(os.path.join(path, 'stackbench.h5'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""!
+@brief Benchmark of Insight and DelayStage status polls against simulated
+serial devices.
+
+Compares the original write/sleep/read loop, one query per parameter, and a
+single batched query_many transaction. Run from the package root:
+
+    python -m benchmarks.status_poll
+"""
+
+import time
+
+from control.devices.insight import Insight
+from control.devices.delaystage import DelayStage
+from control.devices.simulators.insightsim import InsightSimulator
+from control.devices.simulators.delaystagesim import DelayStageSimulator
+
+
+def _legacy_poll(device):
+    """! The original per-parameter loop: write, sleep comtime, read."""
+    for cmd in device.cmds:
+        device.write(f'{device.cmds[cmd]}?', device.comtime)
+        device.read()
+
+
+def _serial_poll(device):
+    """! One query transaction per parameter."""
+    for cmd in device.cmds:
+        device.query(f'{device.cmds[cmd]}?')
+
+
+def _batched_poll(device):
+    """! All parameters in a single query_many transaction."""
+    device.query_many([f'{device.cmds[cmd]}?' for cmd in device.cmds])
+
+
+def _rate(poll, device, duration):
+    """! Run a poll repeatedly for a fixed time.
+    @return (float) Polls per second.
+    """
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        poll(device)
+        n += 1
+    return n / (time.perf_counter() - start)
+
+
+def main(duration=3.0, latency=0.002, link=0.004):
+    for cls, simcls in ((Insight, InsightSimulator),
+                        (DelayStage, DelayStageSimulator)):
+        sim = simcls(latency=latency, link=link).start()
+        device = cls()
+        device.comport = sim.port
+        device.open()
+        print(f'{device.name} ({len(device.cmds)} parameters, '
+              f'{latency * 1e3:.1f} ms device latency, '
+              f'{link * 1e3:.1f} ms link latency)')
+        for label, poll in (('write/sleep/read', _legacy_poll),
+                            ('query per parameter', _serial_poll),
+                            ('query_many batch', _batched_poll)):
+            print(f'\t{label:<22}{_rate(poll, device, duration):10.1f} polls/s')
+        device.close()
+        sim.stop()
+
+
+if __name__ == '__main__':
+    main()
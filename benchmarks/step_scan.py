@@ -0,0 +1,71 @@
+"""!
+@brief Benchmark of delay stage step-scan throughput against the simulated
+FCL200.
+
+Compares the original blocking move (ask the controller for the move time
+with 1PT, then write and sleep for that time plus comtime), completion polling
+every motion_poll seconds, and polling that starts at the locally predicted,
+calibrated move time. Run from the package root:
+
+    python -m benchmarks.step_scan
+"""
+
+import time
+
+from control.devices.delaystage import DelayStage
+from control.devices.simulators.delaystagesim import DelayStageSimulator
+
+
+def _legacy_step(device, step):
+    """! The original relative move: 1PT round trip, write, sleep, read back."""
+    t = float(device.query(f'1PT{abs(step):.4f}')[3:])
+    device.write(f'1PR{step:.4f}', t + device.comtime)
+    device.read()
+    device.query('1TE')
+    device.query('1TP?')
+
+
+def _future_step(device, step):
+    """! A non-blocking move, waiting on its completion future."""
+    device.move_relative(step).result()
+
+
+def _rate(move, device, step, steps):
+    """! Make a number of steps in alternating directions.
+    @return (float) Steps per second.
+    """
+    start = time.perf_counter()
+    for i in range(steps):
+        move(device, step if i % 2 == 0 else -step)
+    return steps / (time.perf_counter() - start)
+
+
+def main(steps=50, step=0.005, latency=0.002, link=0.004, settle=0.02):
+    sim = DelayStageSimulator(latency=latency, link=link, settle=settle).start()
+    device = DelayStage()
+    device.comport = sim.port
+    device.submit(device.open).result()
+    device.submit(device.query_state).result()
+    print(f'{device.name} ({step} mm steps, {latency * 1e3:.1f} ms device '
+          f'latency, {link * 1e3:.1f} ms link latency, {settle * 1e3:.1f} ms '
+          f'settling)')
+
+    print(f'\t{"1PT + write/sleep":<26}'
+          f'{_rate(_legacy_step, device, step, steps):10.1f} steps/s')
+    device.predict_motion = False
+    print(f'\t{"completion polling":<26}'
+          f'{_rate(_future_step, device, step, steps):10.1f} steps/s')
+    device.predict_motion = True
+    print(f'\t{"predicted (uncalibrated)":<26}'
+          f'{_rate(_future_step, device, step, steps):10.1f} steps/s')
+    scale, offset = device.calibrate_motion()
+    print(f'\t{"predicted (calibrated)":<26}'
+          f'{_rate(_future_step, device, step, steps):10.1f} steps/s'
+          f'    scale {scale:.3f}, offset {offset * 1e3:.1f} ms')
+
+    device.shutdown()
+    sim.stop()
+
+
+if __name__ == '__main__':
+    main()
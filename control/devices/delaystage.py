@@ -4,13 +4,67 @@ custom exception classes PositionerError and CommandError for parsing the corres
 
 Classes:
 DelayStage
+Motion
 PositionError
 CommandError
 """
 
-from .serialdevice import SerialDevice
+from .serialdevice import SerialDevice, ReplyTimeoutError
+from .motionprofile import profile_time, profile_distances
 from serial.serialutil import PortNotOpenError
 from PyQt5.QtCore import pyqtSignal as Signal
+from concurrent.futures import Future
+from concurrent.futures._base import RUNNING, CANCELLED_AND_NOTIFIED
+import numpy as np
+import time
+
+# Motion
+################################################################################
+
+class Motion(Future):
+    """! Future of a delay stage move, returned by DelayStage.move_relative
+    and move_absolute. Completes with the final position once the stage
+    reports it is no longer moving. Cancelling it stops the stage. Also holds
+    what DelayStage.positions_at needs to reconstruct positions during the
+    move.
+    """
+    def __init__(self):
+        """! Motion class initializer."""
+        super().__init__()
+
+        ## @var profile
+        # (tuple[float]) Start position and distance in mm, velocity in mm/s
+        # and acceleration in mm/s^2 of the move, or None if they were unknown
+        # when it started.
+        self.profile = None
+
+        ## @var started
+        # (float) Monotonic time the move command was sent, or None until then.
+        self.started = None
+
+    def cancel(self) -> bool:
+        """! Cancel the move. Unlike a plain Future, a move can be cancelled
+        once the I/O worker has started it: the stage is then stopped at the
+        next completion check.
+        @return (bool) False if the move has already finished.
+        """
+        with self._condition:
+            running = self._state == RUNNING
+            if running:
+                # As Future.set_running_or_notify_cancel does for futures
+                # cancelled while pending
+                self._state = CANCELLED_AND_NOTIFIED
+                for waiter in self._waiters:
+                    waiter.add_cancelled(self)
+                self._condition.notify_all()
+        if not running:
+            return super().cancel()
+        self._invoke_callbacks()
+        return True
+
+
+# DelayStage
+################################################################################
 
 class DelayStage(SerialDevice):
     """! The DelayStage class for controlling the Newport FCL200 delay stage.
@@ -46,6 +100,39 @@ class DelayStage(SerialDevice):
     cmds = { 'pos' : '1TP',
              'vel' : '1VA',
              'accel' : '1AC' }
+
+    ## @var refresh
+    # (dict[str]:float) Refresh interval in seconds for each parameter while
+    # the stage is idle. Velocity and acceleration only change when written.
+    # op_state covers the 1TS and 1TE reads.
+    refresh = { 'pos' : 1.,
+                'vel' : None,
+                'accel' : None,
+                'op_state' : 0.5 }
+
+    ## @var moving_refresh
+    # (float) Refresh interval in seconds for position and state while the
+    # stage is moving.
+    moving_refresh = 0.05
+
+    ## @var motion_poll
+    # (float) Time in seconds between completion checks during a move.
+    motion_poll = 0.02
+
+    ## @var predict_motion
+    # (bool) Whether to wait for the predicted duration of a move (see
+    # move_time) before the first completion check. Otherwise the stage is
+    # checked every motion_poll seconds from the start of the move.
+    predict_motion = True
+
+    ## @var invalidates
+    # (dict[str]:tuple[str]) Parameters made stale by each parse_cmd command.
+    invalidates = { 'abs_move' : ('pos', 'op_state'),
+                    'stop' : ('pos', 'op_state'),
+                    'rel_move_neg' : ('pos', 'op_state'),
+                    'rel_move_pos' : ('pos', 'op_state'),
+                    'vel' : ('vel', 'op_state'),
+                    'accel' : ('accel', 'op_state') }
     # cmd_result = Signal(str)
 
     def __init__(self, name = 'Delay Stage'):
@@ -60,6 +147,45 @@ class DelayStage(SerialDevice):
         self._cond_vars = {'pos':'', 'vel':'', 'accel':'',
                            'cmd_err': 'No Error.', 'pos_err' : '', 'op_state': ''}
 
+        ## @var _motion
+        # (Motion) The move in progress, or None when idle.
+        self._motion = None
+
+        ## @var _stop_sent
+        # (bool) Whether the stop command was sent for the move in progress.
+        self._stop_sent = False
+
+        ## @var _motion_start
+        # (float) Monotonic time the move in progress was started.
+        self._motion_start = 0.
+
+        ## @var _motion_checked
+        # (float) Monotonic time of the last completion check of the move in
+        # progress.
+        self._motion_checked = 0.
+
+        ## @var _motion_model
+        # (float) Uncalibrated profile time of the move in progress.
+        self._motion_model = 0.
+
+        ## @var _time_scale
+        # (float) Calibrated scale applied to the profile time by move_time.
+        self._time_scale = 1.
+
+        ## @var _time_offset
+        # (float) Calibrated offset in seconds added to the profile time by
+        # move_time. Covers settling and controller overhead.
+        self._time_offset = 0.
+
+        ## @var _calibrating
+        # (bool) Whether moves are being timed by calibrate_motion.
+        self._calibrating = False
+
+        ## @var _motion_times
+        # (list[tuple[float]]) (profile time, measured time) of each move made
+        # during calibration.
+        self._motion_times = []
+
     # State and error checking
     ############################################################################
     def _query_state(self):
@@ -67,35 +193,35 @@ class DelayStage(SerialDevice):
         Errors are accessed through raising a PositionerError exception. The
         class definition for the exception contains the error code definitions.
         """
-        self.check_errors()
-        self._read_current_conditions()
+        # Only parameters whose cached values have expired are read
+        keys = self._due(self.cmds)
+        read_status = len(self._due(['op_state'])) > 0
+        # Reading 1TE clears the controller's last command error. During a
+        # move it is left to the move's own checks, which fail the move if
+        # the motion command was rejected.
+        moving = self._motion is not None
+        extra = []
+        if read_status:
+            extra += ['1TS'] if moving else ['1TE', '1TS']
+            self._mark('op_state')
         try:
-            # Query state which returns 6 characters
-            self.write('1TS', self.comtime)
-            resp = self.read()
-
-            # The last two characters represent the delay stage state as a
-            # hexadecimal number, but no processing is required. The state is
-            # read directly from the class variable _controller_state defined
-            # above.
-            self._cond_vars['op_state'] = self._controller_state[resp[7:9]]
-
-            # The first four characters are the error code and represent
-            # hexadecimal digits. These form a 16-digit number in binary
-            # representation. A 1 in any position flags an error, which is
-            # defined in the class variable _pos_errors of the PositionerError.
-            bin_repr = format(int(resp[3:7], 16), '0>16b')
-            if '1' in bin_repr:
-                raise PositionerError(bin_repr)
+            # The last command error and the state are read in the same batch
+            # as the current conditions.
+            replies = self._read_current_conditions(keys, *extra)
+            if not read_status:
+                return
+            if not moving:
+                self._parse_cmd_error(replies[0])
+            self._parse_state(replies[-1])
 
             # self.cmd_result = 'Read state and checked for positioner errors.'
 
         except PositionerError as err:
-            self._cond_vars['pos_err'] = str(e)
+            self._cond_vars['pos_err'] = str(err)
             # self.cmd_result = 'Positioner error: {}'.format(str(e))
             self.cmd_result.emit(f'Positioner error: {str(err)}')
 
-        except PortNotOpenError as err:
+        except (PortNotOpenError, ReplyTimeoutError) as err:
             pass
             # self.log('Not connected to Insight.')
             # self.cmd_result.emit('Not connected to Insight.')
@@ -105,6 +231,25 @@ class DelayStage(SerialDevice):
             self.cmd_result.emit(f'Error: {str(e)}')
             pass
 
+    def _parse_state(self, resp: str):
+        """! Store the controller state contained in a reply to 1TS.
+        @param resp (str) The full reply, including the '1TS' echo.
+        @exception PositionerError If any positioner error bit is set.
+        """
+        # The last two characters represent the delay stage state as a
+        # hexadecimal number, but no processing is required. The state is
+        # read directly from the class variable _controller_state defined
+        # above.
+        self._cond_vars['op_state'] = self._controller_state[resp[7:9]]
+
+        # The first four characters are the error code and represent
+        # hexadecimal digits. These form a 16-digit number in binary
+        # representation. A 1 in any position flags an error, which is
+        # defined in the class variable _pos_errors of the PositionerError.
+        bin_repr = format(int(resp[3:7], 16), '0>16b')
+        if '1' in bin_repr:
+            raise PositionerError(bin_repr)
+
     def check_errors(self):
         """! Check for command errors and also query state.
         Errors are accessed through raising a CommandError exception. The class
@@ -112,9 +257,20 @@ class DelayStage(SerialDevice):
         """
         try:
             # Query what the last command error was and store it.
-            self.write('1TE', self.comtime)
-            resp = self.read()[3:].strip()
+            self._parse_cmd_error(self.query('1TE'))
+        except (PortNotOpenError, ReplyTimeoutError) as err:
+            pass
+            # self.cmd_result.emit('Not connected to delay stage.')
+        # except Exception as e:
+        #     # self.cmd_result = 'Error: {}'.format(str(e))
+        #     pass
 
+    def _parse_cmd_error(self, resp: str):
+        """! Store the command error contained in a reply to 1TE.
+        @param resp (str) The full reply, including the '1TE' echo.
+        """
+        try:
+            resp = resp[3:]
             self._cond_vars['cmd_err'] = str(CommandError(resp))
 
             # Raise error if response is other than '@' (no error)
@@ -124,99 +280,390 @@ class DelayStage(SerialDevice):
         except CommandError as err:
             # self.cmd_result = 'Command error: {}'.format(str(e))
             pass
-        except PortNotOpenError as err:
-            pass
-            # self.cmd_result.emit('Not connected to delay stage.')
-        # except Exception as e:
-        #     # self.cmd_result = 'Error: {}'.format(str(e))
-        #     pass
 
-    def _read_current_conditions(self):
-        for cmd in self.cmds:
-            try:
-                self.write(f'{self.cmds[cmd]}?', self.comtime)
-                self._cond_vars[cmd] = self.read()[3:].strip()
-            except PortNotOpenError as err:
-                self._cond_vars[cmd] = '-'
-                # self.cmd_result.emit('Not connected to delay stage.')
+    def _read_current_conditions(self, keys, *extra) -> list:
+        """! Read parameters in cmds in a single batched transaction.
+        @param keys (list[str]) The parameters to read. Usually those whose
+        cached values have expired.
+        @param extra (str) Additional queries to append to the same batch.
+        @return (list[str]) The full replies to the extra queries, in order.
+        """
+        if not keys and not extra:
+            return []
+        try:
+            replies = self.query_many([f'{self.cmds[key]}?' for key in keys]
+                                      + list(extra))
+        except (PortNotOpenError, ReplyTimeoutError) as err:
+            for key in keys:
+                self._cond_vars[key] = '-'
+            # Read again once a reply arrives, including parameters only
+            # refreshed on invalidation
+            self.invalidate(*keys)
+            raise
+            # self.cmd_result.emit('Not connected to delay stage.')
+        self._mark(*keys)
+        for key, resp in zip(keys, replies):
+            self._cond_vars[key] = resp[3:]
+        return replies[len(keys):]
+
+    def _interval(self, key: str):
+        """! Refresh interval for a parameter, shortened for the position and
+        state while the stage is moving.
+        @param key (str) The parameter.
+        @return (float) Interval in seconds, or None to refresh only after
+        invalidation.
+        """
+        if key in ('pos', 'op_state') and self._cond_vars['op_state'] == 'MOVING.':
+            return self.moving_refresh
+        return super()._interval(key)
 
     # Motion and parameter setting
     ############################################################################
-    def _move_relative(self, val):
-        """! Move the stage to a new absolute position.
-        First calculates the time required to move to the new position. This
-        time is used to block communication until the move is completed.
+    def move_relative(self, val: float) -> Motion:
+        """! Start a relative move from any thread and return immediately.
         @param val (float) The relative motion to make.
+        @return (Motion) Completes with the final position once the stage
+        reports it is no longer moving. Cancelling it stops the stage.
         """
-        try:
-            newpos = float(self._cond_vars['pos']) + val
-            if newpos < -100 or newpos > 100:
-                raise ValueError('Trying to move beyond the limits of the stage.')
-            # Query the device to determine how long the relative move will take.
-            self.write(f'1PT{abs(val):.4f}', self.comtime)
-            t = float(self.read()[3:])
-
-            # Move to the new position, using the time calculated above as the amount
-            # of time to wait/block further communication.
-            self.write(f'1PR{val:.4f}', t + self.comtime)
-            # self.cmd_result = self.read()
-            self.cmd_result.emit(self.read())
-
-            # Perform error checking
-            self.check_errors()
-
-            # Double check the position by querying the delay stage again.
-            # Update the _cond_vars dictionary appropriately.
-            self.write('1TP?', self.comtime)
-            self._cond_vars['pos'] = self.read()[3:]
-        except PortNotOpenError as err:
-            self.log('Not connected to delay stage.')
-            self.cmd_result.emit('Not connected to delay stage.')
+        motion = Motion()
+        self.submit(self._move_relative, val, motion)
+        return motion
 
-        except Exception as err:
-            self.log('Not connected to delay stage.')
-            # self.cmd_result = 'Delay stage not moved. {}'.format(str(err))
-            self.cmd_result.emit(f'Delay stage not moved. {str(err)}')
+    def move_absolute(self, val: float) -> Motion:
+        """! Start a move to an absolute position from any thread and return
+        immediately.
+        @param val (float) The absolute position to move the delay stage to.
+        @return (Motion) Completes with the final position once the stage
+        reports it is no longer moving. Cancelling it stops the stage.
+        """
+        motion = Motion()
+        self.submit(self._move_absolute, val, motion)
+        return motion
 
-    def _move_absolute(self, val):
-        """! Move the stage to a new absolute position.
-        Makes use of the _move_relative method because obtaining an estimate
-        of the time required to make the movement requires calculating the
-        relative position difference.
+    def stop(self) -> Future:
+        """! Stop any motion in progress, ahead of other queued commands.
+        @return (Future) Completes once the stop command has been sent.
+        """
+        return self.submit(self._stop_motion, priority=self.USER)
+
+    def move_time(self, dist: float) -> float:
+        """! Predict the duration of a move from the trapezoidal velocity
+        profile, using the cached velocity and acceleration. Replaces asking
+        the controller with 1PT, saving a round trip per move. Velocity and
+        acceleration are only read from the stage after they were changed.
+        Runs on the I/O worker.
+        @param dist (float) The distance of the move in mm.
+        @return (float) Predicted time in seconds until the stage is READY.
+        """
+        return self._time_scale*self._profile_time(dist) + self._time_offset
+
+    def velocity(self) -> float:
+        """! The stage velocity, read from the stage only if the cached value
+        is stale. Runs on the I/O worker.
+        @return (float) Velocity in mm/s.
+        """
+        keys = self._due(['vel'])
+        if keys:
+            self._read_current_conditions(keys)
+        return float(self._cond_vars['vel'])
+
+    def positions_at(self, motion: Motion, times, clip: bool = False) -> np.ndarray:
+        """! Reconstruct the stage position at each of an array of times during
+        a move from its velocity profile, e.g. to assign positions to lock-in
+        samples recorded during a sweep. The profile's time axis is stretched
+        by the calibrated scale (see calibrate_motion).
+        @param motion (Motion) A move returned by move_relative or
+        move_absolute.
+        @param times (np.ndarray) Monotonic times in seconds.
+        @param clip (bool) If True, times before or after the move give the
+        start or end position instead of NaN. Default: False
+        @return (np.ndarray) Positions in mm, NaN for times outside the move.
+        @exception TypeError If motion is not a Motion.
+        @exception ValueError If the velocity or acceleration were unknown when
+        the move started.
+        """
+        if not isinstance(motion, Motion):
+            raise TypeError('Positions can only be reconstructed for a Motion.')
+        if motion.profile is None:
+            raise ValueError('Velocity profile of the move is unknown.')
+        origin, dist, vel, accel = motion.profile
+        elapsed = (np.asarray(times) - motion.started)/self._time_scale
+        pos = origin + profile_distances(dist, vel, accel, elapsed)
+        if clip:
+            return pos
+        moving = (elapsed >= 0) & (elapsed <= profile_time(dist, vel, accel))
+        return np.where(moving, pos, np.nan)
+
+    def calibrate_motion(self, distances=(0.01, 0.1, 1., 10.), repeats: int = 2):
+        """! Fit the scale and offset used by move_time to the measured
+        duration of real moves. Each distance is travelled back and forth
+        repeats times, checking the state back to back to time the moves.
+        Blocks until done, so must not be called from the I/O worker.
+        @param distances (tuple[float]) Move distances in mm.
+        @param repeats (int) Number of round trips for each distance.
+        @return (tuple[float]) The fitted scale and offset in seconds.
+        """
+        self._motion_times = []
+        self._calibrating = True
+        try:
+            for dist in distances:
+                for i in range(repeats):
+                    self.move_relative(dist).result()
+                    self.move_relative(-dist).result()
+        finally:
+            self._calibrating = False
+
+        model, measured = np.array(self._motion_times).T
+        if np.ptp(model) > 0:
+            scale, offset = np.polyfit(model, measured, 1)
+        else:
+            scale, offset = 1., np.mean(measured - model)
+        self._time_scale, self._time_offset = float(scale), float(offset)
+        self.log(f'Motion time calibrated. Scale: {scale:.4f}, offset: {offset:.4f} s')
+        return self._time_scale, self._time_offset
+
+    def _profile_time(self, dist: float) -> float:
+        """! Uncalibrated profile time of a move, reading the velocity and
+        acceleration first if their cached values are stale.
+        @param dist (float) The distance of the move in mm.
+        @return (float) Time in seconds.
+        """
+        keys = self._due(['vel', 'accel'])
+        if keys:
+            self._read_current_conditions(keys)
+        return profile_time(dist, float(self._cond_vars['vel']),
+                            float(self._cond_vars['accel']))
+
+    def _move_relative(self, val, motion=None) -> Motion:
+        """! Start a relative move. Runs on the I/O worker.
+        The move command is sent and the method returns immediately; completion
+        is detected by polling the controller state (1TS) at MOTION priority,
+        starting once the move is predicted to be finished (see move_time), so
+        other commands and status queries can run during the move.
+        @param val (float) The relative motion to make.
+        @param motion (Motion) Future to complete when the move finishes. A new
+        one is created if not provided. If it was cancelled before the worker
+        got to it, nothing is sent.
+        @return (Motion) The motion future.
+        """
+        if motion is None:
+            motion = Motion()
+        if not motion.set_running_or_notify_cancel():
+            return motion
+        self._start_relative(val, motion)
+        return motion
+
+    def _move_absolute(self, val, motion=None) -> Motion:
+        """! Start a move to an absolute position. Runs on the I/O worker.
+        Calculates the relative position difference from the current position
+        and starts a relative move, as _move_relative.
         @param val (float) The absolute position to move the delay stage to.
+        @param motion (Motion) Future to complete when the move finishes. A new
+        one is created if not provided. If it was cancelled before the worker
+        got to it, nothing is sent.
+        @return (Motion) The motion future.
         """
+        if motion is None:
+            motion = Motion()
+        if not motion.set_running_or_notify_cancel():
+            return motion
         try:
             if val < -100. or val > 100.:
                 raise ValueError('Position must be between -100 and 100.')
             # Calculate the relative move between the current position and the
             # desired position.
             rel_mov = val - float(self._cond_vars['pos'])
-            self._move_relative(rel_mov)
-        except PortNotOpenError as err:
-            self.log('Not connected to delay stage.')
-            self.cmd_result.emit('Not connected to delay stage.')
+            self._start_relative(rel_mov, motion)
 
         except Exception as err:
-            self.log('Not connected to delay stage.')
             # self.cmd_result = 'Delay stage not moved. {}.'.format(str(err))
             self.cmd_result.emit(f'Delay stage not moved. {str(err)}.')
+            self._fail_motion(motion, err)
+        return motion
+
+    def _start_relative(self, val, motion: Motion):
+        """! Check the limits and start a relative move for a running motion
+        future, failing it on error.
+        @param val (float) The relative motion to make.
+        @param motion (Motion) Future to complete when the move finishes.
+        """
+        try:
+            newpos = float(self._cond_vars['pos']) + val
+            if newpos < -100 or newpos > 100:
+                raise ValueError('Trying to move beyond the limits of the stage.')
+            self._begin_motion(f'1PR{val:.4f}', val, motion)
+
+        except PortNotOpenError as err:
+            self.log('Not connected to delay stage.', 'WARNING')
+            self.cmd_result.emit('Not connected to delay stage.')
+            self._fail_motion(motion, err)
+
+        except Exception as err:
+            # self.cmd_result = 'Delay stage not moved. {}'.format(str(err))
+            self.cmd_result.emit(f'Delay stage not moved. {str(err)}')
+            self._fail_motion(motion, err)
+
+    @staticmethod
+    def _fail_motion(motion: Motion, err: Exception):
+        """! Fail a move which could not be started, unless it was cancelled
+        meanwhile.
+        @param motion (Motion) The move.
+        @param err (Exception) The error.
+        """
+        if not motion.done():
+            motion.set_exception(err)
+
+    def _begin_motion(self, cmd: str, dist: float, motion: Motion):
+        """! Send a motion command and start polling for its completion. The
+        command error is read straight after the command, so a rejected move
+        fails at once. The first completion check is made once the move is
+        predicted to be finished.
+        @param cmd (str) The motion command, e.g. '1PR0.5000'.
+        @param dist (float) The distance of the move in mm.
+        @param motion (Motion) Future to complete when the move finishes.
+        @exception CommandError If a previous move has not yet finished, or
+        the controller rejected the command, e.g. out of travel or not homed.
+        """
+        if self._motion is not None:
+            raise CommandError('M')
+        delay = 0. if self._calibrating else self.motion_poll
+        try:
+            self._motion_model = self._profile_time(dist)
+            motion.profile = (float(self._cond_vars['pos']), dist,
+                              float(self._cond_vars['vel']),
+                              float(self._cond_vars['accel']))
+            if self.predict_motion and not self._calibrating:
+                delay = max(delay, self.move_time(dist))
+        except (ValueError, ReplyTimeoutError):
+            # Velocity or acceleration unknown. Poll from the start.
+            pass
+        if motion.cancelled():
+            # Cancelled while the profile was read
+            return
+        with self._lock:
+            # The motion command has no reply: its error is read in the same
+            # transaction, before a status query can read and clear it
+            self.write(cmd)
+            err = self.query('1TE')
+        self._parse_cmd_error(err)
+        if err[3:] != '@':
+            raise CommandError(err[3:])
+        self._motion = motion
+        self._motion_start = self._motion_checked = time.monotonic()
+        motion.started = self._motion_start
+        self._cond_vars['op_state'] = 'MOVING.'
+        self._emit_changes()
+        self.schedule(delay, self._check_motion)
+
+    def _check_motion(self):
+        """! Poll the position, state and last command error of a move in
+        progress. Publishes the intermediate position and reschedules itself
+        until the stage leaves the MOVING state. Runs at MOTION priority.
+        """
+        motion = self._motion
+        if motion is None:
+            return
+        if motion.cancelled() and not self._stop_sent:
+            self.write('1ST')
+            self._stop_sent = True
+        try:
+            checked = time.monotonic()
+            err, pos, resp = self.query_many(['1TE', '1TP?', '1TS'])
+            self._cond_vars['pos'] = pos[3:]
+            self._mark('pos', 'op_state')
+            self._parse_cmd_error(err)
+            if err[3:] != '@':
+                raise CommandError(err[3:])
+            self._parse_state(resp)
+            self._emit_changes()
+        except Exception as err:
+            self._finish_motion(exception=err)
+            return
+
+        if resp[7:9] == '28':
+            self._motion_checked = checked
+            # Moves are timed by checking back to back while calibrating
+            self.schedule(0. if self._calibrating else self.motion_poll,
+                          self._check_motion)
+        else:
+            if self._calibrating and not motion.done():
+                # The move ended between the last two checks
+                elapsed = (self._motion_checked + checked)/2 - self._motion_start
+                self._motion_times.append((self._motion_model, elapsed))
+            self._finish_motion(result=float(self._cond_vars['pos']))
+
+    def _finish_motion(self, result=None, exception=None):
+        """! Complete the future of the move in progress.
+        @param result (float) The final position.
+        @param exception (Exception) The error which ended the move, if any.
+        """
+        motion = self._motion
+        self._motion = None
+        self._stop_sent = False
+        self._emit_changes()
+        if motion.done():
+            # Cancelled by the caller; the stage has now stopped
+            return
+        if exception is not None:
+            self.cmd_result.emit(f'Delay stage move failed. {str(exception)}')
+            motion.set_exception(exception)
+        else:
+            motion.set_result(result)
+
+    def _stop_motion(self):
+        """! Send the stop command and cancel the move in progress. Runs on the
+        I/O worker. Polling continues until the stage reports it has stopped.
+        """
+        self.write('1ST')
+        if self._motion is not None:
+            self._stop_sent = True
+            self._motion.cancel()
+        return 'Stopping delay stage.'
+
+    def _report_motion(self, motion: Motion):
+        """! Log the outcome of a move started from the GUI."""
+        if motion.cancelled():
+            self.log('Move stopped.')
+        elif motion.exception() is None:
+            self.log(f'Move complete. Position: {motion.result()}')
+        else:
+            self.log(f'Move failed: {motion.exception()}', 'ERROR')
 
     def parse_cmd(self, param, val):
+        """! Perform the action requested by the GUI. Moves return as soon as
+        they have started; their completion is logged.
+        @param param (str) The parameter to change or motion to make.
+        @param val The requested value.
+        @return (str) A message describing the result, if any.
+        """
         try:
             if param == 'abs_move':
-                self._move_absolute(float(val))
+                motion = self._move_absolute(float(val))
             elif param == 'rel_move_neg':
-                self._move_relative(-1*float(val))
+                motion = self._move_relative(-1*float(val))
             elif param == 'rel_move_pos':
-                self._move_relative(float(val))
+                motion = self._move_relative(float(val))
+            elif param == 'stop':
+                return self._stop_motion()
             elif param == 'vel':
                 self.write(f'{self.cmds["vel"]}{val}', self.comtime)
+                return
             elif param == 'accel':
                 self.write(f'{self.cmds["accel"]}{val}', self.comtime)
+                return
+            else:
+                return
+
+            motion.add_done_callback(self._report_motion)
+            if not motion.done():
+                return 'Moving delay stage.'
 
         except PortNotOpenError as err:
-            self.log('Not connected to delay stage.')
+            self.log('Not connected to delay stage.', 'WARNING')
             self.cmd_result.emit('Not connected to delay stage.')
+            return 'Not connected to delay stage.'
+        finally:
+            self.invalidate(*self.invalidates.get(param, ()))
 
     # On application close
     ############################################################################
@@ -4,6 +4,11 @@
 
 from PyQt5.QtCore import QObject
 from PyQt5.QtCore import pyqtSignal as Signal
+from concurrent.futures import Future
+import collections
+import itertools
+import queue
+import threading
 import time
 
 class Device(QObject):
@@ -11,7 +16,48 @@ class Device(QObject):
 
     Provides basic interface for interacting with device parameters, logging,
     and using Qt Signals and Slots.
+
+    All communication with the physical device is meant to go through submit,
+    which runs the call on the device's single I/O worker thread. Calls are
+    ordered by priority (USER before MOTION before STATUS) and then in the
+    order they were submitted, so status polling never interleaves with a
+    user command on the same port.
     """
+    ## @var USER
+    # (int) Queue priority for commands issued by the user. Lowest value runs
+    # first.
+    USER = 0
+
+    ## @var MOTION
+    # (int) Queue priority for checks on the completion of motion.
+    MOTION = 1
+
+    ## @var STATUS
+    # (int) Queue priority for background status queries.
+    STATUS = 2
+
+    ## @var refresh
+    # (dict[str]:float) Refresh interval in seconds for each parameter in
+    # _cond_vars. Between refreshes the cached value is kept. None means the
+    # parameter is only re-read after being invalidated, e.g. by a write.
+    # Devices without any entries are queried as a whole every
+    # poll_interval.
+    refresh = {}
+
+    ## @var invalidates
+    # (dict[str]:tuple[str]) The parameters in _cond_vars whose cached values
+    # are made stale by each parse_cmd parameter.
+    invalidates = {}
+
+    ## @var poll_interval
+    # (float) Time in seconds between status queries for devices which do not
+    # declare per-parameter refresh intervals.
+    poll_interval = 0.5
+
+    ## @var log_length
+    # (int) Number of device specific log records kept.
+    log_length = 1000
+
     ## @var cmd_result
     # (Signal) For relaying device parameters and values.
     state = Signal(object, object)
@@ -20,6 +66,11 @@ class Device(QObject):
     # (Signal) Last message read back from the device. Used to report results.
     cmd_result = Signal(str)
 
+    ## @var log_record
+    # (Signal) Emitted with each device log record: message, device name,
+    # level and time in seconds since the epoch, e.g. for the result file.
+    log_record = Signal(str, str, str, float)
+
     def __init__(self, name='Device'):
         """! The SerialDevice base class initializer."""
         super().__init__()
@@ -41,38 +92,136 @@ class Device(QObject):
         self._comtime: float = 0.1
 
         ## @var _logs
-        # (str) Device specific logging
-        self._logs: str = ''
+        # (deque) Device specific log records, (timestamp, level, message).
+        # Only the most recent log_length are kept.
+        self._logs: collections.deque = collections.deque(maxlen=self.log_length)
+
+        ## @var _stamps
+        # (dict[str]:float) Monotonic time each parameter was last read.
+        # Parameters without an entry are stale.
+        self._stamps: dict = {}
+
+        ## @var _last_query
+        # (float) Monotonic time of the last status query.
+        self._last_query: float = 0.
+
+        ## @var _versions
+        # (dict[str]:int) Incremented each time a parameter's value changes.
+        self._versions: dict = {}
+
+        ## @var _sent
+        # (dict[str]) The value of each parameter when it was last emitted.
+        self._sent: dict = {}
+
+        ## @var _queue
+        # (PriorityQueue) Pending calls for the I/O worker. Entries are
+        # (priority, sequence, function, args, future).
+        self._queue = queue.PriorityQueue()
+
+        ## @var _sequence
+        # Counter to keep calls of equal priority in submission order.
+        self._sequence = itertools.count()
+
+        ## @var _worker
+        # (Thread) The single thread which performs all I/O for the device.
+        self._worker = threading.Thread(target=self._run, daemon=True,
+                                        name=f'{name} I/O')
+        self._worker.start()
+
+    # I/O worker and command queue
+    ############################################################################
+    def submit(self, func, *args, priority: int = USER) -> Future:
+        """! Queue a call to be run on the device's I/O worker thread.
+        @param func The callable to run, typically a method of this device.
+        @param args Positional arguments passed to func.
+        @param priority (int) One of USER, MOTION or STATUS. Default: USER
+        @return (Future) Completes with the return value of func, or the
+        exception it raised.
+        """
+        future = Future()
+        self._queue.put((priority, next(self._sequence), func, args, future))
+        return future
+
+    def schedule(self, delay: float, func, *args, priority: int = MOTION) -> Future:
+        """! Queue a call on the I/O worker after a delay, without blocking the
+        worker in the meantime. Used for periodic checks such as motion
+        completion.
+        @param delay (float) Time in seconds before the call is queued.
+        @param func The callable to run.
+        @param args Positional arguments passed to func.
+        @param priority (int) One of USER, MOTION or STATUS. Default: MOTION
+        @return (Future) Completes with the return value of func.
+        """
+        future = Future()
+        timer = threading.Timer(delay, lambda: self._queue.put(
+                                (priority, next(self._sequence), func, args, future)))
+        timer.daemon = True
+        timer.start()
+        return future
+
+    def shutdown(self):
+        """! Stop the I/O worker once every call already queued has run."""
+        self._queue.put((self.STATUS + 1, next(self._sequence), None, (), None))
+
+    def _run(self):
+        """! I/O worker loop. Runs queued calls one at a time, highest priority
+        first, until shutdown is called.
+        """
+        while True:
+            priority, _, func, args, future = self._queue.get()
+            if func is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except Exception as err:
+                future.set_exception(err)
 
     # Connecting and communicating
     ############################################################################
-    def open(self):
-        """! Open communication with the physical device."""
+    def open(self) -> str:
+        """! Open communication with the physical device.
+        @return (str) A message describing the result.
+        """
+        # Values cached before opening, e.g. by status polls which failed,
+        # are not the device's
+        self._stamps.clear()
         try:
             self._open()
             self._isconnected = True
-            self._logs += '{} Opened communication with {}\n'.format(self.current_time, self.name)
-            self.cmd_result.emit('Succesfully opened communication.')
+            self._record('Opened communication with {}'.format(self.name))
+            msg = 'Succesfully opened communication.'
 
         except Exception as err:
-            self._logs += '{} Unable to open communication with {}: {}'.format(self.current_time, self.name, str(err))
-            self.cmd_result.emit('Unable to open communication: {}'.format(str(err)))
+            self._record('Unable to open communication with {}: {}'.format(self.name, str(err)),
+                         'ERROR')
+            msg = 'Unable to open communication: {}'.format(str(err))
+
+        self.cmd_result.emit(msg)
+        return msg
 
-    def close(self):
-        """! Close communication for the physical device if needed"""
+    def close(self) -> str:
+        """! Close communication for the physical device if needed
+        @return (str) A message describing the result.
+        """
         if self._isconnected:
             try:
                 self._close()
                 self._isconnected = False
-                self._logs += '{} Closed communication with {}.\n'.format(self.current_time, self.name)
-                self.cmd_result.emit('Succesfully closed serial port.')
+                self._record('Closed communication with {}.'.format(self.name))
+                msg = 'Succesfully closed serial port.'
 
             except Exception as err:
-                self._logs += '{} Unable to close communication with {}: {}'.format(self.current_time, self.name, str(err))
-                self.cmd_result.emit('Unable to close serial port: {}'.format(str(err)))
+                self._record('Unable to close communication with {}: {}'.format(self.name, str(err)),
+                             'ERROR')
+                msg = 'Unable to close serial port: {}'.format(str(err))
+            self.cmd_result.emit(msg)
         else:
-            self._logs += '{} Cannot close communication with {}: not currently \
-                           connected.\n'.format(self.current_time, self.name)
+            self._record('Cannot close communication with {}: not currently '
+                         'connected.'.format(self.name), 'WARNING')
+            msg = 'Not currently connected.'
+        return msg
 
     def _open(self):
         """! Private function overwritten by subclasses for the actual device
@@ -121,7 +270,8 @@ class Device(QObject):
 
     def parse_cmd(self, param, val):
         """! This function is overwritten by subclasses to perform the actions
-        appropriately upon parsing messages from the GUI.
+        appropriately upon parsing messages from the GUI. It should be run
+        through submit, and may return a result message.
         """
         pass
 
@@ -131,20 +281,117 @@ class Device(QObject):
         The associated private method should be overloaded on a per device basis
         to account for differences in communication syntax. This method has no
         return value. Instead the associated private method updates the
-        internally managed state and then a signal is emitted with new parameter
-        value pairs.
+        internally managed state and then a signal is emitted with the parameter
+        value pairs which changed since the last emission.
         """
+        self._last_query = time.monotonic()
         self._query_state()
-        self.state.emit(self.name, self._cond_vars)
+        self._emit_changes()
         # print(self.name, self._cond_vars.keys(), self._cond_vars.values())
 
+    def _emit_changes(self):
+        """! Emit only the parameters whose values changed since they were
+        last emitted, bumping their versions. Nothing is emitted if no value
+        changed.
+        """
+        changed = {}
+        for key, val in list(self._cond_vars.items()):
+            if key not in self._sent or self._sent[key] != val:
+                self._versions[key] = self._versions.get(key, 0) + 1
+                self._sent[key] = val
+                changed[key] = val
+        if changed:
+            self.state.emit(self.name, changed)
+
+    def snapshot(self):
+        """! Emit every parameter regardless of whether it changed. Used to
+        populate a newly shown GUI panel.
+        """
+        self.state.emit(self.name, dict(self._cond_vars))
+
+    def version(self, key: str) -> int:
+        """! Number of times a parameter's emitted value has changed.
+        @param key (str) The parameter.
+        @return (int) The version, 0 if it has never been emitted.
+        """
+        return self._versions.get(key, 0)
+
     def _query_state(self):
+        """! Overwritten by subclasses to read the parameters returned by
+        _due, storing them with _mark so they are cached until their refresh
+        interval expires.
+        """
         pass
 
-    def log(self, msg: str):
-        """! Method to emit signal to log a device specific message.
+    # Polling schedule and parameter cache
+    ############################################################################
+    def is_due(self) -> bool:
+        """! Whether any parameter needs to be re-read.
+        @return (bool) True if query_state should be run.
+        """
+        if not self.refresh:
+            return time.monotonic() - self._last_query >= self.poll_interval
+        return len(self._due(self.refresh)) > 0
+
+    def _interval(self, key: str):
+        """! Refresh interval for a parameter. Overwritten by subclasses whose
+        intervals depend on the device state, e.g. faster polling while moving.
+        @param key (str) The parameter.
+        @return (float) Interval in seconds, or None to refresh only after
+        invalidation.
+        """
+        return self.refresh.get(key, 0.)
+
+    def _due(self, keys) -> list:
+        """! Select the parameters whose cached values have expired.
+        @param keys (iterable[str]) The parameters to consider.
+        @return (list[str]) The expired parameters, in the order given.
+        """
+        now = time.monotonic()
+        due = []
+        for key in keys:
+            stamp = self._stamps.get(key)
+            if stamp is None:
+                due.append(key)
+                continue
+            interval = self._interval(key)
+            if interval is not None and now - stamp >= interval:
+                due.append(key)
+        return due
+
+    def _mark(self, *keys):
+        """! Record that parameters were just read.
+        @param keys (str) The parameters read.
+        """
+        now = time.monotonic()
+        for key in keys:
+            self._stamps[key] = now
+
+    def invalidate(self, *keys):
+        """! Mark cached parameters as stale so the next status query reads
+        them.
+        @param keys (str) The parameters to invalidate.
+        """
+        for key in keys:
+            self._stamps.pop(key, None)
+
+    def _record(self, msg: str, level: str = 'INFO'):
+        """! Keep a device specific log record and emit it on log_record.
+        @param msg (str) The message.
+        @param level (str) Severity, e.g. 'INFO', 'WARNING' or 'ERROR'.
+        """
+        stamp = time.time()
+        self._logs.append((stamp, level, msg))
+        self.log_record.emit(msg, self.name, level, stamp)
+
+    def log(self, msg: str, level: str = 'INFO'):
+        """! Method to emit signal to log a device specific message. The
+        message is also recorded, see _record.
         @param msg (str) Message to be logged.
+        @param level (str) Severity, e.g. 'INFO', 'WARNING' or 'ERROR'.
+        Default: 'INFO'
         """
+        self._record(msg, level)
         self.state.emit(f'{self.name}+Logs', msg)
 
     @property
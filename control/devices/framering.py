@@ -0,0 +1,158 @@
+"""!
+@brief Definition of the FrameRing class, a fixed ring of preallocated image
+frames written by the DAQ thread and shared with display, storage and analysis
+without per-frame allocation.
+
+Classes:
+FrameRing
+"""
+
+import threading
+import numpy as np
+
+class FrameRing:
+    """! Fixed-size ring of preallocated frames.
+
+    The writer fills the next slot in place (write_slot), then publishes it
+    with its sequence number and timestamp (commit). Consumers are passed only
+    the slot index and sequence number, and get a read-only view of the frame
+    from frame(). Once the writer has come round the ring and reused a slot,
+    its previous frame is gone. frame() then returns None and counts an
+    overrun. A consumer holding a view while the writer reuses the slot can
+    check afterwards with valid() whether the frame was overwritten. That
+    case is counted as an overrun too.
+
+    Methods:
+    --------
+    write_slot() : Claim the next slot for writing.
+    commit(slot, sequence, timestamp) : Publish a written slot.
+    frame(slot, sequence) : Read-only view of a published frame.
+    valid(slot, sequence) : Whether a slot still holds a frame.
+    latest() : Slot and sequence number of the newest frame.
+    resize(shape) : Reallocate the frames with a new shape.
+    """
+    def __init__(self, slots: int = 8, shape: tuple = (512, 512), dtype=np.float64):
+        """! The FrameRing initializer.
+        @param slots (int) Number of frames held. Default: 8
+        @param shape (tuple[int]) Shape of each frame. Default: (512, 512)
+        @param dtype (np.dtype) Data type of the frames. Default: np.float64
+        """
+        ## @var slots
+        # (int) Number of frames held.
+        self.slots = slots
+
+        ## @var overruns
+        # (int) Frames overwritten before a consumer read them, or while it
+        # was reading them.
+        self.overruns = 0
+
+        ## @var _lock
+        # (Lock) Guards the slot metadata.
+        self._lock = threading.Lock()
+
+        ## @var _next
+        # (int) Count of slots claimed; the next slot is _next % slots.
+        self._next = 0
+
+        ## @var _latest
+        # (int) The most recently committed slot, or None.
+        self._latest = None
+        self.resize(shape, dtype)
+
+    def resize(self, shape: tuple, dtype=None):
+        """! Reallocate the frames, discarding all held frames. Only to be
+        called while nothing is being written.
+        @param shape (tuple[int]) Shape of each frame.
+        @param dtype (np.dtype) Data type of the frames. Default: unchanged.
+        """
+        dtype = self._frames.dtype if dtype is None else dtype
+        with self._lock:
+            ## @var _frames
+            # (np.ndarray) The frames, slots x shape.
+            self._frames = np.zeros((self.slots, *shape), dtype=dtype)
+
+            ## @var _sequence
+            # (np.ndarray) Sequence number of the frame in each slot, -1 while
+            # empty or being written.
+            self._sequence = np.full(self.slots, -1, dtype=np.int64)
+
+            ## @var _timestamp
+            # (np.ndarray) Timestamp of the frame in each slot.
+            self._timestamp = np.zeros(self.slots)
+            self._next = 0
+            self._latest = None
+
+    @property
+    def shape(self) -> tuple:
+        return self._frames.shape[1:]
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._frames.dtype
+
+    # Writer
+    ############################################################################
+    def write_slot(self) -> tuple:
+        """! Claim the next slot for writing. Its previous frame is discarded.
+        @return (tuple) The slot index and a writable view of its frame.
+        """
+        with self._lock:
+            slot = self._next % self.slots
+            self._next += 1
+            self._sequence[slot] = -1
+            if self._latest == slot:
+                self._latest = None
+        return slot, self._frames[slot, ...]
+
+    def commit(self, slot: int, sequence: int, timestamp: float = 0.):
+        """! Publish a slot once its frame has been written.
+        @param slot (int) The slot index from write_slot.
+        @param sequence (int) Sequence number of the frame.
+        @param timestamp (float) Timestamp of the frame. Default: 0
+        """
+        with self._lock:
+            self._timestamp[slot] = timestamp
+            self._sequence[slot] = sequence
+            self._latest = slot
+
+    # Consumers
+    ############################################################################
+    def frame(self, slot: int, sequence: int) -> np.ndarray:
+        """! A read-only view of a published frame, without copying.
+        @param slot (int) The slot index.
+        @param sequence (int) The sequence number of the frame expected.
+        @return (np.ndarray) The frame, or None if the slot has since been
+        reused (counted as an overrun).
+        """
+        if not self.valid(slot, sequence):
+            return None
+        view = self._frames[slot, ...].view()
+        view.flags.writeable = False
+        return view
+
+    def timestamp(self, slot: int) -> float:
+        """! Timestamp of the frame in a slot."""
+        return float(self._timestamp[slot])
+
+    def valid(self, slot: int, sequence: int) -> bool:
+        """! Check whether a slot still holds a frame, e.g. after using a view
+        of it. A frame no longer held is counted as an overrun.
+        @param slot (int) The slot index.
+        @param sequence (int) The sequence number of the frame.
+        @return (bool) True if the frame has not been overwritten.
+        """
+        with self._lock:
+            if self._sequence[slot] == sequence:
+                return True
+            self.overruns += 1
+            return False
+
+    def latest(self) -> tuple:
+        """! The newest published frame.
+        @return (tuple[int]) Its slot index and sequence number, or None if no
+        frame is held.
+        """
+        with self._lock:
+            if self._latest is None:
+                return None
+            return self._latest, int(self._sequence[self._latest])
@@ -3,12 +3,41 @@
 femtosecond laser.
 
 Classes:
+Tuning
 Insight
 """
 
-from .serialdevice import SerialDevice
+from .serialdevice import SerialDevice, ReplyTimeoutError
+from .tuningtable import TuningTable
 from serial.serialutil import PortNotOpenError
 from PyQt5.QtCore import pyqtSignal as Signal
+from concurrent.futures import Future
+import time
+
+# Tuning
+################################################################################
+
+class Tuning(Future):
+    """! Future of an OPO tuning, returned by Insight.tune. Completes with the
+    reported wavelength once the OPO has reached it and the DSM position has
+    settled. Cancelled if superseded by a later tuning.
+    """
+    def __init__(self):
+        """! Tuning class initializer."""
+        super().__init__()
+
+        ## @var target
+        # (float) The requested wavelength in nm, or None until sent.
+        self.target = None
+
+        ## @var predicted
+        # (float) Predicted tuning time in seconds from the tuning table, or
+        # None until sent.
+        self.predicted = None
+
+
+# Insight
+################################################################################
 
 class Insight(SerialDevice):
     """! The Insight class for controlling the SpectraPhysics Insight DS+ femtosecond laser/OPO.
@@ -17,6 +46,9 @@ class Insight(SerialDevice):
 
     Methods:
     --------
+    tune(wl) : Tune the OPO, returning a future completed once settled.
+    tuning_time(wl) : Predicted time to tune to a wavelength.
+    dsm_range(wl) : Learned DSM position and limits at a wavelength.
 
     Properties:
     -----------
@@ -39,6 +71,87 @@ class Insight(SerialDevice):
              'opo_wl': 'WAVelength', # OPO wavelength
              'align' : 'MODE'
            }
+    ## @var refresh
+    # (dict[str]:float) Refresh interval in seconds for each parameter. op_state
+    # covers the *STB? status word, which also reports the shutters and errors
+    # and is used as a change detector: parameters which follow the laser state
+    # are re-read when it changes (see status_invalidates), so they are
+    # otherwise only read on a slow schedule, in case they are changed from
+    # the front panel. Diode and humidity sensors are read on their own slow
+    # schedules; the DSM range only changes with the wavelength, so is only
+    # re-read after tuning.
+    refresh = {
+                'd1_curr': 30.,
+                'd1_hrs': 600.,
+                'd1_temp': 30.,
+                'd2_curr': 30.,
+                'd2_hrs': 600.,
+                'd2_temp': 30.,
+                'humidity': 60.,
+                'dsm_max': None,
+                'dsm_min': None,
+                'dsm_pos': 30.,
+                'fixed_shutter': None,
+                'main_shutter': None,
+                'opo_wl': 30.,
+                'align': None,
+                'op_state': 0.5
+              }
+
+    ## @var history_bits
+    # (int) *STB? warning (0x4000) and fault (0x8000) bits. The history buffer
+    # is only read when these change.
+    history_bits = 0x0000C000
+
+    ## @var status_invalidates
+    # (tuple[str]) Parameters made stale by a change of the operating state
+    # (*STB? bits 16 and up) or emission (bit 0).
+    status_invalidates = ('d1_curr', 'd2_curr', 'align')
+
+    ## @var wl_range
+    # (tuple[float]) Tuning range of the OPO in nm.
+    wl_range = (680., 1300.)
+
+    ## @var tune_poll
+    # (float) Time in seconds between settling checks while tuning.
+    tune_poll = 0.1
+
+    ## @var tune_tolerance
+    # (float) Largest difference in nm between the reported and requested
+    # wavelength for the OPO to count as tuned. The wavelength is reported to
+    # the nearest nm.
+    tune_tolerance = 1.
+
+    ## @var dsm_tolerance
+    # (float) Largest change of the DSM position between checks for it to
+    # count as settled.
+    dsm_tolerance = 0.002
+
+    ## @var tune_stable
+    # (int) Number of consecutive checks which must read the same DSM position
+    # for tuning to be complete.
+    tune_stable = 2
+
+    ## @var tune_early
+    # (float) Fraction of the predicted tuning time to wait before the first
+    # settling check. Checking well before the prediction keeps pessimistic
+    # predictions from inflating the times learned.
+    tune_early = 0.5
+
+    ## @var tune_timeout
+    # (float) Time in seconds after which a tuning which has not settled fails.
+    tune_timeout = 60.
+
+    ## @var invalidates
+    # (dict[str]:tuple[str]) Parameters made stale by each parse_cmd command.
+    invalidates = {
+                    'op_state': ('op_state', 'd1_curr', 'd2_curr'),
+                    'main_shutter': ('main_shutter', 'op_state'),
+                    'fixed_shutter': ('fixed_shutter', 'op_state'),
+                    'opo_wl': ('opo_wl', 'dsm_pos', 'dsm_min', 'dsm_max'),
+                    'align': ('align', 'op_state')
+                  }
+
     # insight_on: 'ON'
     # insight_off: 'OFF'
     # align_mode: 'ALIGN'
@@ -99,7 +212,41 @@ class Insight(SerialDevice):
         self._cond_vars['main_shutter'] = 0
         self._cond_vars['fixed_shutter'] = 0
         self._cond_vars['op_state'] = 'Ready to turn on'
-        self._first_check = True
+
+        ## @var _status
+        # (int) The last *STB? status word read, or None to treat the next
+        # one as changed.
+        self._status = None
+
+        ## @var tuning
+        # (TuningTable) Learned tuning times and DSM ranges, loaded from and
+        # saved to the configuration folder.
+        self.tuning = TuningTable()
+
+        ## @var _tuning
+        # (Tuning) The tuning in progress, or None when idle.
+        self._tuning = None
+
+        ## @var _tune_step
+        # (float) Size in nm of the tuning in progress.
+        self._tune_step = 0.
+
+        ## @var _tune_start
+        # (float) Monotonic time the tuning in progress was started.
+        self._tune_start = 0.
+
+        ## @var _dsm_last
+        # (float) DSM position at the previous settling check.
+        self._dsm_last = None
+
+        ## @var _dsm_since
+        # (float) Monotonic time the DSM position was first read at its
+        # current value.
+        self._dsm_since = 0.
+
+        ## @var _dsm_count
+        # (int) Consecutive settling checks with the DSM position unchanged.
+        self._dsm_count = 0
         # self.name = name
 
     # Error checking
@@ -111,23 +258,40 @@ class Insight(SerialDevice):
         """
         # self.write('{}'.format(self.cmds['align']), self.comtime)
         # self._cond_vars['align'] = self.read()
-        self._read_current_conditions()
+        # Only parameters whose cached values have expired are read
+        keys = self._due(self.cmds)
+        read_status = len(self._due(['op_state'])) > 0
+        extra = []
+        if read_status:
+            extra.append('*STB?')
+            self._mark('op_state')
         try:
-            self.write('*STB?', self.comtime)
-            resp = int(self.read())
+            # The status word is read in the same batch as the conditions
+            replies = self._read_current_conditions(keys, *extra)
+            if not read_status:
+                return
+            resp = int(replies[0])
+            if resp == self._status:
+                # Nothing reported by the status word has changed
+                return
+            changed = ~0 if self._status is None else resp ^ self._status
+            self._status = resp
 
             self._cond_vars['main_shutter'] = resp & 0x00000004
             self._cond_vars['fixed_shutter'] = resp & 0x00000008
 
             self._check_errors(resp)
             # self._cond_vars['history'] = self._read_history()
-            if self._first_check:
+            if changed & self.history_bits:
                 self._read_history()
-                self._first_check = False
+            if changed & ~0xFFFF or changed & 0x00000001:
+                # Re-read state dependent parameters on the next query
+                self.invalidate(*self.status_invalidates)
             self._cond_vars['op_state'] = self._parse_op_state((resp >> 16))
             # self._history = self._read_history()
             # self._op_state = self._parse_op_state((resp >> 16))
-        except PortNotOpenError:
+        except (PortNotOpenError, ReplyTimeoutError):
+            self._status = None
             self._cond_vars['main_shutter'] = 0
             self._cond_vars['fixed_shutter'] = 0
             self._cond_vars['op_state'] = 'Ready to turn on'
@@ -157,8 +321,7 @@ class Insight(SerialDevice):
         # Appendix B, where the codes are explained is correct:
         # 'READ:AHIS?'
         try:
-            self.write('READ:AHIS?', self.comtime)
-            codes = self.read().strip().split(' ')
+            codes = self.query('READ:AHIS?').split(' ')
             history = 'Read from history buffer.\n'
             for code in codes:
                 history += f'\t{code}: {self.fault_codes[code]}\n'
@@ -196,17 +359,173 @@ class Insight(SerialDevice):
             state = 'Reserved'
         return state
 
-    def _read_current_conditions(self):
-        for cmd in self.cmds:
+    def _read_current_conditions(self, keys, *extra) -> list:
+        """! Read parameters in cmds in a single batched transaction.
+        @param keys (list[str]) The parameters to read. Usually those whose
+        cached values have expired.
+        @param extra (str) Additional queries to append to the same batch.
+        @return (list[str]) The replies to the extra queries, in order.
+        """
+        if not keys and not extra:
+            return []
+        try:
+            replies = self.query_many([f'{self.cmds[key]}?' for key in keys]
+                                      + list(extra))
+        except (PortNotOpenError, ReplyTimeoutError):
+            for key in keys:
+                self._cond_vars[key] = '-'
+            # Read again once a reply arrives, including parameters only
+            # refreshed on invalidation
+            self.invalidate(*keys)
+            raise
+            # self.log('Not connected to Insight.')
+            # self.cmd_result.emit('Not connected to Insight.')
+        self._mark(*keys)
+        self._cond_vars.update(zip(keys, replies))
+        return replies[len(keys):]
+
+    # OPO tuning
+    ############################################################################
+    def tune(self, wl: float) -> Tuning:
+        """! Tune the OPO without blocking. A tuning in progress is superseded
+        and its future cancelled.
+        @param wl (float) The wavelength in nm.
+        @return (Tuning) Completes with the reported wavelength once the OPO
+        has reached it and the DSM position has settled.
+        """
+        tuning = Tuning()
+        self.submit(self._tune, wl, tuning)
+        return tuning
+
+    def tuning_time(self, wl: float) -> float:
+        """! Predict the time to tune to a wavelength from the cached current
+        wavelength, using the learned tuning table.
+        @param wl (float) The wavelength in nm.
+        @return (float) Time in seconds.
+        """
+        try:
+            return self.tuning.tuning_time(wl - float(self._cond_vars['opo_wl']))
+        except ValueError:
+            # Current wavelength unknown. Assume a step across the full range.
+            return self.tuning.tuning_time(self.wl_range[1] - self.wl_range[0])
+
+    def dsm_range(self, wl: float) -> tuple:
+        """! The DSM position and limits at a wavelength, from the tuning
+        table, without querying the laser.
+        @param wl (float) The wavelength in nm.
+        @return (tuple[float]) (min, pos, max), or None if unknown.
+        """
+        return self.tuning.dsm(wl)
+
+    def _tune(self, wl: float, tuning=None) -> Tuning:
+        """! Send a new wavelength and start checking for the OPO and DSM to
+        settle. Runs on the I/O worker. The first check is made partway through
+        the predicted tuning time (see tune_early).
+        @param wl (float) The wavelength in nm.
+        @param tuning (Tuning) Future to complete once settled. A new one is
+        created if not provided.
+        @return (Tuning) The tuning future.
+        """
+        if tuning is None:
+            tuning = Tuning()
+        try:
+            if not self.wl_range[0] <= wl <= self.wl_range[1]:
+                raise ValueError(f'Wavelength must be between {self.wl_range[0]:.0f} '
+                                 f'and {self.wl_range[1]:.0f} nm.')
             try:
-                self.write(f'{self.cmds[cmd]}?', self.comtime)
-                self._cond_vars[cmd] = self.read().strip()
-            except PortNotOpenError:
-                self._cond_vars[cmd] = '-'
-                # self.log('Not connected to Insight.')
-                # self.cmd_result.emit('Not connected to Insight.')
+                current = float(self._cond_vars['opo_wl'])
+            except ValueError:
+                self._read_current_conditions(['opo_wl'])
+                current = float(self._cond_vars['opo_wl'])
+            if self._tuning is not None:
+                self._tuning.cancel()
+            self.write(f'{self.cmds["opo_wl"]}{wl:.0f}')
+            self.invalidate(*self.invalidates['opo_wl'])
+            self._tuning = tuning
+            tuning.target = wl
+            self._tune_step = wl - current
+            self._tune_start = time.monotonic()
+            self._dsm_last = None
+            self._dsm_count = 0
+            tuning.predicted = self.tuning.tuning_time(self._tune_step)
+            self.schedule(max(self.tune_poll, self.tune_early*tuning.predicted),
+                          self._check_tuning, tuning)
+
+        except PortNotOpenError as err:
+            self.log('Not connected to Insight.', 'WARNING')
+            self.cmd_result.emit('Not connected to Insight.')
+            tuning.set_exception(err)
+
+        except Exception as err:
+            self.cmd_result.emit(f'Insight: OPO not tuned. {str(err)}')
+            tuning.set_exception(err)
+        return tuning
+
+    def _check_tuning(self, tuning: Tuning):
+        """! Read the wavelength and DSM position of a tuning in progress and
+        reschedule until the OPO is at the requested wavelength and the DSM
+        position has been read unchanged by tune_stable checks. The settled DSM
+        range and the time taken are then added to the tuning table.
+        Runs at MOTION priority.
+        @param tuning (Tuning) The tuning being checked. Superseded tunings
+        are dropped.
+        """
+        if tuning is not self._tuning:
+            return
+        try:
+            checked = time.monotonic()
+            wl, dsm = self.query_many([f'{self.cmds["opo_wl"]}?',
+                                       f'{self.cmds["dsm_pos"]}?'])
+            self._cond_vars['opo_wl'] = wl
+            self._cond_vars['dsm_pos'] = dsm
+            self._mark('opo_wl', 'dsm_pos')
+            self._emit_changes()
+            wl, dsm = float(wl), float(dsm)
+
+            if self._dsm_last is not None and abs(dsm - self._dsm_last) <= self.dsm_tolerance:
+                self._dsm_count += 1
+            else:
+                self._dsm_count = 0
+                self._dsm_since = checked
+            self._dsm_last = dsm
+
+            if abs(wl - tuning.target) > self.tune_tolerance or self._dsm_count < self.tune_stable - 1:
+                if checked - self._tune_start > self.tune_timeout:
+                    raise TimeoutError(f'OPO not settled after {self.tune_timeout:.0f} s.')
+                self.schedule(self.tune_poll, self._check_tuning, tuning)
+                return
+
+            self._read_current_conditions(['dsm_min', 'dsm_max'])
+            self.tuning.record_dsm(wl, self._cond_vars['dsm_min'], dsm,
+                                   self._cond_vars['dsm_max'])
+            self.tuning.record_tuning(self._tune_step, self._dsm_since - self._tune_start)
+            self.tuning.save()
+        except Exception as err:
+            self._tuning = None
+            self.cmd_result.emit(f'Insight: OPO tuning failed. {str(err)}')
+            if not tuning.done():
+                tuning.set_exception(err)
+            return
+        self._tuning = None
+        self._emit_changes()
+        if not tuning.done():
+            tuning.set_result(wl)
+
+    def _report_tuning(self, tuning: Tuning):
+        """! Log the outcome of a tuning started from the GUI."""
+        if tuning.cancelled():
+            self.log('OPO tuning superseded.')
+        elif tuning.exception() is None:
+            self.log(f'OPO tuned to {tuning.result():.0f} nm.')
+        else:
+            self.log(f'OPO tuning failed: {tuning.exception()}', 'ERROR')
 
     def parse_cmd(self, param, val):
+        """! Perform the action requested by the GUI.
+        @param param (str) The parameter to change.
+        @param val The requested value.
+        @return (str) A message describing the result, if any.
+        """
         try:
             if param == 'op_state':
                 if val == 'RUN':
@@ -214,9 +533,11 @@ class Insight(SerialDevice):
                     if self._cond_vars['op_state'] == 'RUN':
                         self.write('OFF', self.comtime)
                         self.cmd_result.emit('Turning laser off.')
+                        return 'Turning laser off.'
                     else:
                         self.write('ON', self.comtime)
                         self.cmd_result.emit('Turning laser on.')
+                        return 'Turning laser on.'
             elif param == 'main_shutter':
                 if self._cond_vars['main_shutter']:
                     self.write(f'{self.cmds["main_shutter"]} 0', self.comtime)
@@ -228,15 +549,22 @@ class Insight(SerialDevice):
                 else:
                     self.write(f'{self.cmds["fixed_shutter"]} 1', self.comtime)
             elif param == 'opo_wl':
-                self.write(f'{self.cmds["opo_wl"]}{val}', self.comtime)
+                # Tuning returns once started; completion is logged
+                tuning = self._tune(float(val))
+                tuning.add_done_callback(self._report_tuning)
+                if not tuning.done():
+                    return 'Tuning OPO.'
             elif param == 'align':
                 if self._cond_vars['align'] == 'RUN':
                     self.write(f'{self.cmds["align"]} ALIGN', self.comtime)
                 else:
                     self.write(f'{self.cmds["align"]} RUN', self.comtime)
         except PortNotOpenError as err:
-            self.log('Not connected to Insight.')
+            self.log('Not connected to Insight.', 'WARNING')
             self.cmd_result.emit('Not connected to Insight.')
+            return 'Not connected to Insight.'
+        finally:
+            self.invalidate(*self.invalidates.get(param, ()))
     # @property
     # def cond_vars(self) -> dict:
     #     return self._cond_vars
@@ -0,0 +1,71 @@
+"""!
+@brief Trapezoidal velocity profile used by the Newport FCL200 (and other
+SMC100 family controllers) to plan point to point moves.
+
+Moves accelerate at a constant rate up to the set velocity, cruise, then
+decelerate at the same rate. Moves too short to reach the set velocity follow
+a triangular profile instead.
+
+Functions:
+profile_time
+profile_distance
+profile_distances
+"""
+
+import math
+import numpy as np
+
+def profile_time(dist: float, vel: float, accel: float) -> float:
+    """! Duration of a trapezoidal (or triangular, for short moves) move.
+    @param dist (float) Distance to travel in mm.
+    @param vel (float) Maximum velocity in mm/s.
+    @param accel (float) Acceleration in mm/s^2.
+    @return (float) Time in seconds.
+    """
+    dist = abs(dist)
+    if dist >= vel**2/accel:
+        return dist/vel + vel/accel
+    return 2*math.sqrt(dist/accel)
+
+def profile_distance(dist: float, vel: float, accel: float, t: float) -> float:
+    """! Distance travelled a time t into a trapezoidal move.
+    @param dist (float) Total distance of the move in mm.
+    @param vel (float) Maximum velocity in mm/s.
+    @param accel (float) Acceleration in mm/s^2.
+    @param t (float) Time since the start of the move in seconds.
+    @return (float) Distance travelled in mm, with the sign of dist.
+    """
+    sign = math.copysign(1., dist)
+    dist = abs(dist)
+    total = profile_time(dist, vel, accel)
+    if t >= total:
+        return sign*dist
+    peak = min(vel, math.sqrt(dist*accel))
+    t_acc = peak/accel
+    if t < t_acc:
+        return sign*0.5*accel*t**2
+    t_dec = total - t_acc
+    if t < t_dec:
+        return sign*(0.5*accel*t_acc**2 + peak*(t - t_acc))
+    return sign*(dist - 0.5*accel*(total - t)**2)
+
+def profile_distances(dist: float, vel: float, accel: float, t) -> np.ndarray:
+    """! Distance travelled at each of an array of times into a trapezoidal
+    move. Vectorized form of profile_distance, e.g. for reconstructing the
+    position of every lock-in sample during a sweep.
+    @param dist (float) Total distance of the move in mm.
+    @param vel (float) Maximum velocity in mm/s.
+    @param accel (float) Acceleration in mm/s^2.
+    @param t (np.ndarray) Times since the start of the move in seconds. Times
+    before the start are treated as 0.
+    @return (np.ndarray) Distance travelled in mm, with the sign of dist.
+    """
+    sign = math.copysign(1., dist)
+    dist = abs(dist)
+    total = profile_time(dist, vel, accel)
+    peak = min(vel, math.sqrt(dist*accel))
+    t_acc = peak/accel
+    t = np.clip(np.asarray(t, dtype=float), 0., total)
+    return sign*np.where(t < t_acc, 0.5*accel*t**2,
+                np.where(t < total - t_acc, 0.5*accel*t_acc**2 + peak*(t - t_acc),
+                         dist - 0.5*accel*(total - t)**2))
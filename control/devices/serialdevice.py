@@ -3,12 +3,15 @@
 
 Classes:
 SerialDevice
+ReplyTimeoutError
+ReplyCountError
 """
 
 from .device import Device
 from PyQt5.QtCore import QObject
 from PyQt5.QtCore import pyqtSignal as Signal
 from serial import Serial
+import threading
 import time
 
 class SerialDevice(Device):
@@ -28,7 +31,20 @@ class SerialDevice(Device):
     --------
     write(cmd, waittime) : Write a command to a serial device.
     read() : Read a response from a serial device.
+    query(cmd, timeout) : Write a command and return as soon as its reply
+                          line arrives.
+    query_many(cmds, timeout) : Send a group of queries in one transaction and
+                                return their replies in order.
     """
+    ## @var terminator
+    # (bytes) Line ending marking the end of a reply from the device.
+    terminator = b'\n'
+
+    ## @var scpi_join
+    # (bool) Whether the device accepts several queries joined by ';' on one
+    # line, answering with a single ';' separated reply line. Otherwise batched
+    # queries are pipelined as separate lines.
+    scpi_join = False
 
     def __init__(self, name: str = 'Serial Device'):
         """! The SerialDevice base class constructor."""
@@ -49,6 +65,22 @@ class SerialDevice(Device):
         # Baud rate for serial communication.
         self._baudrate: int = 115200
 
+        ## @var _timeout
+        # (float) Default deadline (in seconds) for a reply to a query to
+        # arrive. Replies normally arrive far sooner; query returns as soon as
+        # the terminator is read.
+        self._timeout: float = 1.0
+
+        ## @var _rxbuf
+        # (bytearray) Bytes read from the port which do not yet form a complete
+        # reply line.
+        self._rxbuf = bytearray()
+
+        ## @var _lock
+        # Serializes query transactions so a write and its reply are never
+        # interleaved with another thread's traffic on the same port.
+        self._lock = threading.RLock()
+
     # Connecting and communicating
     ############################################################################
     def _open(self):
@@ -61,15 +93,17 @@ class SerialDevice(Device):
         """! Private function which closes communication over a serial port."""
         self._sercom.close()
 
-    def write(self, cmd: str, waittime: float):
+    def write(self, cmd: str, waittime: float = 0.):
         """! Write a command to the serial device.
         @param cmd (str) The command to be written
         @param waittime (float) The time to wait after writing a command. Blocks
         communication, preventing writing multiple commands before the
-        device can respond.
+        device can respond. Only needed for commands which produce no reply;
+        use query for commands which do. Default: 0
         """
         self._sercom.write(bytes(f'{cmd}\n', encoding='utf8'))
-        time.sleep(waittime)
+        if waittime:
+            time.sleep(waittime)
 
     def read(self) -> str:
         """! Read back an answer from the serial device.
@@ -77,6 +111,84 @@ class SerialDevice(Device):
         """
         return self._sercom.readline().decode('ascii')
 
+    def query(self, cmd: str, timeout: float = None) -> str:
+        """! Write a command and wait for its reply line.
+        Unlike write followed by read, no fixed time is waited: the reply is
+        returned as soon as the terminator arrives.
+        @param cmd (str) The command to be written.
+        @param timeout (float) Deadline in seconds for the full reply to
+        arrive. Default: None (use the timeout property).
+        @return (str) The ASCII decoded reply with the line ending stripped.
+        """
+        with self._lock:
+            # Discard anything left over from an earlier reply which arrived
+            # after its deadline, so it is not mistaken for this reply.
+            self._sercom.reset_input_buffer()
+            self._rxbuf.clear()
+            self.write(cmd)
+            return self._read_reply(cmd, timeout)
+
+    def query_many(self, cmds: list, timeout: float = None) -> list:
+        """! Send a group of queries in a single transaction.
+        The queries are sent back to back (or as one joined line if scpi_join
+        is set) and the replies are read back in order, so the whole group
+        costs roughly one round trip instead of one per query.
+        @param cmds (list[str]) The queries to be written.
+        @param timeout (float) Deadline in seconds for each reply to arrive.
+        Default: None (use the timeout property).
+        @return (list[str]) The replies, in the same order as cmds.
+        @exception ReplyCountError If a joined query is answered with a
+        different number of replies.
+        """
+        with self._lock:
+            self._sercom.reset_input_buffer()
+            self._rxbuf.clear()
+            if self.scpi_join:
+                line = ';'.join(cmds)
+                self.write(line)
+                replies = self._read_reply(line, timeout).split(';')
+                if len(replies) != len(cmds):
+                    raise ReplyCountError(line, len(cmds), len(replies))
+                return [reply.strip() for reply in replies]
+
+            # A single write keeps the queries together on the wire
+            self._sercom.write(bytes(''.join(f'{cmd}\n' for cmd in cmds),
+                                     encoding='utf8'))
+            return [self._read_reply(cmd, timeout) for cmd in cmds]
+
+    def _read_reply(self, cmd: str, timeout: float = None) -> str:
+        """! Read from the port until a full reply line is available.
+        @param cmd (str) The command the reply belongs to. Used for reporting.
+        @param timeout (float) Deadline in seconds. Default: None (use the
+        timeout property).
+        @return (str) The ASCII decoded reply with the line ending stripped.
+        """
+        if timeout is None:
+            timeout = self._timeout
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                end = self._rxbuf.find(self.terminator)
+                if end >= 0:
+                    line = bytes(self._rxbuf[:end])
+                    del self._rxbuf[:end + len(self.terminator)]
+                    return line.decode('ascii').strip()
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ReplyTimeoutError(cmd, timeout)
+
+                # Block until at least one byte arrives, then take everything
+                # already waiting in the driver buffer.
+                self._sercom.timeout = remaining
+                self._rxbuf += self._sercom.read(1)
+                waiting = self._sercom.in_waiting
+                if waiting:
+                    self._rxbuf += self._sercom.read(waiting)
+        finally:
+            # Restore the non-blocking behaviour expected by read()
+            self._sercom.timeout = 0
+
     # Properties for setting values and retrieving results
     ############################################################################
     @property
@@ -95,6 +207,27 @@ class SerialDevice(Device):
         self._sercom.baudrate = val
         self.cmd_result.emit(f'Baud rate set to: {val}')
 
+    @property
+    def timeout(self) -> float:
+        """! Property for the default deadline for query replies.
+        @return _timeout (float) Deadline in seconds.
+        """
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, val: float):
+        """! Property setter for the default deadline for query replies.
+        @param val (float) Deadline in seconds.
+        """
+        try:
+            if type(val) != float:
+                raise TypeError('Reply timeout must be float.')
+            self._timeout = val
+            self.cmd_result.emit(f'Reply timeout set to: {val}')
+
+        except TypeError as err:
+            self.cmd_result.emit(f'Reply timeout not changed. {str(err)}')
+
     @property
     def comport(self) -> str:
         """! Property for the communication port.
@@ -111,10 +244,11 @@ class SerialDevice(Device):
             if type(val) != str:
                 raise TypeError('Communication port must be str.')
 
-            if val[:3] != 'COM':
-                if val[3] not in range(1, 9):
-                    raise ValueError('Communication port must be in format \'COMX\' \
-                                      where X is an integer.')
+            # Windows ports are of the form COMX; POSIX ports (including the
+            # pseudo-terminals used by the device simulators) are paths.
+            if not (val[:3] == 'COM' and val[3:].isdigit()) and val[:5] != '/dev/':
+                raise ValueError('Communication port must be in format \'COMX\' \
+                                  where X is an integer, or a /dev/ path.')
 
             self._comport = val
             self.cmd_result.emit(f'COM port set to: {val}')
@@ -139,3 +273,46 @@ class SerialDevice(Device):
     def exit(self):
         print('........Closing serial communication port.\n')
         self.close()
+
+
+# ReplyTimeoutError
+################################################################################
+
+class ReplyTimeoutError(Exception):
+    """! Exception class for a query whose reply did not arrive in time."""
+    def __init__(self, cmd, timeout):
+        """! ReplyTimeoutError class initializer.
+        @param cmd (str) The command which went unanswered.
+        @param timeout (float) The deadline which expired, in seconds.
+        """
+        self.msg = f'No reply to {cmd.strip()} within {timeout} s.'
+
+    def __str__(self):
+        """! String representation of the ReplyTimeoutError on print
+        @return (str) self.msg
+        """
+        return self.msg
+
+
+# ReplyCountError
+################################################################################
+
+class ReplyCountError(Exception):
+    """! Exception class for a joined query answered with the wrong number of
+    replies, e.g. because the device rejected one of the queries. Unlike a
+    timeout, sending the query again would not help.
+    """
+    def __init__(self, cmd, expected, received):
+        """! ReplyCountError class initializer.
+        @param cmd (str) The joined query.
+        @param expected (int) The number of queries joined.
+        @param received (int) The number of replies received.
+        """
+        self.msg = (f'{received} replies to {cmd.strip()}, expected '
+                    f'{expected}.')
+
+    def __str__(self):
+        """! String representation of the ReplyCountError on print
+        @return (str) self.msg
+        """
+        return self.msg
@@ -0,0 +1,188 @@
+"""!
+@brief Definition of the DelayStageSimulator class, a pseudo-terminal stand-in
+for the Newport FCL200 delay stage speaking the subset of its serial protocol
+used by the DelayStage class.
+
+Classes:
+DelayStageSimulator
+"""
+
+from .ptydevice import PtyDevice
+from ..motionprofile import profile_time, profile_distance, profile_distances
+import re
+import time
+
+class DelayStageSimulator(PtyDevice):
+    """! Simulated Newport FCL200.
+
+    Moves follow a trapezoidal velocity profile set by the current velocity
+    (VA) and acceleration (AC), followed by a settling time before the state
+    returns to READY. Replies echo the controller address and command, as the
+    real controller does, e.g. '1TP12.345600'.
+
+    Methods:
+    --------
+    set_positioner_error(index) : Flag a positioner error bit in TS replies.
+    """
+    ## @var terminator
+    # (bytes) The FCL200 terminates replies with carriage return, line feed.
+    terminator = b'\r\n'
+
+    ## @var _cmd_patn
+    # (str) Regex pattern splitting a command into address, two letter code,
+    # optional '?' and argument.
+    _cmd_patn = r'^(\d*)([A-Z]{2})(\??)(.*)$'
+
+    def __init__(self, latency: float = 0.002, link: float = 0.,
+                 vel: float = 50., accel: float = 200., settle: float = 0.005,
+                 position: float = 0., limits: tuple = (-100., 100.)):
+        """! The DelayStageSimulator initializer.
+        @param latency (float) Per-command processing time in seconds.
+        @param link (float) Per-burst transport delay in seconds.
+        @param vel (float) Initial velocity in mm/s. Default: 50
+        @param accel (float) Initial acceleration in mm/s^2. Default: 200
+        @param settle (float) Time in seconds after the profile ends before
+        the stage reports READY. Default: 0.005
+        @param position (float) Initial position in mm. Default: 0
+        @param limits (tuple[float]) Travel limits in mm. Default: (-100, 100)
+        """
+        super().__init__(latency, link)
+        self.vel = vel
+        self.accel = accel
+        self.settle = settle
+        self.limits = limits
+
+        self._from = position
+        self._to = position
+        self._move_start = 0.
+        self._move_vel = vel
+        self._move_accel = accel
+        self._moving = False
+        self._ready_state = '32'
+        self._cmd_err = '@'
+        self._pos_err = 0
+
+    # Fault injection
+    ############################################################################
+    def set_positioner_error(self, index: int):
+        """! Flag a positioner error in TS replies.
+        @param index (int) Index into PositionerError._pos_errors, counted
+        from the most significant bit.
+        """
+        self._pos_err |= 1 << (15 - index)
+
+    # Motion model
+    ############################################################################
+    ## @var profile_time
+    # Duration of a move. See motionprofile.profile_time.
+    profile_time = staticmethod(profile_time)
+
+    ## @var profile_distance
+    # Distance travelled into a move. See motionprofile.profile_distance.
+    profile_distance = staticmethod(profile_distance)
+
+    def _position(self) -> float:
+        """! Current position, completing the move if it has finished."""
+        if not self._moving:
+            return self._to
+        dist = self._to - self._from
+        elapsed = time.monotonic() - self._move_start
+        total = self.profile_time(dist, self._move_vel, self._move_accel)
+        if elapsed >= total + self.settle:
+            self._moving = False
+            return self._to
+        return self._from + self.profile_distance(dist, self._move_vel,
+                                                  self._move_accel, elapsed)
+
+    def position_at(self, t):
+        """! Position at each of an array of monotonic times during the current
+        (or last) move, e.g. to generate lock-in samples during a sweep.
+        @param t (np.ndarray) Monotonic times in seconds.
+        @return (np.ndarray) Positions in mm.
+        """
+        return self._from + profile_distances(self._to - self._from,
+                                              self._move_vel, self._move_accel,
+                                              t - self._move_start)
+
+    def _move_to(self, target: float, ready_state: str = '33'):
+        """! Start a move to an absolute position."""
+        if self._moving:
+            self._cmd_err = 'M'
+            return
+        if not self.limits[0] <= target <= self.limits[1]:
+            self._cmd_err = 'G'
+            return
+        self._from = self._position()
+        self._to = target
+        self._move_start = time.monotonic()
+        self._move_vel = self.vel
+        self._move_accel = self.accel
+        self._moving = True
+        self._ready_state = ready_state
+
+    def _stop(self):
+        """! Stop immediately at the current position."""
+        pos = self._position()
+        self._moving = False
+        self._from = self._to = pos
+
+    # Command handling
+    ############################################################################
+    def handle(self, line: str):
+        """! Answer one FCL200 command.
+        @param line (str) The command, e.g. '1PR0.5000'.
+        @return (str) The reply, or None for commands without a reply.
+        """
+        m = re.match(self._cmd_patn, line.upper())
+        if m is None:
+            self._cmd_err = 'A'
+            return None
+        addr, code, query, arg = m.groups()
+        addr = addr or '1'
+        prefix = f'{addr}{code}'
+        try:
+            value = float(arg) if arg else None
+        except ValueError:
+            self._cmd_err = 'C'
+            return None
+
+        if code == 'TP':
+            return f'{prefix}{self._position():.6f}'
+        elif code == 'TS':
+            pos = self._position()
+            state = '28' if self._moving else self._ready_state
+            return f'{prefix}{self._pos_err:04X}{state}'
+        elif code == 'TE':
+            err, self._cmd_err = self._cmd_err, '@'
+            return f'{prefix}{err}'
+        elif code in ('VA', 'AC'):
+            if query or value is None:
+                return f'{prefix}{self.vel if code == "VA" else self.accel:g}'
+            if value <= 0:
+                self._cmd_err = 'C'
+            elif code == 'VA':
+                self.vel = value
+            else:
+                self.accel = value
+        elif code == 'PT':
+            if value is None:
+                self._cmd_err = 'C'
+                return None
+            return f'{prefix}{self.profile_time(value, self.vel, self.accel):.6f}'
+        elif code == 'PR':
+            if value is None:
+                self._cmd_err = 'C'
+            else:
+                self._move_to(self._position() + value)
+        elif code == 'PA':
+            if value is None:
+                self._cmd_err = 'C'
+            else:
+                self._move_to(value)
+        elif code == 'ST':
+            self._stop()
+        elif code == 'OR':
+            self._move_to(0., ready_state='32')
+        else:
+            self._cmd_err = 'A'
+        return None
@@ -0,0 +1,204 @@
+"""!
+@brief Definition of the InsightSimulator class, a pseudo-terminal stand-in
+for the Insight DS+ femtosecond laser/OPO speaking the subset of its serial
+protocol used by the Insight class.
+
+Classes:
+InsightSimulator
+"""
+
+from .ptydevice import PtyDevice
+import time
+
+class InsightSimulator(PtyDevice):
+    """! Simulated Insight DS+.
+
+    Models the operational state (turn on/warm up, run, align), both shutters,
+    OPO tuning at a finite rate with the GVD compensation (DSM) following the
+    wavelength, diode and humidity readings, and the fault/warning history.
+
+    Methods:
+    --------
+    set_fault(code) : Record a history code and raise the warning/fault bit.
+    clear_faults() : Return to normal operation.
+    """
+    ## @var terminator
+    # (bytes) The Insight terminates replies with a line feed.
+    terminator = b'\n'
+
+    ## @var wl_range
+    # (tuple[float]) Tuning range of the OPO in nm.
+    wl_range = (680., 1300.)
+
+    def __init__(self, latency: float = 0.002, link: float = 0.,
+                 warmup: float = 2., tune_rate: float = 100.,
+                 tune_settle: float = 0.5, wavelength: float = 800.):
+        """! The InsightSimulator initializer.
+        @param latency (float) Per-command processing time in seconds.
+        @param link (float) Per-burst transport delay in seconds.
+        @param warmup (float) Time in seconds from ON until RUN. Default: 2
+        @param tune_rate (float) OPO tuning rate in nm/s. Default: 100
+        @param tune_settle (float) Time in seconds after the wavelength is
+        reached for the DSM position to settle. Default: 0.5
+        @param wavelength (float) Initial OPO wavelength in nm. Default: 800
+        """
+        super().__init__(latency, link)
+        self.warmup = warmup
+        self.tune_rate = tune_rate
+        self.tune_settle = tune_settle
+
+        self._on_time = None
+        self._mode = 'RUN'
+        self._main_shutter = 0
+        self._fixed_shutter = 0
+        self._wl_from = wavelength
+        self._wl_to = wavelength
+        self._tune_start = 0.
+        self._history = ['000']
+        self._error_bits = 0
+        self._start = time.monotonic()
+
+    # Fault injection
+    ############################################################################
+    def set_fault(self, code: str, warning: bool = False):
+        """! Record a code in the history buffer and flag it in the status word.
+        Faults (but not warnings) turn the laser diodes off.
+        @param code (str) Three digit code, as in Insight.fault_codes.
+        @param warning (bool) Flag as a warning (0x4000) rather than a fault
+        (0x8000). Default: False
+        """
+        self._history.insert(0, code)
+        if warning:
+            self._error_bits |= 0x00004000
+        else:
+            self._error_bits |= 0x00008000
+            self._on_time = None
+
+    def clear_faults(self):
+        """! Clear the warning and fault bits and the history buffer."""
+        self._error_bits = 0
+        self._history = ['000']
+
+    # Simulated state
+    ############################################################################
+    def _op_state(self) -> int:
+        """! Numeric operational state as reported in bits 16+ of *STB?."""
+        if self._on_time is None:
+            return 25
+        elapsed = time.monotonic() - self._on_time
+        if elapsed < self.warmup:
+            return 26 + int(23*elapsed/self.warmup)
+        return 60 if self._mode == 'ALIGN' else 50
+
+    def _status(self) -> int:
+        """! The *STB? status word."""
+        state = self._op_state()
+        status = (state << 16) | self._error_bits
+        if state >= 50:
+            status |= 0x00000001
+        if self._main_shutter:
+            status |= 0x00000004
+        if self._fixed_shutter:
+            status |= 0x00000008
+        return status
+
+    def _tune_progress(self) -> tuple:
+        """! Fractions of the current tuning move completed.
+        @return (tuple[float]) Progress of the wavelength and of the DSM
+        position, each in [0, 1].
+        """
+        dwl = abs(self._wl_to - self._wl_from)
+        elapsed = time.monotonic() - self._tune_start
+        t_wl = dwl/self.tune_rate
+        t_dsm = t_wl + (self.tune_settle if dwl else 0.)
+        wl = min(1., elapsed/t_wl) if t_wl else 1.
+        dsm = min(1., elapsed/t_dsm) if t_dsm else 1.
+        return wl, dsm
+
+    def _wavelength(self) -> float:
+        wl, _ = self._tune_progress()
+        return self._wl_from + (self._wl_to - self._wl_from)*wl
+
+    @staticmethod
+    def _dsm(wl: float) -> tuple:
+        """! Model of the DSM (min, nominal, max) positions for a wavelength."""
+        pos = 15. + 0.025*(wl - 680.)
+        return pos - 5., pos, pos + 5.
+
+    def _dsm_pos(self) -> float:
+        _, dsm = self._tune_progress()
+        start = self._dsm(self._wl_from)[1]
+        end = self._dsm(self._wl_to)[1]
+        return start + (end - start)*dsm
+
+    def _tune(self, wl: float):
+        """! Begin tuning to a new wavelength from the current one."""
+        if not self.wl_range[0] <= wl <= self.wl_range[1]:
+            return
+        self._wl_from = self._wavelength()
+        self._wl_to = wl
+        self._tune_start = time.monotonic()
+
+    # Command handling
+    ############################################################################
+    def handle(self, line: str):
+        """! Answer one Insight command. Matching is case insensitive.
+        @param line (str) The command.
+        @return (str) The reply, or None for commands without a reply.
+        """
+        cmd = line.upper()
+        if cmd.endswith('?'):
+            return self._query(cmd[:-1])
+
+        for prefix in ('WAVELENGTH', 'IRSHUTTER', 'SHUTTER', 'MODE',
+                       'TIMER:WATCHDOG', 'ON', 'OFF'):
+            if cmd.startswith(prefix):
+                arg = cmd[len(prefix):].strip()
+                break
+        else:
+            return None
+
+        if prefix == 'WAVELENGTH':
+            try:
+                self._tune(float(arg))
+            except ValueError:
+                pass
+        elif prefix == 'IRSHUTTER':
+            self._fixed_shutter = int(arg == '1')
+        elif prefix == 'SHUTTER':
+            self._main_shutter = int(arg == '1')
+        elif prefix == 'MODE' and arg in ('ALIGN', 'RUN'):
+            self._mode = arg
+        elif prefix == 'ON' and not self._error_bits & 0x00008000:
+            if self._on_time is None:
+                self._on_time = time.monotonic()
+        elif prefix == 'OFF':
+            self._on_time = None
+        return None
+
+    def _query(self, cmd: str) -> str:
+        """! Answer a query (without its trailing '?')."""
+        hours = (time.monotonic() - self._start)/3600.
+        dsm_min, _, dsm_max = self._dsm(self._wavelength())
+        running = self._op_state() >= 50
+        replies = {
+            '*STB': lambda: f'{self._status()}',
+            'READ:AHIS': lambda: ' '.join(self._history),
+            'READ:PLASER:DIODE1:CURRENT': lambda: f'{31.5 if running else 0.:.1f}',
+            'READ:PLASER:DIODE1:HOURS': lambda: f'{1520. + hours:.2f}',
+            'READ:PLASER:DIODE1:TEMPERATURE': lambda: '22.1',
+            'READ:PLASER:DIODE2:CURRENT': lambda: f'{30.8 if running else 0.:.1f}',
+            'READ:PLASER:DIODE2:HOURS': lambda: f'{1498. + hours:.2f}',
+            'READ:PLASER:DIODE2:TEMPERATURE': lambda: '22.4',
+            'READ:HUMIDITY': lambda: '3.2',
+            'CONT:SLMAX': lambda: f'{dsm_max:.3f}',
+            'CONT:SLMIN': lambda: f'{dsm_min:.3f}',
+            'CONT:DSMPOS': lambda: f'{self._dsm_pos():.3f}',
+            'IRSHUTTER': lambda: f'{self._fixed_shutter}',
+            'SHUTTER': lambda: f'{self._main_shutter}',
+            'WAVELENGTH': lambda: f'{self._wavelength():.0f}',
+            'MODE': lambda: self._mode,
+        }
+        if cmd in replies:
+            return replies[cmd]()
+        return None
@@ -0,0 +1,149 @@
+"""!
+@brief Definition of the PtyDevice base class for simulating serial devices on
+a pseudo-terminal, so the SerialDevice classes can talk to them unchanged.
+
+Classes:
+PtyDevice
+"""
+
+import os
+import select
+import threading
+import time
+import tty
+
+class PtyDevice:
+    """! Base class for serial device simulators.
+
+    Opens a pseudo-terminal and answers each line written to it on a background
+    thread. Subclasses implement handle(), which receives one command line and
+    returns the reply (without line ending) or None if the command produces no
+    reply. Only available on POSIX systems.
+
+    Properties:
+    -----------
+    port (str) : Path of the pseudo-terminal to use as a SerialDevice comport.
+
+    Methods:
+    --------
+    start() : Begin answering commands.
+    stop() : Stop answering and release the pseudo-terminal.
+    inject_fault(kind, count, delay) : Misbehave on upcoming replies.
+    """
+    ## @var terminator
+    # (bytes) Line ending appended to every reply.
+    terminator = b'\n'
+
+    ## @var fault_kinds
+    # (tuple[str]) Supported injected faults: 'drop' sends no reply, 'garble'
+    # corrupts the reply, 'delay' holds the reply back for an extra delay.
+    fault_kinds = ('drop', 'garble', 'delay')
+
+    def __init__(self, latency: float = 0.002, link: float = 0.):
+        """! The PtyDevice base class initializer.
+        @param latency (float) Time in seconds the device spends processing
+        each command before replying. Default: 0.002
+        @param link (float) Delay in seconds before each burst of bytes written
+        by the host reaches the device, modelling a USB-serial adapter's
+        turnaround. Default: 0
+        """
+        ## @var latency
+        # (float) Per-command processing time in seconds.
+        self.latency = latency
+
+        ## @var link
+        # (float) Per-burst transport delay in seconds.
+        self.link = link
+
+        ## @var commands
+        # (list[str]) Every command line received, in order. Useful for
+        # counting serial traffic in benchmarks.
+        self.commands = []
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self._faults = []
+        self._fault_delay = 0.
+        self._running = False
+        self._thread = None
+
+    # Pseudo-terminal management
+    ############################################################################
+    @property
+    def port(self) -> str:
+        """! Property for the pseudo-terminal path.
+        @return (str) Path to pass to SerialDevice.comport.
+        """
+        return os.ttyname(self._slave)
+
+    def start(self):
+        """! Begin answering commands on a background thread.
+        @return self, to allow chaining on construction.
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True,
+                                        name=f'{type(self).__name__} pty')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """! Stop answering commands and close the pseudo-terminal."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def inject_fault(self, kind: str, count: int = 1, delay: float = 1.):
+        """! Misbehave on the next count replies.
+        @param kind (str) One of fault_kinds.
+        @param count (int) Number of replies affected. Default: 1
+        @param delay (float) Extra delay in seconds for 'delay' faults.
+        Default: 1
+        """
+        if kind not in self.fault_kinds:
+            raise ValueError(f'Fault must be one of {self.fault_kinds}.')
+        self._fault_delay = delay
+        self._faults.extend([kind]*count)
+
+    # Command handling
+    ############################################################################
+    def handle(self, line: str):
+        """! Overwritten by subclasses to answer a single command.
+        @param line (str) The command, with the line ending stripped.
+        @return (str) The reply, or None if the command has no reply.
+        """
+        return None
+
+    def _serve(self):
+        """! Read commands from the pseudo-terminal and answer them in order."""
+        buf = b''
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            buf += os.read(self._master, 4096)
+            if self.link:
+                time.sleep(self.link)
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                line = line.decode('ascii', errors='replace').strip()
+                if not line:
+                    continue
+                self.commands.append(line)
+                if self.latency:
+                    time.sleep(self.latency)
+                reply = self.handle(line)
+                if reply is not None:
+                    self._reply(reply)
+
+    def _reply(self, reply: str):
+        """! Write a reply, applying any pending injected fault."""
+        fault = self._faults.pop(0) if self._faults else None
+        if fault == 'drop':
+            return
+        if fault == 'garble':
+            reply = reply[::-1].replace('.', '#')
+        if fault == 'delay':
+            time.sleep(self._fault_delay)
+        os.write(self._master, reply.encode('ascii') + self.terminator)
@@ -0,0 +1,436 @@
+"""!
+@brief Definition of the ZiServerSimulator class, an in-process stand-in for
+the subset of the zhinst ziDAQServer API used by the ZurichLockin class, with
+the discovery and dataAcquisitionModule stand-ins used for imaging.
+
+Classes:
+ZiApiSimulator
+ZiDiscoverySimulator
+ZiServerSimulator
+DaqModuleSimulator
+"""
+
+import threading
+import time
+import numpy as np
+
+class ZiApiSimulator:
+    """! Stand-in for the zhinst.ziPython module, serving one simulated
+    server. Assign an instance to zurichlockin.ziPython to run ZurichLockin's
+    normal discovery and connection path without the instrument.
+    """
+    def __init__(self, server=None):
+        """! The ZiApiSimulator initializer.
+        @param server (ZiServerSimulator) The server discovered and connected
+        to. Default: a new ZiServerSimulator.
+        """
+        self.server = ZiServerSimulator() if server is None else server
+
+    def ziDiscovery(self):
+        return ZiDiscoverySimulator(self.server)
+
+    def ziDAQServer(self, host: str, port: int, apilevel: int):
+        return self.server
+
+
+class ZiDiscoverySimulator:
+    """! Simulated ziDiscovery, finding the one simulated device."""
+    def __init__(self, server):
+        self._server = server
+
+    def findAll(self) -> list:
+        return [self._server.devname]
+
+    def find(self, dev: str) -> str:
+        return dev.lower()
+
+    def get(self, dev: str) -> dict:
+        return {'deviceid': self._server.devname.upper(),
+                'serverport': 8005,
+                'apilevel': 1,
+                'serveraddress': 'localhost'}
+
+
+class ZiServerSimulator:
+    """! Simulated ziDAQServer connected to an HF2LI.
+
+    Node settings are stored as given. Subscribed demodulator sample streams
+    are generated on demand when polled, covering the time since the previous
+    poll or sync at the demodulator's rate, so a record of a given duration
+    takes that long to collect just as on the instrument.
+
+    The demodulated signal is provided by a callable taking an array of
+    monotonic sample times in seconds and returning the complex demodulator
+    output (x + iy) at those times. Gaussian noise is added to x and y.
+
+    Image frames for the dataAcquisitionModule come from a second callable
+    taking the frame shape and index and returning a complex image. By
+    default it is a fixed field of Gaussian "cells" on a weak background.
+    auxin0 carries the frame trigger and auxin1 the line trigger, both 5 V
+    pulses, in sample streams and images alike.
+
+    Methods:
+    --------
+    set(settings) : Set a list of [path, value] pairs.
+    get(path, flat) : Get a node value.
+    sync() : Discard buffered samples.
+    subscribe(path) : Start buffering a sample stream.
+    poll(duration, timeout, flags, flat) : Collect buffered samples.
+    dataAcquisitionModule() : Create a simulated DAQ module.
+    """
+    ## @var clockbase
+    # (float) Timestamp ticks per second (HF2LI: 210 MHz).
+    clockbase = 210e6
+
+    ## @var trigger_level
+    # (float) Level of the simulated trigger pulses in V.
+    trigger_level = 5.
+
+    def __init__(self, devname: str = 'dev1292', signal=None, noise: float = 0.,
+                 rate: float = 1e5, image=None, line_period: float = None,
+                 lines: int = 512):
+        """! The ZiServerSimulator initializer.
+        @param devname (str) The simulated device name. Default: 'dev1292'
+        @param signal A callable mapping an array of monotonic times to the
+        complex demodulator output. Default: no signal.
+        @param noise (float) Standard deviation of the noise added to x and y.
+        Default: 0
+        @param rate (float) Default demodulator sample rate in Hz, if no rate
+        node has been set. Default: 1e5
+        @param image A callable taking (rows, cols, index) and returning a
+        complex image for frame index. Default: synthetic cells.
+        @param line_period (float) Period in seconds of the auxin1 line trigger
+        in sample streams. Default: no triggers.
+        @param lines (int) Lines per frame, for the auxin0 frame trigger in
+        sample streams. Default: 512
+        """
+        self.devname = devname
+        self.signal = signal
+        self.noise = noise
+        self.rate = rate
+        self.image = self.cells if image is None else image
+        self.line_period = line_period
+        self.lines = lines
+        self._cells = None
+
+        self._nodes = {}
+        self._subscribed = set()
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng()
+
+    # Connection
+    ############################################################################
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def dataAcquisitionModule(self):
+        return DaqModuleSimulator(self)
+
+    # Node settings
+    ############################################################################
+    def set(self, settings):
+        """! Set nodes.
+        @param settings (list[list]) [path, value] pairs.
+        """
+        for path, val in settings:
+            self._nodes[path.lower()] = val
+
+    def setDouble(self, path: str, val: float):
+        self._nodes[path.lower()] = float(val)
+
+    def setInt(self, path: str, val: int):
+        self._nodes[path.lower()] = int(val)
+
+    def get(self, path: str, flat: bool = True) -> dict:
+        """! Get all set nodes below a path.
+        @param path (str) The node path.
+        @param flat (bool) Ignored, the dictionary is always flat.
+        @return (dict[str]:dict) {path: {'value': [val]}} for each node.
+        """
+        path = path.lower()
+        return {key: {'value': [val]} for key, val in self._nodes.items()
+                if key.startswith(path)}
+
+    def getDouble(self, path: str) -> float:
+        if path.lower() == f'/{self.devname}/clockbase':
+            return self.clockbase
+        return float(self._nodes.get(path.lower(), 0.))
+
+    def getInt(self, path: str) -> int:
+        if path.lower() == f'/{self.devname}/status/time':
+            # Sample timestamps count clock ticks of the monotonic clock
+            return int(time.monotonic()*self.clockbase)
+        return int(self._nodes.get(path.lower(), 0))
+
+    def sync(self):
+        """! Discard samples acquired before now, as the real server only
+        returns data recorded after a sync.
+        """
+        with self._lock:
+            self._last = time.monotonic()
+
+    # Sample streams
+    ############################################################################
+    def subscribe(self, path: str):
+        self._subscribed.add(path.lower())
+
+    def unsubscribe(self, path: str):
+        self._subscribed.discard(path.lower())
+
+    def poll(self, duration: float, timeout: int = 500, flags: int = 0,
+             flat: bool = True) -> dict:
+        """! Wait for duration, then return the samples of every subscribed
+        stream since the previous poll or sync.
+        @param duration (float) Recording time in seconds.
+        @param timeout (int) Ignored.
+        @param flags (int) Ignored.
+        @param flat (bool) Ignored, paths are always flat.
+        @return (dict[str]:dict[str]:np.ndarray) Sample fields for each path.
+        """
+        time.sleep(duration)
+        with self._lock:
+            start, self._last = self._last, time.monotonic()
+            end = self._last
+        return {path: self._samples(path, start, end) for path in self._subscribed}
+
+    def _samples(self, path: str, start: float, end: float) -> dict:
+        """! Generate demodulator samples for a time span.
+        @param path (str) The sample stream, e.g. '/dev1292/demods/0/sample'.
+        @param start (float) Monotonic start time in seconds.
+        @param end (float) Monotonic end time in seconds.
+        @return (dict[str]:np.ndarray) The sample fields.
+        """
+        rate = float(self._nodes.get(path.replace('/sample', '/rate'), self.rate))
+        t = np.arange(np.ceil(start*rate), np.ceil(end*rate))/rate
+        if self.signal is None:
+            z = np.zeros(len(t), dtype=complex)
+        else:
+            z = np.asarray(self.signal(t), dtype=complex)*np.ones(len(t))
+        if self.noise > 0:
+            z = z + self.noise*(self._rng.standard_normal(len(t))
+                                + 1j*self._rng.standard_normal(len(t)))
+        return {'timestamp': (t*self.clockbase).astype(np.uint64),
+                'x': z.real,
+                'y': z.imag,
+                'frequency': np.full(len(t), self.getDouble(f'/{self.devname}/oscs/0/freq')),
+                'phase': np.zeros(len(t)),
+                'auxin0': self._triggers(t, self.line_period*self.lines
+                                         if self.line_period else None),
+                'auxin1': self._triggers(t, self.line_period)}
+
+    def _triggers(self, t: np.ndarray, period: float) -> np.ndarray:
+        """! Trigger pulses, high for the first 1% of each period.
+        @param t (np.ndarray) Monotonic times in seconds.
+        @param period (float) Trigger period in seconds, or None for none.
+        @return (np.ndarray) The trigger input in V.
+        """
+        if period is None:
+            return np.zeros(len(t))
+        return np.where(np.mod(t, period) < 0.01*period, self.trigger_level, 0.)
+
+    # Synthetic images
+    ############################################################################
+    def cells(self, rows: int, cols: int, index: int) -> np.ndarray:
+        """! Default image: Gaussian cells at fixed random positions on a weak
+        background, with a slow drift in brightness from frame to frame.
+        @param rows (int) Number of rows.
+        @param cols (int) Number of columns.
+        @param index (int) Frame index.
+        @return (np.ndarray) Complex image, rows x cols.
+        """
+        if self._cells is None or self._cells.shape != (rows, cols):
+            rng = np.random.default_rng(1292)
+            y, x = np.mgrid[:rows, :cols]
+            img = np.full((rows, cols), 0.05)
+            size = max(rows, cols)/40
+            for cy, cx, amp in zip(rng.uniform(0, rows, 30), rng.uniform(0, cols, 30),
+                                   rng.uniform(0.3, 1., 30)):
+                img += amp*np.exp(-((y - cy)**2 + (x - cx)**2)/(2*size**2))
+            self._cells = img
+        return self._cells*(1 + 0.05*np.sin(index/10))*np.exp(0.3j)
+
+
+class DaqModuleSimulator:
+    """! Simulated dataAcquisitionModule in grid mode.
+
+    Frames start back to back once executed, each taking rows x duration x
+    repetitions seconds (the duration setting is the time of one row). Rows
+    are filled as time passes. A read returns every grid not yet returned
+    complete, including the one being filled, whose remaining rows are NaN.
+    Each subscribed signal (e.g. '/dev1292/demods/0/sample.r') gets its own
+    grids from the server's image, with noise. auxin0 and auxin1 hold the
+    frame and line triggers. The number of grids kept between reads is
+    limited by historylength, so slow readers lose frames as on the
+    instrument.
+
+    Methods:
+    --------
+    set(settings) : Set module parameters.
+    get(path, flat) : Get module parameters.
+    subscribe(path) : Add a signal to acquire.
+    execute() : Start acquiring.
+    read(flat) : Return grids acquired.
+    finish() : Stop acquiring.
+    clear() : Release the module.
+    """
+    def __init__(self, server: ZiServerSimulator):
+        """! The DaqModuleSimulator initializer.
+        @param server (ZiServerSimulator) The server the module belongs to.
+        """
+        self._server = server
+        self._params = {'grid/rows': 512, 'grid/cols': 512,
+                        'grid/repetitions': 1, 'duration': 512*3e-6,
+                        'historylength': 100}
+        self._subscribed = []
+        self._start = None
+        self._returned = 0
+        self._frames = {}
+        self._noise = []
+        self._rng = np.random.default_rng()
+        self._lock = threading.Lock()
+
+    def set(self, settings, val=None):
+        """! Set module parameters.
+        @param settings (list[list]) [path, value] pairs, with paths of the form
+        'dataAcquisitionModule/grid/rows'. A single path and value may also be
+        given.
+        """
+        if val is not None:
+            settings = [[settings, val]]
+        for path, val in settings:
+            self._params[path.lower().replace('dataacquisitionmodule/', '')] = val
+
+    def get(self, path: str, flat: bool = True) -> dict:
+        key = path.lower().replace('dataacquisitionmodule/', '')
+        return {f'/{key}': [val] for name, val in self._params.items()
+                if name.startswith(key)}
+
+    def subscribe(self, path: str):
+        if path.lower() not in self._subscribed:
+            self._subscribed.append(path.lower())
+
+    def unsubscribe(self, path: str):
+        if path.lower() in self._subscribed:
+            self._subscribed.remove(path.lower())
+
+    def execute(self):
+        with self._lock:
+            self._returned = 0
+            self._frames = {}
+            self._noise = self._noise_frames()
+            self._start = time.monotonic()
+
+    def finish(self):
+        with self._lock:
+            self._start = None
+
+    def finished(self) -> bool:
+        return self._start is None
+
+    def clear(self):
+        self.finish()
+        self._subscribed = []
+
+    @property
+    def frame_period(self) -> float:
+        """! (float) Time in seconds to acquire one grid."""
+        return (int(self._params['grid/rows'])*float(self._params['duration'])
+                *int(self._params['grid/repetitions']))
+
+    def read(self, flat: bool = True) -> dict:
+        """! Return the grids acquired since the last complete one returned.
+        @param flat (bool) Ignored, paths are always flat.
+        @return (dict[str]:list[dict]) For each subscribed signal, a list of
+        grids, each with 'header', 'timestamp' and 'value'.
+        """
+        with self._lock:
+            if self._start is None:
+                return {}
+            now = time.monotonic()
+            elapsed = now - self._start
+            current = int(elapsed//self.frame_period)
+            first = max(self._returned, current - int(self._params['historylength']))
+            self._returned = current
+        rows, cols = int(self._params['grid/rows']), int(self._params['grid/cols'])
+        filled = int((elapsed % self.frame_period)/self.frame_period*rows)
+        data = {path: [] for path in self._subscribed}
+        # Frames are generated once; the one being filled is returned again
+        # by the following reads
+        self._frames = {index: frame for index, frame in self._frames.items()
+                        if index >= first}
+        clock = self._server.clockbase
+        for index in range(first, current + 1):
+            if index not in self._frames:
+                self._frames[index] = self._frame(index, rows, cols)
+            planes, created, timestamps = self._frames[index]
+            for path in self._subscribed:
+                signal = path.rsplit('.', 1)[-1]
+                if signal not in planes:
+                    planes[signal] = self._plane(signal, planes['z'], rows, cols)
+                value = planes[signal]
+                if index == current:
+                    value = value.copy()
+                    value[filled:] = np.nan
+                data[path].append({
+                    'header': {'createdtimestamp': [int(created*clock)],
+                               'changedtimestamp': [int(min(now, created + self.frame_period)*clock)],
+                               'systemtime': [int(time.time()*1e6)],
+                               'gridrows': [rows], 'gridcols': [cols],
+                               'flags': [0 if index < current else 1]},
+                    'timestamp': timestamps,
+                    'value': value})
+        return data
+
+    def _frame(self, index: int, rows: int, cols: int) -> tuple:
+        """! Generate a frame. Its signal planes are added as they are first
+        read.
+        @param index (int) Frame index since execute.
+        @return (tuple) The planes so far, holding the complex image with noise
+        as 'z', the frame's start time and the timestamp of each pixel.
+        """
+        image = self._server.image(rows, cols, index)
+        if self._noise:
+            image = image + self._noise[index % len(self._noise)]
+        created = self._start + index*self.frame_period
+        row_time = self.frame_period/rows
+        times = created + row_time*(np.arange(rows)[:, None]
+                                    + np.arange(cols)[None, :]/cols)
+        return {'z': image}, created, (times*self._server.clockbase).astype(np.uint64)
+
+    def _noise_frames(self, count: int = 8) -> list:
+        """! Draw a pool of complex noise frames, reused in turn, so frames are
+        generated quickly enough not to delay reads.
+        @param count (int) Number of noise frames. Default: 8
+        @return (list[np.ndarray]) The noise, or an empty list without noise.
+        """
+        if self._server.noise <= 0:
+            return []
+        shape = (int(self._params['grid/rows']), int(self._params['grid/cols']))
+        return [self._server.noise*(self._rng.standard_normal(shape)
+                                    + 1j*self._rng.standard_normal(shape))
+                for i in range(count)]
+
+    def _plane(self, signal: str, image: np.ndarray, rows: int, cols: int) -> np.ndarray:
+        """! One signal of a grid.
+        @param signal (str) x, y, r, theta, auxin0 or auxin1.
+        @param image (np.ndarray) The complex image.
+        @return (np.ndarray) The signal, rows x cols.
+        """
+        if signal == 'x':
+            return image.real.copy()
+        if signal == 'y':
+            return image.imag.copy()
+        if signal == 'r':
+            return np.abs(image)
+        if signal in ('theta', 'phase'):
+            return np.angle(image)
+        value = np.zeros((rows, cols))
+        if signal == 'auxin0':
+            value[0, 0] = self._server.trigger_level
+        elif signal == 'auxin1':
+            value[:, 0] = self._server.trigger_level
+        return value
@@ -0,0 +1,178 @@
+"""!
+@brief Definition of the TuningTable class, a persistent record of how long
+the Insight OPO takes to tune and where its GVD compensation (DSM) settles at
+each wavelength.
+
+Classes:
+TuningTable
+"""
+
+import os
+import threading
+import numpy as np
+import yaml
+
+class TuningTable:
+    """! Learned OPO tuning times and DSM ranges.
+
+    Every completed tuning adds its step size and measured settling time. The
+    time of a new step is predicted from a straight line fitted to the samples
+    (a fixed overhead plus the step over the tuning rate), so planners can
+    estimate the dead time of a wavelength sequence before running it. The DSM
+    position and its limits are stored per wavelength (rounded to the nearest
+    nm) and interpolated between known wavelengths. The table is stored as
+    YAML and reloaded on start up.
+
+    Methods:
+    --------
+    tuning_time(step) : Predicted settling time of a step in nm.
+    sequence_time(wavelengths, start) : Total tuning time of a sequence.
+    record_tuning(step, seconds) : Add a measured tuning time.
+    dsm(wl) : Cached or interpolated DSM (min, pos, max) at a wavelength.
+    record_dsm(wl, dsm_min, dsm_pos, dsm_max) : Store the DSM range.
+    load() : Read the table from file.
+    save() : Write the table to file.
+    """
+    ## @var default_path
+    # (str) File the table is stored in, in the package configuration folder.
+    default_path = os.path.join(os.path.dirname(__file__), 'configuration',
+                                'insighttuning.yaml')
+
+    ## @var default_rate
+    # (float) Tuning rate in nm/s assumed until times have been measured.
+    default_rate = 50.
+
+    ## @var default_overhead
+    # (float) Settling time in seconds assumed until times have been measured.
+    default_overhead = 1.
+
+    ## @var max_samples
+    # (int) Number of most recent tuning times kept.
+    max_samples = 200
+
+    def __init__(self, path: str = None):
+        """! The TuningTable initializer. Loads the table if the file exists.
+        @param path (str) The YAML file. Default: default_path
+        """
+        self.path = self.default_path if path is None else path
+
+        ## @var times
+        # (list[list[float]]) [step in nm, settling time in s] of each tuning.
+        self.times = []
+
+        ## @var dsm_table
+        # (dict[int]:list[float]) [min, pos, max] DSM positions by wavelength.
+        self.dsm_table = {}
+
+        ## @var _fit
+        # (tuple[float]) Cached (overhead, seconds per nm), or None to refit.
+        self._fit = None
+
+        ## @var _lock
+        # (Lock) Guards the table, which is updated from the I/O worker and
+        # read by planners on other threads.
+        self._lock = threading.Lock()
+        self.load()
+
+    # Tuning times
+    ############################################################################
+    def tuning_time(self, step: float) -> float:
+        """! Predict the time from sending a new wavelength until the OPO and
+        DSM have settled.
+        @param step (float) Size of the wavelength step in nm.
+        @return (float) Time in seconds.
+        """
+        with self._lock:
+            if self._fit is None:
+                self._fit = self._fit_times()
+            overhead, slope = self._fit
+        return overhead + slope*abs(step)
+
+    def sequence_time(self, wavelengths, start: float) -> float:
+        """! Predict the total tuning time of a sequence of wavelengths.
+        @param wavelengths (list[float]) The wavelengths in nm, in order.
+        @param start (float) The wavelength tuned from, in nm.
+        @return (float) Time in seconds.
+        """
+        steps = np.diff(np.concatenate(([start], np.asarray(wavelengths, dtype=float))))
+        return float(sum(self.tuning_time(step) for step in steps if step != 0))
+
+    def record_tuning(self, step: float, seconds: float):
+        """! Add a measured tuning time. Steps of zero are ignored.
+        @param step (float) Size of the wavelength step in nm.
+        @param seconds (float) Time until the OPO and DSM settled.
+        """
+        if step == 0:
+            return
+        with self._lock:
+            self.times.append([abs(float(step)), float(seconds)])
+            del self.times[:-self.max_samples]
+            self._fit = None
+
+    def _fit_times(self) -> tuple:
+        """! Fit the settling time against step size.
+        @return (tuple[float]) The overhead in seconds and seconds per nm.
+        """
+        if not self.times:
+            return self.default_overhead, 1./self.default_rate
+        step, seconds = np.array(self.times).T
+        if len(self.times) < 2 or np.ptp(step) == 0:
+            # Not enough spread for a slope. Keep the default rate.
+            slope = 1./self.default_rate
+            return float(np.mean(seconds - slope*step)), slope
+        slope, overhead = np.polyfit(step, seconds, 1)
+        return float(max(overhead, 0.)), float(max(slope, 0.))
+
+    # DSM range
+    ############################################################################
+    def dsm(self, wl: float) -> tuple:
+        """! The DSM position and limits at a wavelength, from the table or
+        interpolated linearly between the nearest known wavelengths.
+        @param wl (float) Wavelength in nm.
+        @return (tuple[float]) (min, pos, max), or None if the table is empty
+        or wl is outside the wavelengths known.
+        """
+        with self._lock:
+            key = int(round(wl))
+            if key in self.dsm_table:
+                return tuple(self.dsm_table[key])
+            if len(self.dsm_table) < 2:
+                return None
+            known = np.array(sorted(self.dsm_table))
+            if not known[0] < wl < known[-1]:
+                return None
+            values = np.array([self.dsm_table[k] for k in known])
+        return tuple(float(np.interp(wl, known, values[:, i])) for i in range(3))
+
+    def record_dsm(self, wl: float, dsm_min: float, dsm_pos: float, dsm_max: float):
+        """! Store the settled DSM position and limits at a wavelength.
+        @param wl (float) Wavelength in nm.
+        @param dsm_min (float) Minimum DSM position.
+        @param dsm_pos (float) Settled DSM position.
+        @param dsm_max (float) Maximum DSM position.
+        """
+        with self._lock:
+            self.dsm_table[int(round(wl))] = [float(dsm_min), float(dsm_pos),
+                                              float(dsm_max)]
+
+    # Persistence
+    ############################################################################
+    def load(self):
+        """! Read the table from file, if it exists."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            table = yaml.safe_load(f) or {}
+        with self._lock:
+            self.times = [list(t) for t in table.get('times', [])]
+            self.dsm_table = {int(k): list(v) for k, v
+                              in table.get('dsm', {}).items()}
+            self._fit = None
+
+    def save(self):
+        """! Write the table to file."""
+        with self._lock:
+            table = {'times': [list(t) for t in self.times],
+                     'dsm': {k: list(v) for k, v in sorted(self.dsm_table.items())}}
+        with open(self.path, 'w') as f:
+            yaml.safe_dump(table, f, default_flow_style=None)
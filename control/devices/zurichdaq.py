@@ -3,9 +3,10 @@
 for the ZI API asynchronously.
 """
 
-import zhinst.ziPython as ziPython
+from .framering import FrameRing
 from PyQt5.QtCore import QObject
 from PyQt5.QtCore import pyqtSignal as Signal
+import threading
 import time
 import numpy as np
 
@@ -16,34 +17,116 @@ class ZurichDaq(QObject):
     created to sample from different data streams. Wraps the DAQ module from
     the ZI API for smoother integration with the Qt framework.
 
+    Frames are read at the module's refresh rate. Every grid returned by a
+    read is consumed, and each is emitted once, as soon as all its rows are
+    filled. Grids are identified by their creation timestamp. A grid that
+    is replaced by a newer one before it is complete counts as dropped.
+    Completed frames are copied into a preallocated FrameRing. Consumers
+    receive only the slot index and sequence number, and read the frame
+    from ring.
+
+    Several signals can be acquired in the same scan, from one or more
+    demodulators (see channels). Each frame is a structured record with one
+    rows x cols plane per channel, named e.g. 'd0_r' or 'd3_auxin0'. All
+    channels of a frame come from one read. The planes are stored as the
+    module returns them, each contiguous, so writing a frame is a straight
+    copy. The first channel is the one displayed.
+
     Properties:
     -----------
+    stop : Set to end acquisition within one refresh interval.
+    frames : Number of complete frames emitted.
+    dropped : Number of frames dropped or only partially acquired.
 
     Methods:
     --------
+    start() : Acquire frames until stopped.
+    read_daq() : Read the module once and emit any newly completed frames.
     """
-    data = Signal(object)
+    ## @var frame
+    # Signal carrying the ring slot of each complete frame, its sequence
+    # number, counting from 0 since start, and the lock-in timestamp of its
+    # last sample in seconds.
+    frame = Signal(int, int, float)
     shutdown = Signal()
 
-    def __init__(self, daq, devname, path):
+    ## @var signals
+    # (tuple[str]) Demodulator signals acquired by default. R first, as the
+    # one displayed.
+    signals = ('r', 'x', 'y', 'theta', 'auxin0', 'auxin1')
+
+    ## @var ring_slots
+    # (int) Number of frames held for consumers.
+    ring_slots = 8
+
+    def __init__(self, daq, devname, path, clockbase: float = 210e6,
+                 channels=None):
         """! The ZurichDaq initializer.
         @param devname (str) The lock-in device name, needed for the parameter hierarchy.
         @param daq (dataAcquisitionModule) A lock-in dataAcquisitionModule.
-        @param
+        @param path (str) The demodulator sample node, e.g. '/dev1292/demods/0/sample'.
+        @param clockbase (float) Lock-in timestamp ticks per second.
+        Default: 210e6 (HF2LI)
+        @param channels (list[tuple]) (demodulator index, signal) of each
+        channel to acquire, e.g. [(0, 'r'), (3, 'x')]. Default: each of signals
+        from the demodulator of path.
         """
         super().__init__()
         self._daq = daq
         self._devname = devname
         self._path = path
+        self._clockbase = clockbase
 
         # Path is of format '/dev/demods/0/sample'
-        # We subscribe to the R value from this node
         # Maintaining path this way allows using it more simply for retrieving
         # the trigger node
-        self._daq.subscribe(f'{self._path}.r')
+        if channels is None:
+            demod = int(path.split('/')[-2])
+            channels = [(demod, signal) for signal in self.signals]
+
+        ## @var channels
+        # (dict[str]:str) Node subscribed for each frame field, e.g.
+        # {'d0_r': '/dev1292/demods/0/sample.r'}.
+        self.channels = {f'd{demod}_{signal}':
+                         f'/{self._devname}/demods/{demod}/sample.{signal}'
+                         for demod, signal in channels}
+        for node in self.channels.values():
+            self._daq.subscribe(node)
 
         self._pixeldwell = 3e-6
-        self._stop = False
+
+        ## @var _shape
+        # (tuple[int]) Rows and columns of a frame.
+        self._shape = (512, 512)
+
+        ## @var ring
+        # (FrameRing) Completed frames, see dtype.
+        self.ring = FrameRing(self.ring_slots, shape=(), dtype=self.dtype)
+
+        ## @var _stop
+        # (Event) Set to end acquisition. Waiting on it between reads lets a
+        # stop take effect without waiting out the refresh interval.
+        self._stop = threading.Event()
+
+        ## @var _refreshrate
+        # (float) Module refresh rate in Hz; frames are read at this rate.
+        self._refreshrate = 200
+
+        ## @var _sequence
+        # (int) Sequence number of the next frame emitted.
+        self._sequence = 0
+
+        ## @var _dropped
+        # (int) Frames dropped or only partially acquired since start.
+        self._dropped = 0
+
+        ## @var _pending
+        # (float) Creation timestamp of the grid being filled, or None.
+        self._pending = None
+
+        ## @var _emitted
+        # (float) Creation timestamp of the most recent grid emitted.
+        self._emitted = None
         # self._rows = 512
         # self._cols = 512
 
@@ -69,7 +152,7 @@ class ZurichDaq(QObject):
         self._parameters = [['dataAcquisitionModule/enable', 1],
                             ['dataAcquisitionModule/device', self._devname],
                             ['dataAcquisitionModule/type', 0], # No trigger
-                            ['dataAcquisitionModule/refreshrate', 200],
+                            ['dataAcquisitionModule/refreshrate', self._refreshrate],
                             ['dataAcquisitionModule/endless', 1],
                             ['dataAcquisitionModule/delay', 0],
                             ['dataAcquisitionModule/count', 512],
@@ -96,6 +179,9 @@ class ZurichDaq(QObject):
                             ['dataAcquisitionModule/duration', self._pixeldwell*cols], # row duration
                             ['dataAcquisitionModule/delay', 0]]
         self._daq.set(self._parameters)
+        if self._shape != (rows, cols):
+            self._shape = (rows, cols)
+            self.ring.resize((), self.dtype)
 
     def setup_trigger(self, type=1, node='auxin0', edge=1, level=2.5):
         """! The trigger inputs.
@@ -115,32 +201,100 @@ class ZurichDaq(QObject):
         self._daq.set(self._parameters)
 
     def start(self):
+        """! Configure the module and acquire frames until stopped. Runs on the
+        ZurichDaq's thread.
+        """
         self.setup_scan()
         self.setup_trigger()
+        self._sequence = 0
+        self._dropped = 0
+        self._pending = None
+        self._emitted = None
         self._daq.execute()
-        while True:
-            time.sleep(1)
+        interval = 1./self._refreshrate
+        while not self._stop.is_set():
+            begin = time.monotonic()
             try:
                 self.read_daq()
             except KeyError as err:
                 print(f'{self._path}.r')
-            if self.stop:
-                return
+            self._stop.wait(max(interval - (time.monotonic() - begin), 0.))
+        # Grids completed since the last read
+        self.read_daq()
+        if self._pending is not None:
+            self._dropped += 1
+            self._pending = None
+        self._daq.finish()
 
     def read_daq(self):
-        img = self._daq.read(True)[f'{self._path}.r'][0]['value'].T
-        # img = np.random.random([512, 512])
-        self.data.emit(img)
+        """! Read the module once and emit every grid completed since the
+        previous read, in order. Grids of each channel are matched by their
+        position in the read.
+        """
+        data = self._daq.read(True)
+        planes = [data.get(node, []) for node in self.channels.values()]
+        for grids in zip(*planes):
+            created = self._header(grids[0], 'createdtimestamp')
+            if self._emitted is not None and created <= self._emitted:
+                # Already emitted in a previous read
+                continue
+            if self._pending is not None and created > self._pending:
+                # The grid being filled was replaced before it completed
+                self._dropped += 1
+            self._pending = None
+            imgs = [np.asarray(grid['value']) for grid in grids]
+            # Rows are filled in order, so a grid is complete once its last
+            # row is
+            if any(np.isnan(img[-1]).any() for img in imgs):
+                # Rows still being acquired
+                self._pending = created
+                continue
+            self._emitted = created
+            timestamp = float(np.asarray(grids[0]['timestamp']).max()/self._clockbase)
+            if self._shape != imgs[0].shape:
+                self._shape = imgs[0].shape
+                self.ring.resize((), self.dtype)
+            slot, frame = self.ring.write_slot()
+            for field, img in zip(self.channels, imgs):
+                np.copyto(frame[field], img)
+            self.ring.commit(slot, self._sequence, timestamp)
+            self.frame.emit(slot, self._sequence, timestamp)
+            self._sequence += 1
+
+    @staticmethod
+    def _header(grid: dict, key: str) -> float:
+        """! A scalar value from a grid's header, which may be wrapped in an
+        array.
+        """
+        return float(np.ravel(grid['header'][key])[0])
 
     # Properties for controlling acquisition
     ############################################################################
     @property
     def stop(self):
-        return self._stop
+        return self._stop.is_set()
 
     @stop.setter
     def stop(self, val):
-        self._stop = val
+        if val:
+            self._stop.set()
+        else:
+            self._stop.clear()
+
+    @property
+    def dtype(self) -> np.dtype:
+        """! (np.dtype) Structured type of a frame, one rows x cols plane per
+        channel.
+        """
+        return np.dtype([(field, np.float64, self._shape) for field in self.channels])
+
+    @property
+    def frames(self) -> int:
+        return self._sequence
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
 
     # On application close
     ############################################################################
@@ -12,12 +12,19 @@ APIError
 
 from .device import Device
 from .zurichdaq import ZurichDaq
-# from srsmicro.utilities.conversions import load_zi_yaml
-import zhinst.ziPython as ziPython
-from PyQt5.QtCore import QObject, QThread
+try:
+    import zhinst.ziPython as ziPython
+except ImportError:
+    # Without the ZI API only an attached server (e.g. a simulator) can be used
+    ziPython = None
+from utilities.conversions import load_zi_yaml
+from utilities.framespool import FrameSpool
+from PyQt5.QtCore import Qt, QObject, QThread
 from PyQt5.QtCore import pyqtSignal as Signal
 from PyQt5.QtCore import pyqtSlot as Slot
-import yaml
+import numpy as np
+import os
+import time
 
 # For simplicity, use the same names as serial devices
 # Need _cond_vars
@@ -49,7 +56,14 @@ class ZurichLockin(Device):
         ## @var _devname
         # Actual hardware device name for internal use with the server API
         self._devname: str = ''
-        # self._cond_vars_list, self._cond_vars = load_zi_yaml('srsmicro/control/devices/configuration/ziconfig.yaml')
+
+        ## @var _daq
+        # (ZurichDaq) Image acquisition, created on connecting.
+        self._daq = None
+
+        ## @var _spool
+        # (FrameSpool) The raw spool DAQ frames are written to, if spooling.
+        self._spool = None
         self._load_variables()
         # self._cond_vars['dwell'] = 1e-5
         self.state.emit(self.name, self._cond_vars)
@@ -62,6 +76,7 @@ class ZurichLockin(Device):
         directly to ZI API objects for setting parameters. A separate copy is
         converted to a dictionary which matches the format used by other devices
         for accessing parameters. The config file is also used by ZI gui element.
+        The file is read through its compiled cache (see load_zi_yaml).
         """
         ## @var _cond_vars_list
         # (list[list]) All possible ZI parameters in list of list format. Each
@@ -72,12 +87,8 @@ class ZurichLockin(Device):
         # (dict[str]:int/float/long) _cond_vars_list converted to dictionary
         # format for easier parameter accession and to match the format used by
         # other devices.
-        with open('srsmicro/control/devices/configuration/ziconfig.yaml', 'r') as f:
-            self._cond_vars_list = yaml.unsafe_load(f)
-        self._cond_vars = {}
-        for i in range(len(self._cond_vars_list)):
-            tmp = self._cond_vars_list[i]
-            self._cond_vars[tmp[0]] = tmp[1]
+        path = os.path.join(os.path.dirname(__file__), 'configuration', 'ziconfig.yaml')
+        self._cond_vars_list, self._cond_vars = load_zi_yaml(path)
         # print(self._cond_vars)
     def _open(self):
         """! Run the ZI API discovery routine and attempt to start the lock-in
@@ -98,12 +109,11 @@ class ZurichLockin(Device):
             self._server.connect()
 
             # print([[key, self._cond_vars[key]] for key in self._cond_vars])
-            self._server.set([[key, self._cond_vars[key]] for key in self._cond_vars])
             # self._server.set(self._cond_vars_list)
             # # Use external clock
             # self._server.set([['/{}/system/extclk'.format(self._devname), 1]])
             # self._server.sync()
-            self._enable_demod()
+            self.configure()
             # self._configure_sigin()
 
             # Create ZurichDaq object and the separate thread it runs on
@@ -113,12 +123,13 @@ class ZurichLockin(Device):
             # continuously from the physical device itself
             self._daq_thread = QThread()
             self._daq = ZurichDaq(self._server.dataAcquisitionModule(),
-                        self._devname, f'/{self._devname}/demods/0/sample')
+                        self._devname, f'/{self._devname}/demods/0/sample',
+                        self._server.getDouble(f'/{self._devname}/clockbase'))
             self._daq.moveToThread(self._daq_thread)
 
             # Connect _image_data for relaying information to controller and
             # gui
-            self._daq.data.connect(self._image_data)
+            self._daq.frame.connect(self._image_data)
 
             # Connect signal/slots for shutdown to thread signal/slots
             # Thread shutdown occurs in the ZurichLockin exit routine below
@@ -127,10 +138,80 @@ class ZurichLockin(Device):
             self._daq_thread.finished.connect(self._daq_thread.deleteLater)
 
 
+    # Settings
+    ############################################################################
+    def configure(self, **demod):
+        """! Bring the lock-in to the configuration file's settings with the
+        default demodulator enabled, pushing only what differs (see
+        apply_settings).
+        @param demod Keyword arguments for _demod_settings.
+        @return (int) The number of nodes changed.
+        """
+        nodes = [[key, val] for key, val in self._cond_vars.items()
+                 if key.startswith('/')]
+        return self.apply_settings(nodes + self._demod_settings(**demod))
+
+    def apply_settings(self, settings) -> int:
+        """! Push settings to the lock-in, skipping those it already has. The
+        current values are read in one bulk get, the nodes which differ are
+        set in one batch, and a single sync follows. Reconnects and GUI
+        edits then only send what changed instead of the full configuration.
+        The desired values are kept in _cond_vars.
+        @param settings (list[list]) [path, value] pairs.
+        @return (int) The number of nodes changed.
+        """
+        current = self._read_nodes()
+        changed = [[path, val] for path, val in settings
+                   if not self._same(current.get(path.lower()), val)]
+        for path, val in settings:
+            self._cond_vars[path] = val
+        if changed:
+            self._server.set(changed)
+            self._server.sync()
+        return len(changed)
+
+    def _read_nodes(self) -> dict:
+        """! Read every node of the device in one request.
+        @return (dict[str]) Value of each node, keyed by lowercase path.
+        """
+        nodes = self._server.get(f'/{self._devname}', True)
+        values = {}
+        for path, node in nodes.items():
+            # Depending on the API level a node is a dict holding a value
+            # array or the array itself
+            if isinstance(node, dict):
+                node = node.get('value', [])
+            node = np.ravel(node)
+            if len(node):
+                values[path.lower()] = node[-1]
+        return values
+
+    @staticmethod
+    def _same(current, val) -> bool:
+        """! Whether a node's current value equals the desired one, allowing
+        for float rounding by the device.
+        """
+        if current is None:
+            return False
+        try:
+            return bool(np.isclose(float(current), float(val), rtol=1e-9, atol=0))
+        except (TypeError, ValueError):
+            return current == val
+
     def _enable_demod(self, demod: int = 0, sigin: int = 0, freq: float = 1.028e7,
                             harm: int = 1, tc: float = 3e-6, order: int = 4,
                             osc: int = 0, rate: int = 100000):
         """! Enable a demodulator for signal processing.
+        See _demod_settings for the parameters.
+        @return (int) The number of nodes changed.
+        """
+        return self.apply_settings(self._demod_settings(demod, sigin, freq,
+                                                        harm, tc, order, osc, rate))
+
+    def _demod_settings(self, demod: int = 0, sigin: int = 0, freq: float = 1.028e7,
+                              harm: int = 1, tc: float = 3e-6, order: int = 4,
+                              osc: int = 0, rate: int = 100000) -> list:
+        """! Settings to enable a demodulator for signal processing.
         @param demod (int) Index of demodulator, [0, 5]. Default: 0
         @param sigin (int) Index of signal input, [0, 5]. Default: 0 (Signal In 1)
         @param freq (float) Demodulation frequency (Hz). Default: 10280000
@@ -139,6 +220,8 @@ class ZurichLockin(Device):
         @param order (int) Low-pass filter order [1,8]. Default 4 (24 dB/oct slope)
         @param osc (int) Oscillator to use 0 or 1. Default 0
         @param rate (int) Data transfer rate (Hz), may be approximated by LIA. Default: 10000 (>2 samples/pixel at 512 pixels with dwell=tc)
+        @return (list[list]) [path, value] pairs for the demodulator and its
+        oscillator.
         """
         # Demodulator parameter settings
         parameters = [['/{}/demods/{}/enable'.format(self._devname, demod), 1],
@@ -156,18 +239,10 @@ class ZurichLockin(Device):
         # parameters = [[key, self._cond_vars[key]] for key in self._cond_vars if dem in key]
         # for p in parameters:
 
-        # Push settings to lock-in
-        self._server.set(parameters)
-        self._server.sync()
-
         # Set oscillator parameters
         # Note: documentation may indicate that demods has a frequency parameter
         # but it doesn't. Set it in the oscillator
-        parameters = [[f'/{self._devname}/oscs/{osc}/freq', freq]]
-
-        # Push settings to lock-in
-        self._server.set(parameters)
-        self._server.sync()
+        parameters.append([f'/{self._devname}/oscs/{osc}/freq', freq])
 
         # Update object copy of parameters and logs
         self._cond_vars[f'demod{demod}'] = { 'enable' : 1,
@@ -188,6 +263,7 @@ class ZurichLockin(Device):
         log += f'Oscillator {osc} using:\n'
         log += f'\tfreq: {freq}\n'
         self.log(log)
+        return parameters
 
     def _configure_sigin(self, sigin: int = 0, ac: int = 1, imp50: int = 1,
                                              diff: int = 0, range: float = .01):
@@ -205,8 +281,7 @@ class ZurichLockin(Device):
                    [f'/{self._devname}/sigins/{sigin}/range', range]]
 
         # Push settings to lock-in
-        self._server.set(sig_set)
-        self._server.sync()
+        self.apply_settings(sig_set)
 
         # Update object copy of parameters and logs
         self._cond_vars[f'sigin{sigin}'] = { 'enable' : 1,
@@ -235,8 +310,7 @@ class ZurichLockin(Device):
         sig_set = [[f'/{self._devname}/sigouts/{sigout}/on', on],
                    [f'/{self._devname}/sigouts/{sigout}/add', add],
                    [f'/{self._devname}/sigouts/{sigout}/range', range]]
-        self._server.set(sig_set)
-        self._server.sync()
+        self.apply_settings(sig_set)
 
     def _get_config(self):
         """! Return current lock-in parameter configuration.
@@ -253,9 +327,11 @@ class ZurichLockin(Device):
         elif param == 'freq_osc1':
             parameters = [[f'/{self._devname}/oscs/1/freq', float(val)]]
 
-        # Push settings to lock-in
-        self._server.set(parameters)
-        self._server.sync()
+        else:
+            return
+
+        # Push settings to lock-in, if they differ
+        self.apply_settings(parameters)
 
     # DAQ management (Imaging)
     ############################################################################
@@ -270,68 +346,115 @@ class ZurichLockin(Device):
         will automatically be displayed on the GUI with no further input from
         the user.
         """
+        self._daq.stop = False
         self._daq_thread.started.connect(self._daq.start)
         self._daq_thread.start()
 
     def stop_daq(self):
         self._daq.stop = True
 
-    def _image_data(self, data):
-        self.data.emit('Image', data)
+    def _image_data(self, slot: int, sequence: int, timestamp: float):
+        """! Relay a completed frame by its slot in the DAQ's frame ring."""
+        self.data.emit('Image', (slot, sequence))
+
+    @property
+    def frames(self):
+        """! (FrameRing) The DAQ's completed frames, or None before
+        connecting.
+        """
+        return None if self._daq is None else self._daq.ring
+
+    def start_spool(self, directory: str, segment_frames: int = None) -> FrameSpool:
+        """! Spool every DAQ frame to memory-mapped raw files as well, on the
+        DAQ thread as it arrives. Frames then survive a crash of the
+        application and are never held up by compression. Convert the spool
+        with utilities.framespool.consolidate once it is stopped.
+        @param directory (str) The spool directory, which must not exist.
+        @param segment_frames (int) Frames per spool segment. Default: see
+        FrameSpool
+        @return (FrameSpool) The spool.
+        """
+        self.stop_spool()
+        self._spool = FrameSpool(directory, self._daq.dtype, ring=self._daq.ring,
+                                 segment_frames=segment_frames)
+        self._daq.frame.connect(self._spool.consume, Qt.DirectConnection)
+        return self._spool
+
+    def stop_spool(self) -> str:
+        """! Stop spooling DAQ frames and mark the spool complete. Call once the
+        DAQ has stopped, or between frames.
+        @return (str) The spool directory, or None if not spooling.
+        """
+        if self._spool is None:
+            return None
+        self._daq.frame.disconnect(self._spool.consume)
+        self._spool.close()
+        directory, self._spool = self._spool.directory, None
+        return directory
 
     # Spectrum acquisition
     ############################################################################
-    def _poll(self, demod: int, sigin, poll_length = 0.05, timeout=500, tc=1e-3):
-        """!
+    def attach(self, server, devname: str):
+        """! Use an already connected server instead of running discovery, e.g.
+        a ZiServerSimulator.
+        @param server (ziDAQServer) The connected server.
+        @param devname (str) The lock-in device name, e.g. 'dev1292'.
         """
-        # Create ZurichDaq object and the separate thread it runs on
-        # The ZurichDaq has a dataAcquisitionModule which also runs on an
-        # independent thread. This allows the ZurichDaq to do continuous
-        # polling of the dataAcquisitionModule while that in turn reads
-        # continuously from the physical device itself
-        self._daq_thread = QThread()
-        self._daq = ZurichDaq(self._server.dataAcquisitionModule(),
-                    self._devname, f'/{self._devname}/demods/0/sample')
-        self._daq.moveToThread(self._daq_thread)
-
-        # Connect _image_data for relaying information to controller and
-        # gui
-        self._daq.data.connect(self._image_data)
-
-        # Connect signal/slots for shutdown to thread signal/slots
-        # Thread shutdown occurs in the ZurichLockin exit routine below
-        self._daq.shutdown.connect(self._daq_thread.quit)
-        self._daq.shutdown.pconnect(self._daq.exit)
-        self._daq_thread.finished.connect(self._daq_thread.deleteLater)
-
-        flat_dictionary_key = True
-        path = '/%s/DEMODS/0' % (self._name)
+        self._server = server
+        self._devname = devname
+        self._isconnected = True
 
-        self.server.setDouble('%s/timeconstant' % (path), tc)
-        self.server.sync()
-
-        self.server.subscribe(path)
-        self.server.sync()
+    def begin_records(self, demod: int = 0):
+        """! Subscribe to a demodulator's sample stream for record.
+        @param demod (int) Index of the demodulator. Default: 0
+        """
+        self._server.subscribe(f'/{self._devname}/demods/{demod}/sample')
+        self._server.sync()
 
-        # Need to flush before subscribing
+    def end_records(self, demod: int = 0):
+        """! Unsubscribe from a demodulator's sample stream.
+        @param demod (int) Index of the demodulator. Default: 0
+        """
+        self._server.unsubscribe(f'/{self._devname}/demods/{demod}/sample')
 
-        try:
-            data = self.server.poll(poll_length, timeout, 1, flat_dictionary_key)
-            if '%s/sample' % (path) in data:
-                x = np.array(data['%s/sample' % (path)]['x'])
-                y = np.array(data['%s/sample' % (path)]['y'])
-                frame = np.array(data['%s/sample' % (path)]['auxin0'])
-                line = np.array(data['%s/sample' % (path)]['auxin1'])
-
-            self.last_action = 'Polled for %f s and time constant %f s' \
-                                                            % (poll_length, tc)
-        except Exception as e:
-            self.last_action = 'While polling, encountered error: %s' % (str(e))
-
-        self.server.setDouble('%s/timeconstant' % (path), self._tc)
-        self.server.sync()
-
-        return x, y, frame, line
+    def clock_offset(self) -> float:
+        """! Offset between the host's monotonic clock and the lock-in sample
+        timestamps, so samples can be placed on the same time axis as e.g.
+        delay stage moves: host time = timestamp/clockbase + offset.
+        @return (float) The offset in seconds.
+        """
+        clockbase = self._server.getDouble(f'/{self._devname}/clockbase')
+        before = time.monotonic()
+        ticks = self._server.getInt(f'/{self._devname}/status/time')
+        after = time.monotonic()
+        return (before + after)/2 - ticks/clockbase
+
+    def sample_times(self, record: dict, offset: float) -> np.ndarray:
+        """! Convert the timestamps of a record to host monotonic times.
+        @param record (dict[str]:np.ndarray) Demodulator samples from record.
+        @param offset (float) Clock offset from clock_offset.
+        @return (np.ndarray) Sample times in seconds.
+        """
+        clockbase = self._server.getDouble(f'/{self._devname}/clockbase')
+        return np.asarray(record['timestamp'], dtype=float)/clockbase + offset
+
+    def record(self, duration: float, demod: int = 0, timeout: int = 500) -> dict:
+        """! Collect a fixed length record of demodulator samples. Samples
+        acquired before the call, e.g. during a delay stage move, are
+        discarded. begin_records must have been called first.
+        @param duration (float) Recording time in seconds.
+        @param demod (int) Index of the demodulator. Default: 0
+        @param timeout (int) Poll timeout in milliseconds. Default: 500
+        @return (dict[str]:np.ndarray) The sample fields, e.g. 'timestamp',
+        'x' and 'y'.
+        """
+        path = f'/{self._devname}/demods/{demod}/sample'
+        # Discard samples buffered since the last poll
+        self._server.sync()
+        data = self._server.poll(duration, timeout, 0, True)
+        if path not in data:
+            raise APIError(f'No samples received from {path}.')
+        return data[path]
 
     # On application close
     ############################################################################
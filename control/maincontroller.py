@@ -1,12 +1,16 @@
+from .devices.device import Device
 from .devices.insight import Insight
 from .devices.delaystage import DelayStage
 from .devices.zurichlockin import ZurichLockin
-from .devices.zurichlockin import ZurichLockin
 # from .devices.pykcube import PyKcube
 from .statusreporter import StatusReporter
+from .routines.delayscan import DelayScan
+from .routines.delaysweep import DelaySweep
+from .routines.timezero import TimeZero
 from PyQt5.QtCore import pyqtSignal as Signal
 from PyQt5.QtCore import pyqtSlot as Slot
 from PyQt5.QtCore import QThread, QObject
+import threading
 import time
 
 class MainController(QObject):
@@ -20,20 +24,33 @@ class MainController(QObject):
     device_state = Signal(object, object)
 
     ## @var data
-    # (Signal) Emitted with new data for plotting/display.
+    # (Signal) Emitted with new data for plotting/display. Images are
+    # read-only views into the lock-in's frame ring, see parse_data.
     data = Signal(object)
 
     ## @var log
     # (Signal) Emitted with a message to be recorded on the GUIs log.
     log = Signal(str)
 
-    ## @var log
-    # (Signal) Emitted with a message to be recorded on the GUIs log.
-    insight_cmd = Signal(object, object)
+    ## @var error
+    # (Signal) Emitted with a message about a failure, recorded on the GUIs
+    # log at level 'ERROR'.
+    error = Signal(str)
 
-    ## @var log
-    # (Signal) Emitted with a message to be recorded on the GUIs log.
-    delaystage_cmd = Signal(object, object)
+    ## @var device_log
+    # (Signal) Relays the log records of every device: message, device name,
+    # level and time in seconds since the epoch.
+    device_log = Signal(str, str, str, float)
+
+    ## @var spectrum
+    # (Signal) Emitted with the spectrum of a delay scan or sweep as it is
+    # collected.
+    spectrum = Signal(object)
+
+    ## @var scan_result
+    # (Signal) Emitted with the name, data and parameters of a finished scan
+    # for storage in the experiment file.
+    scan_result = Signal(object, object, object)
 
     def __init__(self):
         """! The MainController class constructor."""
@@ -49,13 +66,11 @@ class MainController(QObject):
         ## @var _insight
         # Instance of the Insight device for controlling the laser.
         self._insight = Insight(name='Insight')
-        self.insight_cmd.connect(self._insight.parse_cmd)
         # self._insight.cmd_result.connect(self.log)
 
         ## @var _delaystage
         # Instance of the DelayStage device for controlling the delay stage.
         self._delaystage = DelayStage(name='Delay Stage')
-        self.delaystage_cmd.connect(self._delaystage.parse_cmd)
         # self._delaystage.cmd_result.connect(self.log)
 
         ## @var _zi
@@ -64,17 +79,19 @@ class MainController(QObject):
         # self._kcube = PyKcube()
         # self._dmd = DMD()
 
+        ## @var _devices
+        # (dict[str]:Device) Devices keyed by the name used in GUI commands.
+        self._devices = {'Insight': self._insight,
+                         'Delay Stage': self._delaystage,
+                         'Lockin': self._zi}
+
         # Connect all devices' independent state Signals to the controllers
         # global device_state Signal
         self._insight.state.connect(self.device_state)
         self._delaystage.state.connect(self.device_state)
         self._zi.state.connect(self.device_state)
-
-        # Connect all devices' independent cmd_result Signals to the controller
-        self._insight.cmd_result.connect(self._read_result)
-        self._delaystage.cmd_result.connect(self._read_result)
-        self._zi.cmd_result.connect(self._read_result)
-        # self.cmd_result = ''
+        for device in self._devices.values():
+            device.log_record.connect(self.device_log)
 
         # Connect the ZI's data Signal to the controller's parse_data to
         # take the appropriate action with it.
@@ -101,69 +118,107 @@ class MainController(QObject):
         # Start the query thread
         self._status_thread.start()
 
+        ## @var _scan
+        # (DelayScan, DelaySweep or TimeZero) The delay scan in progress, or None.
+        self._scan = None
+
+        ## @var t0
+        # (float) Delay stage position of time zero in mm from the last T0
+        # calibration, or None. Stored with every later scan.
+        self.t0 = None
+
     def init_devices(self):
         """! Run the startup procedure for the various devices and handle
         any messages/errors.
         """
         msg = 'Opening communication with Insight....\n\t\t'
-        self._insight.open()
-        msg += self.cmd_result
+        msg += self._insight.submit(self._insight.open).result()
         self.log.emit(msg)
 
         msg = 'Opening communication with the Delay Stage....\n\t\t'
-        self._delaystage.open()
-        msg += self.cmd_result
+        msg += self._delaystage.submit(self._delaystage.open).result()
         self.log.emit(msg)
 
         msg = 'Opening communication with the Lockin....\n\t\t'
-        self._zi.open()
-        msg += self.cmd_result
+        msg += self._zi.submit(self._zi.open).result()
         self.log.emit(msg)
 
-    def _read_result(self, msg):
-        """! Receive the result of the last action taken."""
-        ## @var cmd_result
-        # Holds the result of the last attempted action on any device.
-        self.cmd_result = msg
+    def _report_result(self, device, param, future):
+        """! Log the outcome of a command once its future completes. Runs on
+        the device's I/O worker thread; the log Signal relays it to the GUI.
+        @param device (str) The device the command was sent to.
+        @param param (str) The parameter the command affected.
+        @param future (Future) The completed command.
+        """
+        if future.cancelled():
+            self.log.emit(f'{device} command - {param}: cancelled.')
+        elif future.exception() is not None:
+            self.error.emit(f'{device} command - {param} failed: {future.exception()}')
+        elif future.result() is not None:
+            self.log.emit(f'{device}: {future.result()}')
 
     def parse_data(self, type, data):
         """! Appropriately package data for display as the multiple types of
         output (images, plots, etc) may be expected.
         """
         if type == 'Image':
-            self.data.emit(data)
+            # Frames arrive as a slot in the lock-in's frame ring. Only a
+            # read-only view is passed on; frames overwritten before the GUI
+            # got to them are skipped (and counted by the ring).
+            # The display is best-effort: the view is not checked with
+            # FrameRing.valid after it is drawn, so a frame overwritten while
+            # the GUI draws it may show part of a newer one until the next
+            # frame. Its overrun is not counted. Consumers which need intact
+            # frames, such as FrameSpool, copy the frame and check valid.
+            frame = self._zi.frames.frame(*data)
+            if frame is not None:
+                # The first channel is displayed, columns along x
+                self.data.emit(frame[frame.dtype.names[0]].T)
 
     # def parse_signal(self, mw, device: str, parameter: str, val: str):
     def distribute_cmd(self, device, param, val):
         """! Parse messages from the GUI and pass them to the appropriate
-        devices."""
+        devices. Device commands are queued on the device's I/O worker at
+        Device.USER priority, ahead of any pending status queries.
+        @param device (str) The device to communicate with.
+        @param param (str) The parameter affected.
+        @param val The value to input.
+        @return (Future) The queued command, completing with its result, or
+        None for commands which are not sent to a device.
+        """
         # MainWindow emits a signal with a reference to GUI component, the device
         # to communicate with, the parameter affected, and the value to input
         # MainWindow refernce is passed in order to communicate back the
         # response from the device
         # Each device case is handled by separate function
         # Can't use match-case because computer running software is too old
+        if param == 'snapshot' and device in self._devices:
+            # Request for the full state, e.g. from a newly shown panel. No
+            # device I/O is needed, so it is not queued.
+            self._devices[device].snapshot()
+            return
+
         self.log.emit(f'Attempting {device} command - {param}: {val}')
-        self._reporter.pause = True
         if device == 'Global':
             resp = self.global_control(param, val)
 
-        elif device == 'Insight':
-            # resp = 'Insight: Not configured yet'
-            self.insight_cmd.emit(param, val)
-
-        elif device == 'Delay Stage':
-            self.delaystage_cmd.emit(param, val)
+        elif device in ('Insight', 'Delay Stage'):
+            dev = self._devices[device]
+            future = dev.submit(dev.parse_cmd, param, val, priority=Device.USER)
+            future.add_done_callback(lambda f: self._report_result(device, param, f))
+            return future
 
         elif device == 'Lockin':
             resp = 'Not configured yet'
 
+        elif device == 'Spectrum':
+            self.log.emit(self.spectrum_control(param, val))
+
         elif device == 'kcube':
             resp = 'Not configured yet'
 
         # self.log.emit('Functionality not implemented. Request failed.')
         # mw.statusbar = resp
-        self._reporter.pause = False
 
     def global_control(self, parameter: str, val: str) -> str:
         """! Manage device responses to what are currently called "global"
@@ -179,6 +234,88 @@ class MainController(QObject):
             resp = 'Delay Stage COM Port changed to: {}'.format(str(val))
         return resp
 
+    # Spectrum acquisition
+    ############################################################################
+    def spectrum_control(self, param, val) -> str:
+        """! Start or abort a delay scan, sweep or T0 calibration.
+        @param param (str) 'delay_scan', 'delay_sweep', 't0' or 'abort'.
+        @param val For 'delay_scan', a tuple of the start and end positions,
+        number of steps and dwell time in seconds. For 'delay_sweep', a tuple
+        of the start and end positions, number of bins and the sweep velocity
+        in mm/s (None for the current velocity). For 't0', a tuple of the start
+        and end positions of the search.
+        @return (str) A message describing the result.
+        """
+        if param in ('delay_scan', 'delay_sweep', 't0') and self._scan is not None:
+            return 'Delay scan not started. A scan is already running.'
+        if param == 'delay_scan':
+            start, end, steps, dwell = val
+            self._scan = DelayScan(self._delaystage, self._zi,
+                                   DelayScan.positions(start, end, steps),
+                                   dwell=dwell, progress=self.spectrum.emit)
+            attrs = {'dwell': dwell, 'demod': self._scan.demod}
+            msg = f'Delay scan started: {steps} steps from {start} to {end} mm.'
+        elif param == 'delay_sweep':
+            start, end, bins, vel = val
+            self._scan = DelaySweep(self._delaystage, self._zi, start, end, bins,
+                                    vel=vel, progress=self.spectrum.emit)
+            attrs = {'vel': vel if vel is not None else float('nan'),
+                     'lag': self._scan.lag, 'demod': self._scan.demod}
+            msg = f'Delay sweep started: {bins} bins from {start} to {end} mm.'
+        elif param == 't0':
+            start, end = val
+            self._scan = TimeZero(self._delaystage, self._zi, start, end,
+                                  progress=self.spectrum.emit)
+            attrs = {'dwell': self._scan.dwell, 'tol': self._scan.tol,
+                     'demod': self._scan.demod}
+            msg = f'T0 calibration started between {start} and {end} mm.'
+        elif param == 'abort':
+            if self._scan is None:
+                return 'No delay scan running.'
+            self._scan.abort()
+            return 'Aborting delay scan.'
+        else:
+            return f'Unknown spectrum command: {param}'
+        threading.Thread(target=self._run_scan, args=(param, attrs), daemon=True,
+                         name='Delay scan').start()
+        return msg
+
+    def _run_scan(self, kind, attrs):
+        """! Run the current delay scan or sweep on its own thread and emit the
+        result.
+        @param kind (str) 'delay_scan', 'delay_sweep' or 't0', used to name the
+        result.
+        @param attrs (dict) Scan parameters stored with the result.
+        """
+        scan = self._scan
+        name = f'{kind}_{time.strftime("%Y%m%d-%H%M%S")}'
+        start = time.perf_counter()
+        try:
+            data = scan.run()
+            if kind == 't0' and scan.position is None:
+                # An aborted calibration leaves the previous T0 in place
+                self.spectrum.emit(data)
+                self.log.emit('T0 calibration aborted. T0 unchanged.')
+                return
+            if kind == 'delay_sweep' and scan.aborted:
+                self.log.emit('Delay sweep aborted. Nothing saved.')
+                return
+            if kind == 't0':
+                self.t0 = scan.position
+                attrs.update(position=scan.position, fwhm=scan.fwhm)
+                self.log.emit(f'T0 found at {scan.position:.4f} mm. '
+                              f'Cross-correlation FWHM: {scan.fwhm:.4f} mm.')
+            elif self.t0 is not None:
+                attrs['t0'] = self.t0
+            self.spectrum.emit(data)
+            self.scan_result.emit(name, data, attrs)
+            self.log.emit(f'Delay scan finished in {time.perf_counter() - start:.1f} s. '
+                          f'Saved as {name}.')
+        except Exception as err:
+            self.error.emit(f'Delay scan failed: {str(err)}')
+        finally:
+            self._scan = None
+
     def return_device_conditions(self):
         """! Method will be deprecated."""
         return self._insight.cond_vars
@@ -190,12 +327,20 @@ class MainController(QObject):
         self.running = False
         print('Shutting down query thread.')
         print('....Exiting device status thread.\n')
+        if self._scan is not None:
+            self._scan.abort()
+        self._reporter.stop()
         self._status_thread.quit()
         print('Closing devices connections....')
-        print('....Insight.')
-        self._insight.exit()
-        print('....Delay stage.')
-        self._delaystage.exit()
-        print('....ZI lock-in.')
-        self._zi.exit()
+        # Each exit routine is queued behind any outstanding user commands,
+        # after which the device's I/O worker is stopped.
+        for label, device in (('Insight', self._insight),
+                              ('Delay stage', self._delaystage),
+                              ('ZI lock-in', self._zi)):
+            print(f'....{label}.')
+            try:
+                device.submit(device.exit).result(timeout=10)
+            except Exception as err:
+                print(f'........Error during shutdown: {str(err)}')
+            device.shutdown()
         # print('....KCube connection closed.')
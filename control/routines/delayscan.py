@@ -0,0 +1,123 @@
+"""!
+@brief Definition of the DelayScan class for collecting spectral focusing
+spectra by stepping the delay stage and recording the lock-in at each step.
+
+Classes:
+DelayScan
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import numpy as np
+
+class DelayScan:
+    """! Delay stage step scan synchronized with the lock-in amplifier.
+
+    At each position in turn the stage is moved, a fixed length record is
+    collected from the lock-in, and the record is reduced to one point of the
+    spectrum. The move to the next position starts as soon as a record is
+    collected, so the reduction of a step runs while the stage moves to the
+    next one. Stage and lock-in I/O run on the devices' own I/O workers;
+    run blocks until the scan is finished, so it must not be called from
+    either of them.
+
+    Methods:
+    --------
+    run() : Perform the scan and return the spectrum.
+    abort() : End the scan after the current step.
+    positions(start, end, steps) : Evenly spaced scan positions.
+    """
+    ## @var dtype
+    # (np.dtype) Fields of each point of the returned spectrum. setpoint is the
+    # requested position, pos the position reported after the move, x, y and r
+    # the mean demodulator output, r_std the standard deviation of R and
+    # samples the number of lock-in samples averaged.
+    dtype = np.dtype([('setpoint', 'f8'), ('pos', 'f8'), ('x', 'f8'),
+                      ('y', 'f8'), ('r', 'f8'), ('r_std', 'f8'),
+                      ('samples', 'i8')])
+
+    def __init__(self, stage, lockin, positions, dwell: float = 0.01,
+                 demod: int = 0, progress=None):
+        """! The DelayScan initializer.
+        @param stage (DelayStage) The delay stage.
+        @param lockin (ZurichLockin) The lock-in amplifier.
+        @param positions (list[float]) Stage positions to visit, in order.
+        @param dwell (float) Lock-in record length at each step in seconds.
+        Default: 0.01
+        @param demod (int) Index of the demodulator to record. Default: 0
+        @param progress Optional callable, passed the spectrum after each step
+        is reduced. Points not yet collected are NaN. Called from the
+        reduction thread.
+        """
+        self.stage = stage
+        self.lockin = lockin
+        self.dwell = dwell
+        self.demod = demod
+        self.progress = progress
+
+        ## @var data
+        # (np.ndarray) The spectrum, filled in as the scan progresses.
+        self.data = np.zeros(len(positions), dtype=self.dtype)
+        for field in ('pos', 'x', 'y', 'r', 'r_std'):
+            self.data[field] = np.nan
+        self.data['setpoint'] = positions
+
+        ## @var _abort
+        # (Event) Set to end the scan after the current step.
+        self._abort = threading.Event()
+
+    @staticmethod
+    def positions(start: float, end: float, steps: int) -> np.ndarray:
+        """! Evenly spaced scan positions, including both ends.
+        @param start (float) First position in mm.
+        @param end (float) Last position in mm.
+        @param steps (int) Number of positions.
+        @return (np.ndarray) The positions.
+        """
+        return np.linspace(start, end, int(steps))
+
+    def abort(self):
+        """! End the scan after the current step."""
+        self._abort.set()
+
+    def run(self) -> np.ndarray:
+        """! Perform the scan.
+        @return (np.ndarray) The spectrum, see dtype. Points not collected
+        because the scan was aborted are NaN.
+        """
+        setpoints = self.data['setpoint']
+        reductions = []
+        self.lockin.submit(self.lockin.begin_records, self.demod).result()
+        try:
+            with ThreadPoolExecutor(max_workers=1) as reducer:
+                move = self.stage.move_absolute(setpoints[0])
+                for i in range(len(setpoints)):
+                    pos = move.result()
+                    record = self.lockin.submit(self.lockin.record, self.dwell,
+                                                self.demod).result()
+                    # Start the next move before reducing this step
+                    if i + 1 < len(setpoints) and not self._abort.is_set():
+                        move = self.stage.move_absolute(setpoints[i + 1])
+                    reductions.append(reducer.submit(self._reduce, i, pos, record))
+                    if self._abort.is_set():
+                        break
+            # Re-raise any error from the reduction
+            for reduction in reductions:
+                reduction.result()
+        finally:
+            self.lockin.submit(self.lockin.end_records, self.demod)
+        return self.data
+
+    def _reduce(self, i: int, pos: float, record: dict):
+        """! Reduce one lock-in record to a point of the spectrum.
+        @param i (int) Index of the step.
+        @param pos (float) The stage position during the record.
+        @param record (dict[str]:np.ndarray) The demodulator samples.
+        """
+        x = np.asarray(record['x'])
+        y = np.asarray(record['y'])
+        r = np.hypot(x, y)
+        self.data[i] = (self.data['setpoint'][i], pos, x.mean(), y.mean(),
+                        r.mean(), r.std(), len(r))
+        if self.progress is not None:
+            self.progress(self.data)
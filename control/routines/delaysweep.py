@@ -0,0 +1,229 @@
+"""!
+@brief Definition of the DelaySweep class for collecting spectral focusing
+spectra in a single continuous delay stage sweep.
+
+Classes:
+DelaySweep
+"""
+
+from .delayscan import DelayScan
+from concurrent.futures import CancelledError
+import numpy as np
+import threading
+import time
+
+class DelaySweep:
+    """! Continuous ("on the fly") delay acquisition.
+
+    The stage moves across the whole range in one move while the lock-in
+    streams demodulator samples. The position of every sample is reconstructed
+    from the move's velocity profile and the time the move command was sent
+    (see DelayStage.positions_at), after converting the lock-in timestamps to
+    the host clock. The delay before the stage starts to follow the profile is
+    fitted to positions read during the move. The samples are then binned
+    onto the delay grid in one vectorized step. Unlike a step scan, the stage
+    settles only once. run blocks until the sweep is finished, so it must not
+    be called from the devices' I/O workers.
+
+    Methods:
+    --------
+    run() : Perform the sweep and return the spectrum.
+    abort() : Stop the stage, ending the sweep.
+    aborted : Whether the sweep was aborted.
+    bin(pos, x, y, edges) : Bin samples onto a position grid.
+    fit_shift(stage, motion, times, positions) : Fit the move's start delay.
+    """
+    ## @var dtype
+    # (np.dtype) Fields of each bin, as for DelayScan. setpoint is the bin
+    # centre and pos the mean reconstructed position of the samples in it.
+    dtype = DelayScan.dtype
+
+    ## @var lead
+    # (float) Time in seconds the lock-in records before the move starts and
+    # after it is predicted to end.
+    lead = 0.05
+
+    def __init__(self, stage, lockin, start: float, end: float, bins: int,
+                 vel: float = None, lag: float = 0., demod: int = 0,
+                 progress=None):
+        """! The DelaySweep initializer.
+        @param stage (DelayStage) The delay stage.
+        @param lockin (ZurichLockin) The lock-in amplifier.
+        @param start (float) Position the sweep starts from in mm.
+        @param end (float) Position the sweep ends at in mm.
+        @param bins (int) Number of positions in the spectrum.
+        @param vel (float) Stage velocity in mm/s during the sweep. The previous
+        velocity is restored afterwards. Default: the current velocity.
+        @param lag (float) Delay in seconds of the lock-in output relative to
+        the signal, e.g. from the demodulator filter, subtracted from the sample
+        times. Default: 0
+        @param demod (int) Index of the demodulator to record. Default: 0
+        @param progress Optional callable, passed the spectrum once binned.
+        """
+        self.stage = stage
+        self.lockin = lockin
+        self.start = start
+        self.end = end
+        self.vel = vel
+        self.lag = lag
+        self.demod = demod
+        self.progress = progress
+
+        ## @var edges
+        # (np.ndarray) Bin edges in mm.
+        self.edges = np.linspace(start, end, int(bins) + 1)
+
+        ## @var data
+        # (np.ndarray) The spectrum, see dtype.
+        self.data = self.bin(np.empty(0), np.empty(0), np.empty(0), self.edges)
+
+        ## @var _motion
+        # (Future) The move to the start position, then the sweep move.
+        self._motion = None
+
+        ## @var _abort
+        # (threading.Event) Set to end the sweep.
+        self._abort = threading.Event()
+
+    @classmethod
+    def bin(cls, pos, x, y, edges) -> np.ndarray:
+        """! Average samples onto a position grid.
+        @param pos (np.ndarray) Position of each sample in mm. NaN positions
+        are ignored.
+        @param x (np.ndarray) Demodulator x of each sample.
+        @param y (np.ndarray) Demodulator y of each sample.
+        @param edges (np.ndarray) Monotonic bin edges in mm.
+        @return (np.ndarray) One point per bin, see dtype. Empty bins are NaN.
+        """
+        n = len(edges) - 1
+        idx = np.digitize(pos, edges) - 1
+        # Samples exactly at the final edge belong to the last bin
+        idx[pos == edges[-1]] = n - 1
+        valid = (idx >= 0) & (idx < n)
+        idx = idx[valid]
+        x, y, pos = x[valid], y[valid], pos[valid]
+        r = np.hypot(x, y)
+
+        counts = np.bincount(idx, minlength=n)
+        def mean(w):
+            return np.bincount(idx, weights=w, minlength=n)/counts
+
+        data = np.zeros(n, dtype=cls.dtype)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            data['setpoint'] = (edges[:-1] + edges[1:])/2
+            data['pos'] = mean(pos)
+            data['x'] = mean(x)
+            data['y'] = mean(y)
+            data['r'] = mean(r)
+            data['r_std'] = np.sqrt(np.maximum(mean(r**2) - data['r']**2, 0))
+        data['samples'] = counts
+        return data
+
+    def _track(self, motion) -> tuple:
+        """! Read the stage position repeatedly until a move finishes.
+        @param motion (Future) The move.
+        @return (tuple[np.ndarray]) Monotonic times in seconds, taken midway
+        through each query, and positions in mm.
+        """
+        times, positions = [], []
+        while not motion.done():
+            before = time.monotonic()
+            resp = self.stage.submit(self.stage.query, '1TP?').result()
+            times.append((before + time.monotonic())/2)
+            positions.append(float(resp[3:]))
+        return np.array(times), np.array(positions)
+
+    @staticmethod
+    def fit_shift(stage, motion, times, positions, span: float = 0.05,
+                  resolution: float = 1e-4) -> float:
+        """! Fit the delay between sending a move and the stage starting to
+        follow its velocity profile, e.g. from command transfer and processing
+        time, to positions read during the move.
+        @param stage (DelayStage) The delay stage.
+        @param motion (Future) The move.
+        @param times (np.ndarray) Monotonic times of the position readings.
+        @param positions (np.ndarray) Positions read in mm.
+        @param span (float) Largest delay considered, in seconds. Default: 0.05
+        @param resolution (float) Step between delays tried, in seconds.
+        Default: 1e-4
+        @return (float) The delay in seconds, 0 if there are no readings.
+        """
+        if len(times) == 0:
+            return 0.
+        shifts = np.arange(-span, span + resolution, resolution)
+        model = stage.positions_at(motion, times[None, :] - shifts[:, None],
+                                   clip=True)
+        return float(shifts[np.argmin(((model - positions)**2).sum(axis=1))])
+
+    def abort(self):
+        """! End the sweep, stopping the stage if it is moving. The spectrum is
+        then left empty.
+        """
+        self._abort.set()
+        if self._motion is not None and not self._motion.done():
+            self.stage.stop()
+
+    @property
+    def aborted(self) -> bool:
+        return self._abort.is_set()
+
+    def _move(self, pos) -> bool:
+        """! Start a move, stopping it straight away if the sweep was aborted
+        meanwhile.
+        @param pos (float) The absolute position to move to in mm.
+        @return (bool) False if the sweep was aborted.
+        """
+        self._motion = self.stage.move_absolute(pos)
+        if self._abort.is_set():
+            self.stage.stop()
+        return not self._abort.is_set()
+
+    def _wait(self) -> bool:
+        """! Wait for the current move to finish. A move cancelled, e.g. by
+        abort or a stop from the GUI, aborts the sweep.
+        @return (bool) False if the sweep was aborted.
+        """
+        try:
+            self._motion.result()
+        except CancelledError:
+            self._abort.set()
+        return not self._abort.is_set()
+
+    def run(self) -> np.ndarray:
+        """! Perform the sweep.
+        @return (np.ndarray) The spectrum, see dtype. Empty if the sweep was
+        aborted.
+        """
+        if not (self._move(self.start) and self._wait()):
+            return self.data
+        restore = None
+        if self.vel is not None:
+            restore = self.stage.submit(self.stage.velocity).result()
+            self.stage.submit(self.stage.parse_cmd, 'vel', self.vel).result()
+        self.lockin.submit(self.lockin.begin_records, self.demod).result()
+        try:
+            offset = self.lockin.submit(self.lockin.clock_offset).result()
+            duration = self.stage.submit(self.stage.move_time,
+                                         self.end - self.start).result()
+            record = self.lockin.submit(self.lockin.record,
+                                        duration + 2*self.lead, self.demod)
+            time.sleep(self.lead)
+            if not self._move(self.end):
+                return self.data
+            readings = self._track(self._motion)
+            if not self._wait():
+                return self.data
+            samples = record.result()
+        finally:
+            self.lockin.submit(self.lockin.end_records, self.demod)
+            if restore is not None:
+                self.stage.submit(self.stage.parse_cmd, 'vel', restore)
+
+        shift = self.fit_shift(self.stage, self._motion, *readings)
+        times = self.lockin.sample_times(samples, offset) - self.lag - shift
+        pos = self.stage.positions_at(self._motion, times)
+        self.data = self.bin(pos, np.asarray(samples['x']),
+                             np.asarray(samples['y']), self.edges)
+        if self.progress is not None:
+            self.progress(self.data)
+        return self.data
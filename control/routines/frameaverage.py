@@ -0,0 +1,251 @@
+"""!
+@brief Definition of the FrameAverage class for averaging repeated image
+frames as they are acquired, optionally until a target signal to noise ratio
+is reached.
+
+Classes:
+FrameAverage
+"""
+
+import numpy as np
+
+class FrameAverage:
+    """! Online per-pixel averaging of repeated frames.
+
+    Frames are read straight from the DAQ's frame ring, without copying, and
+    accumulated into preallocated buffers. The accumulators are:
+    - the running mean and variance (Welford's algorithm);
+    - optionally, an exponential moving average, for a live view which
+      follows drifts;
+    - optionally, outlier rejection, which skips pixel values more than
+      reject standard deviations from the running mean (e.g. cosmic rays or
+      stray reflections). The mean and variance, and so the SNR and the
+      stopping rule, are then over the values kept, counted per pixel.
+
+    The per-pixel SNR is the mean over its standard error. If a target is
+    set, the stop callable is called once the chosen quantile of the
+    per-pixel SNR reaches it, e.g. to stop the DAQ. Scan time is then spent
+    until the noise is low enough, rather than on a fixed number of
+    repetitions.
+
+    For frames to be averaged on the DAQ thread as they arrive, connect
+    consume to ZurichDaq.frame with Qt.DirectConnection.
+
+    Methods:
+    --------
+    consume(slot, sequence, timestamp) : Average a frame from the ring.
+    add(frame) : Average a frame.
+    reset() : Discard all frames averaged.
+    """
+    ## @var warmup
+    # (int) Number of frames averaged before outliers are rejected and the SNR
+    # target is checked. Per-pixel noise estimated from fewer frames is too
+    # uncertain for either.
+    warmup = 10
+
+    def __init__(self, ring=None, shape: tuple = None, channel: str = None,
+                 ema: float = None, reject: float = None,
+                 target_snr: float = None, quantile: float = 0.5, stop=None):
+        """! The FrameAverage initializer.
+        @param ring (FrameRing) The frame ring consume reads from. Optional if
+        frames are passed to add.
+        @param shape (tuple[int]) Shape of a frame, or of the averaged channel
+        for structured frames. Default: from ring.
+        @param channel (str) Field averaged when frames are structured arrays,
+        e.g. 'd0_r'. Default: the first field.
+        @param ema (float) Weight of each new frame in the exponential moving
+        average, between 0 and 1. Default: no moving average.
+        @param reject (float) Threshold for outlier rejection, in standard
+        deviations. Default: no rejection.
+        @param target_snr (float) SNR at which to call stop. Default: never.
+        @param quantile (float) Quantile of the per-pixel SNR compared to the
+        target. Default: 0.5 (median)
+        @param stop Callable, called once when the target SNR is reached, e.g.
+        ZurichLockin.stop_daq.
+        """
+        self.ring = ring
+        self.channel = channel
+        self.alpha = ema
+        self.reject = reject
+        self.target_snr = target_snr
+        self.quantile = quantile
+        self.stop = stop
+        if shape is None:
+            shape = ring.shape
+            if ring.dtype.names is not None:
+                shape = shape + ring.dtype[channel or ring.dtype.names[0]].shape
+
+        ## @var count
+        # (int) Number of frames averaged.
+        self.count = 0
+
+        ## @var skipped
+        # (int) Frames overwritten in the ring before they could be averaged.
+        self.skipped = 0
+
+        ## @var rejected
+        # (int) Pixel values rejected as outliers.
+        self.rejected = 0
+
+        ## @var reached
+        # (bool) Whether the target SNR has been reached.
+        self.reached = False
+
+        ## @var _mean
+        # (np.ndarray) Running mean.
+        self._mean = np.zeros(shape)
+
+        ## @var _m2
+        # (np.ndarray) Running sum of squared deviations from the mean.
+        self._m2 = np.zeros(shape)
+
+        ## @var _ema
+        # (np.ndarray) Exponential moving average, if enabled.
+        self._ema = None if ema is None else np.zeros(shape)
+
+        ## @var _kept
+        # (np.ndarray) Number of values not rejected, if rejecting outliers.
+        self._kept = None if reject is None else np.zeros(shape, dtype=np.int64)
+
+        ## @var _delta
+        # (np.ndarray) Scratch buffer, so no memory is allocated per frame.
+        self._delta = np.zeros(shape)
+
+        ## @var _scratch
+        # (np.ndarray) Second scratch buffer.
+        self._scratch = np.zeros(shape)
+
+        ## @var _mask
+        # (np.ndarray) Scratch buffer for the values kept.
+        self._mask = None if reject is None else np.zeros(shape, dtype=bool)
+
+        ## @var _above
+        # (np.ndarray) Scratch buffer for the pixels at the target SNR.
+        self._above = None if target_snr is None else np.zeros(shape, dtype=bool)
+
+    def reset(self):
+        """! Discard all frames averaged."""
+        self.count = self.skipped = self.rejected = 0
+        self.reached = False
+        for buffer in (self._mean, self._m2, self._ema, self._kept):
+            if buffer is not None:
+                buffer.fill(0)
+
+    # Accumulation
+    ############################################################################
+    def consume(self, slot: int, sequence: int, timestamp: float = 0.):
+        """! Average a frame in place from the frame ring. Matches the
+        ZurichDaq.frame signal.
+        @param slot (int) The ring slot.
+        @param sequence (int) The frame's sequence number.
+        @param timestamp (float) Ignored.
+        """
+        frame = self.ring.frame(slot, sequence)
+        if frame is None:
+            self.skipped += 1
+            return
+        self.add(frame)
+
+    def add(self, frame: np.ndarray) -> bool:
+        """! Average a frame.
+        @param frame (np.ndarray) The frame. For structured frames, channel is
+        averaged.
+        @return (bool) True if the target SNR has been reached.
+        """
+        if frame.dtype.names is not None:
+            frame = frame[self.channel or frame.dtype.names[0]]
+        delta, scratch = self._delta, self._scratch
+
+        keep = True
+        if self.reject is not None:
+            # Reject values far from the mean of the values kept so far
+            keep = self._mask
+            np.subtract(frame, self._mean, out=delta)
+            np.abs(delta, out=delta)
+            if self.count >= self.warmup:
+                np.subtract(self._kept, 1, out=scratch)
+                np.divide(self._m2, scratch, out=scratch)
+                np.sqrt(scratch, out=scratch)
+                scratch *= self.reject
+                np.less_equal(delta, scratch, out=keep)
+                self.rejected += keep.size - int(np.count_nonzero(keep))
+            else:
+                keep.fill(True)
+            self._kept += keep
+
+        # Welford update of the mean and sum of squared deviations, of the
+        # values kept only
+        self.count += 1
+        np.subtract(frame, self._mean, out=delta)
+        np.divide(delta, self._n, out=scratch, where=keep)
+        np.add(self._mean, scratch, out=self._mean, where=keep)
+        np.subtract(frame, self._mean, out=scratch)
+        scratch *= delta
+        np.add(self._m2, scratch, out=self._m2, where=keep)
+
+        if self._ema is not None:
+            if self.count == 1:
+                np.copyto(self._ema, frame)
+            else:
+                np.subtract(frame, self._ema, out=delta)
+                delta *= self.alpha
+                self._ema += delta
+
+        if (self.target_snr is not None and not self.reached
+                and self.count >= self.warmup and self._target_reached()):
+            self.reached = True
+            if self.stop is not None:
+                self.stop()
+        return self.reached
+
+    def _target_reached(self) -> bool:
+        """! Whether the quantile of the per-pixel SNR has reached the target.
+        Compares mean^2 n (n - 1) with target^2 m2 for every pixel instead of
+        computing the SNR and its quantile, in the scratch buffers.
+        """
+        n = self._n
+        np.subtract(n, 1, out=self._delta)
+        self._delta *= n
+        np.multiply(self._mean, self._mean, out=self._scratch)
+        self._scratch *= self._delta
+        np.multiply(self._m2, self.target_snr**2, out=self._delta)
+        np.greater_equal(self._scratch, self._delta, out=self._above)
+        above = np.count_nonzero(self._above)
+        return above >= (1 - self.quantile)*self._mean.size
+
+    # Results
+    ############################################################################
+    @property
+    def _n(self):
+        """! Number of values averaged: count, or per pixel the values kept if
+        rejecting outliers.
+        """
+        return self.count if self._kept is None else self._kept
+
+    @property
+    def mean(self) -> np.ndarray:
+        """! Per-pixel mean, of the values kept if rejecting outliers."""
+        return self._mean
+
+    @property
+    def variance(self) -> np.ndarray:
+        """! Per-pixel sample variance, NaN before two values."""
+        n = self._n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(n > 1, self._m2/np.subtract(n, 1), np.nan)
+
+    @property
+    def sem(self) -> np.ndarray:
+        """! Per-pixel standard error of the mean."""
+        return np.sqrt(self.variance/np.maximum(self._n, 1))
+
+    @property
+    def snr(self) -> np.ndarray:
+        """! Per-pixel signal to noise ratio, |mean|/sem."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.abs(self._mean)/self.sem
+
+    @property
+    def ema(self) -> np.ndarray:
+        """! Exponential moving average, or None if not enabled."""
+        return self._ema
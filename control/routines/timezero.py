@@ -0,0 +1,191 @@
+"""!
+@brief Definition of the TimeZero class for finding the delay stage position
+of pump/Stokes temporal overlap (time zero).
+
+Classes:
+TimeZero
+"""
+
+from .delayscan import DelayScan
+import numpy as np
+import threading
+
+class TimeZero:
+    """! Time-zero calibration by coarse scan and golden-section refinement.
+
+    A coarse DelayScan locates the maximum of the lock-in R signal (the
+    pump/Stokes cross-correlation). The maximum is then bracketed by the
+    neighbouring coarse points and refined by golden-section search, one move
+    and one lock-in record per step, until the bracket is narrower than the
+    tolerance. This needs tens of moves instead of a dense fine scan. The width
+    of the cross-correlation is estimated by fitting a Gaussian to the points
+    above half maximum. run blocks until done, so it must not be called from
+    the devices' I/O workers.
+
+    Methods:
+    --------
+    run() : Perform the calibration and return every point measured.
+    abort() : End the calibration after the current step.
+    fit_width(pos, r) : Gaussian FWHM of a cross-correlation curve.
+    """
+    ## @var dtype
+    # (np.dtype) Fields of each point measured, as for DelayScan.
+    dtype = DelayScan.dtype
+
+    ## @var golden
+    # (float) Inverse golden ratio, the fraction of the bracket kept each step.
+    golden = (np.sqrt(5) - 1)/2
+
+    def __init__(self, stage, lockin, start: float, end: float, coarse: int = 21,
+                 tol: float = 1e-3, dwell: float = 0.01, demod: int = 0,
+                 progress=None):
+        """! The TimeZero initializer.
+        @param stage (DelayStage) The delay stage.
+        @param lockin (ZurichLockin) The lock-in amplifier.
+        @param start (float) Start of the search range in mm.
+        @param end (float) End of the search range in mm.
+        @param coarse (int) Number of points in the coarse scan. Their spacing
+        should be below the cross-correlation width. Default: 21
+        @param tol (float) Width in mm of the final bracket. Default: 1e-3
+        @param dwell (float) Lock-in record length at each point in seconds.
+        Default: 0.01
+        @param demod (int) Index of the demodulator to record. Default: 0
+        @param progress Optional callable, passed every point measured so far,
+        sorted by position, after each step.
+        """
+        self.stage = stage
+        self.lockin = lockin
+        self.start = start
+        self.end = end
+        self.coarse = coarse
+        self.tol = tol
+        self.dwell = dwell
+        self.demod = demod
+        self.progress = progress
+
+        ## @var position
+        # (float) The time-zero position in mm, once found.
+        self.position = None
+
+        ## @var fwhm
+        # (float) Full width at half maximum of the cross-correlation in mm,
+        # NaN if it could not be fitted.
+        self.fwhm = None
+
+        ## @var data
+        # (np.ndarray) Every point measured, sorted by position.
+        self.data = np.zeros(0, dtype=self.dtype)
+
+        ## @var _scan
+        # (DelayScan) The coarse scan, while it runs.
+        self._scan = None
+
+        ## @var _abort
+        # (Event) Set to end the calibration after the current step.
+        self._abort = threading.Event()
+
+    @staticmethod
+    def fit_width(pos, r) -> float:
+        """! Estimate the FWHM of a cross-correlation by fitting a parabola to
+        the logarithm of the points above half maximum (a Gaussian).
+        @param pos (np.ndarray) Positions in mm.
+        @param r (np.ndarray) Signal at each position.
+        @return (float) FWHM in mm, NaN if fewer than three points are above
+        half maximum or the curve is not peaked.
+        """
+        base = np.nanmin(r)
+        above = r - base > (np.nanmax(r) - base)/2
+        if above.sum() < 3:
+            return np.nan
+        a = np.polyfit(pos[above], np.log(r[above] - base), 2)[0]
+        if a >= 0:
+            return np.nan
+        return float(2*np.sqrt(np.log(2)/-a))
+
+    def abort(self):
+        """! End the calibration after the current step. position is then left
+        unset.
+        """
+        self._abort.set()
+        if self._scan is not None:
+            self._scan.abort()
+
+    @property
+    def aborted(self) -> bool:
+        return self._abort.is_set()
+
+    def run(self) -> np.ndarray:
+        """! Perform the calibration.
+        @return (np.ndarray) Every point measured, sorted by position. See
+        dtype. The result is in position and fwhm, which stay None if the
+        calibration was aborted.
+        @exception ValueError The coarse scan found no valid point.
+        """
+        self._scan = DelayScan(self.stage, self.lockin,
+                               DelayScan.positions(self.start, self.end, self.coarse),
+                               dwell=self.dwell, demod=self.demod)
+        points = list(self._scan.run())
+        self._scan = None
+        points = [p for p in points if not np.isnan(p['r'])]
+        self._update(points)
+        if self._abort.is_set():
+            return self.data
+        if not points:
+            raise ValueError('No valid point in the coarse scan.')
+
+        # Bracket the maximum with its neighbours
+        i = int(np.argmax([p['r'] for p in points]))
+        a = points[max(i - 1, 0)]['setpoint']
+        b = points[min(i + 1, len(points) - 1)]['setpoint']
+
+        self.lockin.submit(self.lockin.begin_records, self.demod).result()
+        try:
+            c = b - self.golden*(b - a)
+            d = a + self.golden*(b - a)
+            fc = self._measure(c, points)
+            fd = self._measure(d, points)
+            while abs(b - a) > self.tol and not self._abort.is_set():
+                if fc > fd:
+                    b, d, fd = d, c, fc
+                    c = b - self.golden*(b - a)
+                    fc = self._measure(c, points)
+                else:
+                    a, c, fc = c, d, fd
+                    d = a + self.golden*(b - a)
+                    fd = self._measure(d, points)
+        finally:
+            self.lockin.submit(self.lockin.end_records, self.demod)
+        if self._abort.is_set():
+            # The bracket was not narrowed to the tolerance
+            return self.data
+
+        self.position = float(c if fc > fd else d)
+        self.fwhm = self.fit_width(self.data['pos'], self.data['r'])
+        return self.data
+
+    def _measure(self, setpoint: float, points: list) -> float:
+        """! Move to a position and record the mean R there.
+        @param setpoint (float) The position in mm.
+        @param points (list) Points measured so far, appended to.
+        @return (float) The mean R.
+        """
+        pos = self.stage.move_absolute(setpoint).result()
+        record = self.lockin.submit(self.lockin.record, self.dwell,
+                                    self.demod).result()
+        x = np.asarray(record['x'])
+        y = np.asarray(record['y'])
+        r = np.hypot(x, y)
+        point = np.array((setpoint, pos, x.mean(), y.mean(), r.mean(), r.std(),
+                          len(r)), dtype=self.dtype)
+        points.append(point)
+        self._update(points)
+        return point['r']
+
+    def _update(self, points: list):
+        """! Store the points measured so far, sorted by position, and report
+        progress.
+        @param points (list) The points.
+        """
+        self.data = np.sort(np.array(points, dtype=self.dtype), order='pos')
+        if self.progress is not None:
+            self.progress(self.data)
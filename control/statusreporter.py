@@ -3,6 +3,7 @@
 on a separate thread for reporting device status updates.
 """
 
+from .devices.device import Device
 from PyQt5.QtCore import QThread, QObject
 from PyQt5.QtCore import pyqtSignal as Signal
 from PyQt5.QtCore import pyqtSlot as Slot
@@ -11,13 +12,19 @@ import time
 class StatusReporter(QObject):
     """! Worker class for device status querying.
 
-    Executes query functions for every device reference it is passed.
+    Submits query functions for every device reference it is passed. The
+    queries run on each device's own I/O worker at Device.STATUS priority, so
+    they always yield to pending user commands and never run concurrently
+    with them. A device is only queried once one of its parameters is due
+    for a refresh (see Device.refresh), so the loop itself can tick quickly.
     """
     shutdown = Signal()
 
-    def __init__(self, devices):
+    def __init__(self, devices, interval=0.05):
         """! The StatusReporter constructor.
         @param devices (List) A list of all devices to have their state queried.
+        @param interval (float) Time in seconds between checks for parameters
+        due for a refresh. Default: 0.05
         """
         super().__init__()
 
@@ -25,21 +32,31 @@ class StatusReporter(QObject):
         # (list) List of device references. Used only for querying status.
         self.devices = devices
 
-        ## @var pause
-        # (bool) Variable to block device status queries. Set to true while the
-        # controller/device object is communicating with the physical device.
-        self.pause = False
+        ## @var interval
+        # (float) Time in seconds between checks for due parameters.
+        self.interval = interval
+
+        ## @var running
+        # (bool) The query loop runs while this is True.
+        self.running = True
+
+        ## @var _pending
+        # (dict[str]:Future) The last status query submitted for each device.
+        # A new query is only submitted once the previous one has completed,
+        # so status requests never pile up behind slow user commands.
+        self._pending = {}
 
     def query_state(self):
-        """! Method to query device state. Runs infinitely, unless an interrupt
-        signal is received, asking devices to emit their state conditions.
+        """! Method to query device state. Runs until stop is called, asking
+        devices to emit their state conditions.
         """
-        while True:
-            time.sleep(0.5)
+        while self.running:
+            time.sleep(self.interval)
             for device in self.devices:
-                if self.pause:
-                    break
-                device.query_state()
+                pending = self._pending.get(device.name)
+                if (pending is None or pending.done()) and device.is_due():
+                    self._pending[device.name] = device.submit(device.query_state,
+                                                               priority=Device.STATUS)
 
     def add_device(self, device):
         """! Method to add a device to the query list if it was not included
@@ -47,4 +64,7 @@ class StatusReporter(QObject):
         @param device (Device) The device object to be added to the list.
         """
         self.devices.append(device)
-        self.pause = False
+
+    def stop(self):
+        """! End the query loop after the current cycle."""
+        self.running = False
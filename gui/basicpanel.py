@@ -233,7 +233,8 @@ class BasicPanel(Dock):
     # Methods for updating GUI display - may be overwritten by subclasses
     ############################################################################
     def update_state(self, params):
-        """! Slot to update status widgets.
+        """! Slot to update status widgets. Devices emit only the parameters
+        which changed, so only those widgets are updated.
         @param params Device parameters and the values to be displayed.
         """
         for param in params:
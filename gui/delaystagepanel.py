@@ -33,6 +33,7 @@ class DelayStagePanel(BasicPanel):
                        '_abs_mv' : self._abs_mv,
                        '_rel_neg' : self._rel_neg,
                        '_rel_pos' : self._rel_pos,
+                       '_stop' : self._stop,
                        '_set_vel' : self._set_vel,
                        '_set_accel' : self._set_accel }
         super().__init__(*args, **kwargs)
@@ -63,6 +64,12 @@ class DelayStagePanel(BasicPanel):
         """
         self.cmd.emit('Delay Stage', 'rel_move_pos', self.control_vars['rel_mv_box'].text())
 
+    def _stop(self):
+        """! Function associated to the button to stop a Delay Stage move in
+        progress. Emits the appropriate signal.
+        """
+        self.cmd.emit('Delay Stage', 'stop', 'RUN')
+
     def _set_vel(self):
         """! Function associated to the button and form to set the Delay Stage
         velocity. Emits the appropriate signal.
@@ -45,9 +45,10 @@ class MainWindow(QMainWindow):
     # (Signal) Emit GUI changes for parsing by the controller.
     cmd: ClassVar[Signal] = Signal(object, object, object)
 
-    ## @var log_changed
-    # (Signal) Emit log changes for parsing by the result file.
-    log_changed: ClassVar[Signal] = Signal(str)
+    ## @var log_added
+    # (Signal) Emit each new log message to be stored in the result file, with
+    # the device it concerns (none for the GUI's messages) and its level.
+    log_added: ClassVar[Signal] = Signal(str, str, str)
 
     # Signals for subcomponent GUI elements
     ############################################################################
@@ -79,6 +80,10 @@ class MainWindow(QMainWindow):
     # (Signal) Emit spectrum acquisition specific logs.
     spec_logs: ClassVar[Signal] = Signal(object)
 
+    ## @var spectrum
+    # (Signal) Relays delay scan spectra to the spectrum acquisition Dock.
+    spectrum: ClassVar[Signal] = Signal(object)
+
     def __init__(self):
         """! The MainWindow constructor."""
         super().__init__()
@@ -133,9 +138,11 @@ class MainWindow(QMainWindow):
         self._log_label.setAlignment(Qt.AlignCenter)
 
         ## @var _logs
-        # GUI element containing global logging information. This is written to
-        # the results file on closing.
+        # GUI element containing global logging information. Each message is
+        # stored in the results file as it is added, so only the most recent
+        # lines are kept here.
         self._logs: QPlainTextEdit = QPlainTextEdit()
+        self._logs.setMaximumBlockCount(10000)
         self._explorer_dock.addWidget(self._log_label, 3, 0)
         self._explorer_dock.addWidget(self._logs, 4, 0)
 
@@ -278,6 +285,7 @@ class MainWindow(QMainWindow):
         self._spec_panel.expmt_msg.connect(self.update_log)
         self._spec_panel.cmd.connect(self.cmd)
         self.spec_logs.connect(self._spec_panel.update_log)
+        self.spectrum.connect(self._spec_panel.update_data)
         # self.data.connect(self._fssrs_panel.update_data)
 
 
@@ -300,6 +308,14 @@ class MainWindow(QMainWindow):
         self._current_panel = panels[str(val)]
         self._dock_area.addDock(self._current_panel, position='right')
 
+        # Devices only emit changed parameters, so ask for the full state to
+        # populate the newly shown panel.
+        devices = { 'Insight Controls' : 'Insight',
+                    'Delay Stage Controls' : 'Delay Stage',
+                    'ZI Controls' : 'Lockin' }
+        if str(val) in devices:
+            self.cmd.emit(devices[str(val)], 'snapshot', None)
+
 
     def parse_state(self, device, params):
         """! Slot for updating device specific GUI elements, e.g. to display a
@@ -389,13 +405,21 @@ class MainWindow(QMainWindow):
         """! Setter for the statusbar. Change the message that is displayed."""
         self._statusbar.showMessage(msg)
 
-    def update_log(self, msg):
+    def update_log(self, msg, level='INFO'):
         """! Add text to the log widget.
         @param msg The text to be added to the logs.
+        @param level (str) Severity stored with the message. Default: 'INFO'
         """
         self._logs.insertPlainText('{}: {}\n'.format(time.asctime(time.localtime(time.time())),
                                                     msg))
         self.statusbar = msg
+        self.log_added.emit(msg, '', level)
+
+    def update_error(self, msg):
+        """! Add a message about a failure to the log widget.
+        @param msg The text to be added to the logs.
+        """
+        self.update_log(msg, 'ERROR')
 
     # Menubar options and actions
     ############################################################################
@@ -495,19 +519,17 @@ class MainWindow(QMainWindow):
         pass
 
     def _t0(self):
-        """! Run a time-zero calibration.
-        @todo Implement the signal parsing and multi-device coordination needed
-        to produce a time-zero calibration.
-        @todo Implement a storing mechanism for time-zero data.
+        """! Run a time-zero calibration between the delay stage start and end
+        positions entered on the Spectrum Acquisition panel. The result is
+        stored in the experiment file and with later scans.
         """
-        pass
+        self._spec_panel.t0()
 
     def _specscan(self):
-        """! Collect a spectrum using chirped lasers.
-        @todo Implement the signal parsing and multi-device coordination needed
-        to collect a chirped-laser spectrum.
+        """! Collect a spectrum using chirped lasers. Starts a delay scan with
+        the parameters entered on the Spectrum Acquisition panel.
         """
-        pass
+        self._spec_panel.scan()
 
     # Application close and cleanup
     ############################################################################
@@ -524,7 +546,4 @@ class MainWindow(QMainWindow):
         if result == QMessageBox.Yes:
             sys.stdout = sys.__stdout__
             self.update_log('Shutting down.')
-            self.log_changed.emit(self._logs.toPlainText())
-            # with open('logs.txt', 'a') as f:
-            #     f.write(self._logs.toPlainText())
             event.accept()
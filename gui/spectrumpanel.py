@@ -22,8 +22,75 @@ class SpectrumPanel(BasicPanel):
         control elements. These elements allow interaction with the associated
         device.
         """
-        self.funcs = { '_acquire' : self._acquire }
+        self.funcs = { '_acquire' : self._acquire,
+                       '_scan' : self.scan,
+                       '_sweep' : self._sweep,
+                       '_t0' : self.t0,
+                       '_abort' : self._abort }
         super().__init__(*args, **kwargs)
 
     def _acquire(self):
         pass
+
+    def scan(self):
+        """! Function associated to the button and forms to acquire a spectral
+        focusing spectrum by stepping the delay stage. Emits the appropriate
+        signal with the start and end positions, number of steps and dwell
+        time. The dwell time defaults to 0.01 s if left empty. Also a slot for
+        the Routines menu.
+        """
+        try:
+            start = float(self.control_vars['start_pos_box'].text())
+            end = float(self.control_vars['end_post_box'].text())
+            steps = int(self.control_vars['num_steps_box'].text())
+            dwell = float(self.control_vars['dwell_box'].text() or 0.01)
+        except ValueError as err:
+            self.expmt_msg.emit(f'Delay scan not started. Invalid parameters: {str(err)}')
+            return
+        self.cmd.emit('Spectrum', 'delay_scan', (start, end, steps, dwell))
+
+    def _sweep(self):
+        """! Function associated to the button and forms to acquire a spectral
+        focusing spectrum in one continuous delay stage sweep. The number of
+        steps sets the number of bins. Emits the appropriate signal. The stage's
+        current velocity is used if no sweep velocity is entered.
+        """
+        try:
+            start = float(self.control_vars['start_pos_box'].text())
+            end = float(self.control_vars['end_post_box'].text())
+            bins = int(self.control_vars['num_steps_box'].text())
+            vel = self.control_vars['sweep_vel_box'].text()
+            vel = float(vel) if vel else None
+        except ValueError as err:
+            self.expmt_msg.emit(f'Delay sweep not started. Invalid parameters: {str(err)}')
+            return
+        self.cmd.emit('Spectrum', 'delay_sweep', (start, end, bins, vel))
+
+    def t0(self):
+        """! Function associated to the button to run a time-zero calibration
+        between the delay stage start and end positions. Emits the appropriate
+        signal. Also a slot for the Routines menu.
+        """
+        try:
+            start = float(self.control_vars['start_pos_box'].text())
+            end = float(self.control_vars['end_post_box'].text())
+        except ValueError as err:
+            self.expmt_msg.emit(f'T0 calibration not started. Invalid parameters: {str(err)}')
+            return
+        self.cmd.emit('Spectrum', 't0', (start, end))
+
+    def _abort(self):
+        """! Function associated to the button to abort a delay scan. Emits the
+        appropriate signal.
+        """
+        self.cmd.emit('Spectrum', 'abort', None)
+
+    def update_data(self, data):
+        """! Slot to plot a delay scan or sweep spectrum, R against stage
+        position.
+        @param data (np.ndarray) The spectrum. Points not yet collected are NaN.
+        """
+        done = ~np.isnan(data['r'])
+        self.control_vars['spec_plot'].clear()
+        self.control_vars['spec_plot'].plot(data['setpoint'][done],
+                                            data['r'][done], symbol='o')
@@ -2,9 +2,18 @@
 @brief Useful functions for unit and type conversions, e.g. OPO wavelength to
 SRS wavenumber, switching between file formats, and loading configuration files.
 """
+import hashlib
+import json
+import os
+import time
 import h5py
+import numpy as np
 import yaml
 
+## @var _ZI_CACHE_VERSION
+# (int) Format version of the compiled ZI configuration cache.
+_ZI_CACHE_VERSION = 1
+
 def calc_omega(w_p, w_s=1040):
     """! Calculate the wavenumber given a pump and Stokes wavelength in nm.
     @param w_p (float) Pump wavelength in nm.
@@ -16,34 +25,108 @@ def calc_omega(w_p, w_s=1040):
         omega = (10000000./w_p) - (10000000./w_s)
     return omega
 
-def logstotext(h5, output):
-    """! Produces a readable text file of recorded experimental logs.
+def logstotext(h5, output, block=4096):
+    """! Produces a readable text file of recorded experimental logs. Log
+    records are read and written a block at a time, so files with long logs
+    are never decoded at once. Logs of older files, a single string, are
+    copied as they are.
     @param h5 (str) Path to the experimental hdf5 file.
     @param output Desired path for the output plain text log file.
+    @param block (int) Number of records read at a time. Default: 4096
+    """
+    with h5py.File(h5, 'r') as h5file, open(output, 'w') as f:
+        logs = h5file['logs']
+        if logs.shape == ():
+            f.write(logs[()].decode('utf-8'))
+            return
+        for start in range(0, logs.shape[0], block):
+            for record in logs[start:start + block]:
+                f.write(_format_log(record))
+
+def _format_log(record):
+    """! Format one log record as a line of text.
+    @param record (np.void) A record of ExperimentResult.log_dtype.
+    @return (str) The line, 'time [device] level: message'.
     """
-    h5file = h5py.File(h5)
-    with open(output, 'w') as f:
-        text = h5file['logs'][()].decode('utf-8')
-        f.write(text)
-
-def load_zi_yaml(self, path):
-    """! Load in the parameter hierarchy from the included configuration
-    file. One copy is loaded into a list-of-lists format which can be passed
-    directly to ZI API objects for setting parameters. A separate copy is
-    converted to a dictionary which matches the format used by other devices
-    for accessing parameters. The config file is used by the actual device
-    control object as well as GUI elements.
+    text = [field.decode('utf-8') if isinstance(field, bytes) else field
+            for field in (record['device'], record['level'], record['message'])]
+    stamp = ('-' if np.isnan(record['timestamp'])
+             else time.asctime(time.localtime(record['timestamp'])))
+    device = ' [{}]'.format(text[0]) if text[0] else ''
+    return '{}{} {}: {}\n'.format(stamp, device, text[1], text[2])
+
+def load_zi_yaml(path, cache=None):
+    """! Load in the parameter hierarchy from a ZI configuration file. One copy
+    is loaded into a list-of-lists format which can be passed directly to ZI
+    API objects for setting parameters. A separate copy is converted to a
+    dictionary which matches the format used by other devices for accessing
+    parameters. The config file is used by the actual device control object as
+    well as GUI elements.
+
+    The YAML stores every value as a pickled NumPy scalar, which is slow to
+    parse. It is compiled on first use to a typed JSON cache beside it. Later
+    loads read the cache if the YAML's size and modification time are
+    unchanged. If only the modification time differs (e.g. after a checkout),
+    a matching content hash is enough and the cache is refreshed. The YAML is
+    only parsed again when its content changes.
+    @param path (str) Path to the YAML configuration file.
+    @param cache (str) Path to the compiled cache. Default: path with the
+    extension replaced by .cache.json
     @return cond_vars_list (list[list]) All possible ZI parameters in list of
     list format. Each list is of the form [str, int/float/long] where the first
     entry is a parameter path, and the second its setting.
     @return cond_vars (dict[str]) The above list converted to a dictionary for
     easier parameter accession and to match the format used by other devices.
     """
-    with open(path, 'r') as f:
-        cond_vars_list = yaml.unsafe_load(f)
-    cond_vars = {}
-    for i in range(len(cond_vars_list)):
-        tmp = cond_vars_list[i]
-        cond_vars[tmp[0]] = tmp[1]
+    if cache is None:
+        cache = f'{os.path.splitext(path)[0]}.cache.json'
+    stat = os.stat(path)
+    source = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
 
+    compiled = None
+    try:
+        with open(cache, 'r') as f:
+            compiled = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if compiled is not None and compiled.get('version') != _ZI_CACHE_VERSION:
+        compiled = None
+    if compiled is not None and compiled['source'] != source:
+        if (compiled['source']['size'] != source['size']
+                or compiled.get('sha1') != _file_hash(path)):
+            compiled = None
+        else:
+            # Same content, touched. Refresh the cache's modification time.
+            compiled['source'] = source
+            _write_zi_cache(cache, compiled)
+
+    if compiled is None:
+        with open(path, 'r') as f:
+            nodes = yaml.unsafe_load(f)
+        compiled = {'version': _ZI_CACHE_VERSION, 'source': source,
+                    'sha1': _file_hash(path),
+                    'nodes': [[key, val.item() if hasattr(val, 'item') else val,
+                               np.asarray(val).dtype.str] for key, val in nodes]}
+        _write_zi_cache(cache, compiled)
+
+    cond_vars_list = [[key, np.dtype(dtype).type(val)]
+                      for key, val, dtype in compiled['nodes']]
+    cond_vars = {key: val for key, val in cond_vars_list}
     return cond_vars_list, cond_vars
+
+def _file_hash(path) -> str:
+    """! SHA-1 digest of a file's content."""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _write_zi_cache(cache, compiled):
+    """! Write the compiled ZI configuration, if the location is writable. The
+    file is replaced atomically so a concurrent load never reads half of it.
+    """
+    tmp = f'{cache}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(compiled, f)
+        os.replace(tmp, cache)
+    except OSError:
+        pass
@@ -4,12 +4,81 @@ useful metadata such as experimental parameters, and any log files generated.
 """
 
 import h5py
+import itertools
+import numpy as np
 import os
+import queue
+import threading
+import time
+import zlib
+
+from utilities.conversions import calc_omega
 
 class ExperimentResult:
     """The class definition of the ExperimentResult object which handles I/O
     of all data, metadata, and experiment logs.
+
+    Image frames are stored in appendable stacks: resizable datasets in the
+    stacks group, chunked along whole frames and optionally compressed.
+    Frames passed to append are queued and written by a background writer
+    thread. Acquisition and the GUI therefore never wait on disk I/O or
+    compression. The queue is bounded. If it is full, frames are dropped
+    and counted, unless the caller asks to block.
+
+    Logs are a table of records (see log_dtype), appended in batches by the
+    same writer.
+
+    Wavelength or delay series are stored as hyperspectral cubes in the cubes
+    group: the frames, chunked in tiles so that single pixel spectra and
+    whole frames are both cheap to read, plus a table of per-frame metadata.
+
+    During acquisition the file can be put in SWMR mode (start_swmr), so that
+    analysis scripts read the frames already written with LiveReader.
     """
+    ## @var queue_size
+    # (int) Frames the writer queue holds before append drops or blocks.
+    queue_size = 64
+
+    ## @var chunk_cache
+    # (int) Bytes of chunks cached per dataset when reading. Holds a full
+    # layer of tiles of a 512x512 float64 cube, so consecutive frames are read
+    # from the cache.
+    chunk_cache = 128*2**20
+
+    ## @var frame_dtype
+    # (np.dtype) Metadata of each frame of a hyperspectral cube: frame index,
+    # timestamp (s since the epoch), OPO wavelength (nm), Raman shift (cm^-1),
+    # delay stage position (mm), lock-in time constant (s) and data transfer
+    # rate (Hz), and the Insight *STB? status word.
+    frame_dtype = np.dtype([('frame', 'i8'), ('timestamp', 'f8'),
+                            ('opo_wl', 'f8'), ('shift', 'f8'), ('pos', 'f8'),
+                            ('tc', 'f8'), ('rate', 'f8'), ('stb', 'i8')])
+
+    ## @var log_dtype
+    # (np.dtype) Log records: timestamp (s since the epoch), device (empty
+    # for experiment wide messages), level and message.
+    log_dtype = np.dtype([('timestamp', 'f8'), ('device', h5py.string_dtype()),
+                          ('level', h5py.string_dtype()),
+                          ('message', h5py.string_dtype())])
+
+    ## @var log_batch
+    # (int) Log records collected before they are queued for the writer.
+    log_batch = 64
+
+    ## @var log_interval
+    # (float) Longest time in seconds a log record is held before it is
+    # queued, checked whenever a message is logged.
+    log_interval = 1.
+
+    ## @var swmr_interval
+    # (float) Longest time in seconds between flushes for SWMR readers while
+    # the writer is behind.
+    swmr_interval = 0.5
+
+    ## @var _frame_defaults
+    # (tuple) Metadata of a frame before any field is filled in.
+    _frame_defaults = (-1, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, -1)
+
     def __init__(self, path=None, name='experimentresults'):
         """! ExperimentResult class initializer.
         @param path (str) Destination path for output file. If none is provided
@@ -25,18 +94,585 @@ class ExperimentResult:
         # An hdf5 File instance for storing logs and experiment results.
 
         try:
-            self.file = h5py.File('{}/{}.h5'.format(self._path, name), 'a')
+            self._filename = '{}/{}.h5'.format(self._path, name)
+            self.file = self._open_file()
         except Exception as e:
             print('Improper path specified. Using current working directory.')
             self._path = os.getcwd()
-            self.file = h5py.File('{}/{}.h5'.format(self._path, name), 'a')
+            self._filename = '{}/{}.h5'.format(self._path, name)
+            self.file = self._open_file()
+
+        ## @var dropped
+        # (int) Frames dropped because the writer queue was full.
+        self.dropped = 0
+
+        ## @var _queue
+        # (Queue) Items waiting for the writer: tuples of (dataset path,
+        # frame) pairs.
+        self._queue = queue.Queue(self.queue_size)
+
+        ## @var _writer
+        # (Thread) The background writer, which appends to stacks, cubes and
+        # the logs.
+        self._writer = threading.Thread(target=self._write_frames, daemon=True,
+                                        name='Result writer')
+
+        ## @var _error
+        # (Exception) The last error raised while writing frames, if any.
+        self._error = None
+
+        ## @var _valid
+        # (dict[str]:int) Frames written to each dataset, by path. In SWMR
+        # mode, frames flushed for readers.
+        self._valid = {}
+
+        ## @var _live
+        # (dict[str]:int) In SWMR mode, the index in swmr/valid of each
+        # appendable dataset, by path. None otherwise.
+        self._live = None
+
+        ## @var _held_scans
+        # (list[tuple]) Scans finished in SWMR mode, written when it ends.
+        self._held_scans = []
+
+        ## @var _cube_frames
+        # (dict[str]:int) Frames queued for each cube, for the frame index.
+        self._cube_frames = {}
+
+        ## @var _log_rows
+        # (list[tuple]) Log records not yet queued for the writer.
+        self._log_rows = []
+
+        ## @var _log_since
+        # (float) Monotonic time the oldest record in _log_rows was logged.
+        self._log_since = 0.
+
+        ## @var _log_lock
+        # (Lock) Guards _log_rows, as messages are logged from any thread.
+        self._log_lock = threading.Lock()
+
+        self._writer.start()
+        legacy = None
+        if 'logs' in self.file and self.file['logs'].shape == ():
+            # Older files store the logs as a single string
+            legacy = self.file['logs'][()]
+            del self.file['logs']
+        if 'logs' not in self.file:
+            self._create_series('logs', (), self.log_dtype, (256,), None, None,
+                                False)
+        if legacy:
+            if isinstance(legacy, bytes):
+                legacy = legacy.decode('utf-8')
+            for line in legacy.splitlines():
+                self.log(line, timestamp=np.nan)
+
+    # Logs
+    ############################################################################
+    def log(self, message, device='', level='INFO', timestamp=None):
+        """! Append a record to the logs dataset. Records are collected and
+        written by the writer thread in batches, so the cost of logging does
+        not grow with the length of the logs.
+        @param message (str) The message.
+        @param device (str) The device the message concerns. Default: none
+        @param level (str) Severity, e.g. 'INFO', 'WARNING' or 'ERROR'.
+        Default: 'INFO'
+        @param timestamp (float) Time of the message in seconds since the
+        epoch. Default: now
+        """
+        with self._log_lock:
+            if not self._log_rows:
+                self._log_since = time.monotonic()
+            self._log_rows.append((time.time() if timestamp is None else timestamp,
+                                   device, level, message))
+            if (len(self._log_rows) >= self.log_batch
+                    or time.monotonic() - self._log_since >= self.log_interval):
+                self._queue_logs(block=False)
+
+    def write_logs(self, logs):
+        """! Append logs given as text, one record per line.
+        @param logs (str) The log text.
+        """
+        for line in logs.splitlines():
+            self.log(line)
+
+    def _queue_logs(self, block):
+        """! Queue the collected log records for the writer, as one batch.
+        Called with _log_lock held. If the queue is full and block is False,
+        the records are kept and queued with a later message.
+        @param block (bool) Wait for room in the queue.
+        """
+        if not self._log_rows:
+            return
+        rows = np.array(self._log_rows, dtype=self.log_dtype)
+        try:
+            self._queue.put((('logs', rows),), block=block)
+        except queue.Full:
+            return
+        self._log_rows = []
+
+    def write_scan(self, name, data, attrs=None):
+        """! Write the result of a scan, e.g. a delay stage spectrum, as a
+        single dataset in the scans group.
+        @param name (str) Dataset name. Replaces any previous scan of that name.
+        @param data (np.ndarray) The scan result.
+        @param attrs (dict) Scan parameters stored as dataset attributes.
+        """
+        if self._live is not None:
+            # No datasets can be created in SWMR mode
+            self._held_scans.append((name, data, attrs))
+            return
+        path = 'scans/{}'.format(name)
+        if path in self.file:
+            del self.file[path]
+        dset = self.file.create_dataset(path, data=data)
+        for key, val in (attrs or {}).items():
+            dset.attrs[key] = val
+        self.file.flush()
+
+    # Image stacks
+    ############################################################################
+    def create_stack(self, name, frame_shape, dtype='f8', chunk_frames=1,
+                     compression='gzip', compression_opts=1, shuffle=True,
+                     attrs=None):
+        """! Create an appendable stack of frames, stacks/name, of shape
+        (frames, *frame_shape), initially empty.
+        @param name (str) Dataset name. Replaces any previous stack of that
+        name.
+        @param frame_shape (tuple[int]) Shape of one frame, e.g. (512, 512),
+        or () for structured frames such as ZurichDaq's.
+        @param dtype (np.dtype) Data type of a frame. Default: 'f8'
+        @param chunk_frames (int) Frames per chunk. Chunks always hold whole
+        frames. Default: 1
+        @param compression (str) 'gzip', 'lzf' or None. Default: 'gzip'
+        @param compression_opts (int) gzip level (0-9). Default: 1
+        @param shuffle (bool) Apply the byte shuffle filter before compressing,
+        which helps floating point data. Default: True
+        @param attrs (dict) Stack parameters stored as dataset attributes.
+        @return (h5py.Dataset) The stack.
+        """
+        path = 'stacks/{}'.format(name)
+        self._check_writable()
+        self.flush()
+        if path in self.file:
+            # The writer drops the frames it holds for the old stack when
+            # _create_series queues the reset
+            del self.file[path]
+        frame_shape = tuple(frame_shape)
+        return self._create_series(path, frame_shape, dtype,
+                                   (chunk_frames, *frame_shape), compression,
+                                   compression_opts, shuffle, attrs)
+
+    def append(self, name, frame, block=False):
+        """! Queue a frame to be appended to a stack by the writer thread. The
+        frame is copied, so e.g. a FrameRing slot can be reused straight away.
+        @param name (str) The stack, created with create_stack.
+        @param frame (np.ndarray) The frame.
+        @param block (bool) Wait for room in the queue instead of dropping the
+        frame if it is full. Default: False
+        @return (bool) True if queued, False if dropped.
+        """
+        return self._enqueue((('stacks/{}'.format(name), np.array(frame)),), block)
+
+    # Hyperspectral cubes
+    ############################################################################
+    def create_cube(self, name, frame_shape, dtype='f8', frames=None,
+                    tile=(64, 64), chunk_frames=32, compression='gzip',
+                    compression_opts=1, shuffle=True, stokes=1040., attrs=None):
+        """! Create an appendable hyperspectral cube in the group cubes/name:
+        - data, the frames, of shape (frames, y, x) along the Raman shift axis;
+        - frames, a table with one row of metadata per frame. See frame_dtype.
 
-        self.file['logs'][()] = ''
+        Chunks are tiles of chunk_frames x tile pixels. Reading one pixel's
+        spectrum then reads one column of tiles, and reading a frame reads
+        one layer of tiles. For 500 frames of 512x512 with the defaults, a
+        spectrum reads 16 MB instead of the whole 1 GB cube. The writer keeps
+        each layer of frames in memory until it is complete.
+        @param name (str) Cube name. Replaces any previous cube of that name.
+        @param frame_shape (tuple[int]) Shape of one frame, (y, x).
+        @param dtype (np.dtype) Data type of a frame. Default: 'f8'
+        @param frames (int) Number of frames planned, if known. Chunks are no
+        deeper than this. Default: unknown
+        @param tile (tuple[int]) Chunk size in y and x. Default: (64, 64)
+        @param chunk_frames (int) Chunk size along the shift axis. Default: 32
+        @param compression (str) 'gzip', 'lzf' or None. Default: 'gzip'
+        @param compression_opts (int) gzip level (0-9). Default: 1
+        @param shuffle (bool) Apply the byte shuffle filter before compressing.
+        Default: True
+        @param stokes (float) Stokes wavelength in nm, for the Raman shift of
+        each frame. Default: 1040
+        @param attrs (dict) Cube parameters stored as group attributes.
+        @return (h5py.Group) The cube's group.
+        """
+        path = 'cubes/{}'.format(name)
+        self._check_writable()
+        self.flush()
+        if path in self.file:
+            del self.file[path]
+        group = self.file.create_group(path)
+        self._cube_frames[name] = 0
+        group.attrs['stokes'] = stokes
+        group.attrs['axes'] = ['shift', 'y', 'x']
+        for key, val in (attrs or {}).items():
+            group.attrs[key] = val
+        if frames is not None:
+            chunk_frames = max(min(chunk_frames, frames), 1)
+        tile = tuple(min(t, n) for t, n in zip(tile, frame_shape))
+        self._create_series(path + '/data', tuple(frame_shape), dtype,
+                            (chunk_frames, *tile), compression,
+                            compression_opts, shuffle)
+        self._create_series(path + '/frames', (), self.frame_dtype, (256,),
+                            None, None, False)
+        return group
+
+    def append_cube(self, name, frame, block=False, **metadata):
+        """! Queue a frame and its metadata to be appended to a cube by the
+        writer thread. Both are written or dropped together. The frame is
+        copied.
+        @param name (str) The cube, created with create_cube.
+        @param frame (np.ndarray) The frame.
+        @param block (bool) Wait for room in the queue instead of dropping the
+        frame if it is full. Default: False
+        @param metadata Fields of the frame's metadata row, e.g. the result of
+        device_metadata. The frame index and the Raman shift (from opo_wl) are
+        filled in. Fields not given are NaN, or -1 for integers.
+        @return (bool) True if queued, False if dropped.
+        """
+        path = 'cubes/{}'.format(name)
+        row = np.array(self._frame_defaults, dtype=self.frame_dtype)
+        for key, val in metadata.items():
+            row[key] = val
+        row['frame'] = self._cube_frames.get(name, 0)
+        if np.isfinite(row['opo_wl']):
+            row['shift'] = calc_omega(float(row['opo_wl']),
+                                      self.file[path].attrs['stokes'])
+        if not self._enqueue(((path + '/data', np.array(frame)),
+                              (path + '/frames', row)), block):
+            return False
+        self._cube_frames[name] = int(row['frame']) + 1
+        return True
+
+    def read_spectrum(self, name, y, x):
+        """! The spectrum of one pixel of a cube, read tile by tile.
+        @param name (str) The cube.
+        @param y (int) Pixel row.
+        @param x (int) Pixel column.
+        @return (tuple[np.ndarray]) The Raman shift of each frame in cm^-1 and
+        the pixel's value in each frame.
+        """
+        self.flush()
+        group = self.file['cubes/{}'.format(name)]
+        return group['frames']['shift'], group['data'][:, y, x]
+
+    def read_frame(self, name, index):
+        """! One frame of a cube and its metadata.
+        @param name (str) The cube.
+        @param index (int) Frame index.
+        @return (tuple) The frame (np.ndarray) and its metadata row.
+        """
+        self.flush()
+        group = self.file['cubes/{}'.format(name)]
+        return group['data'][index], group['frames'][index]
+
+    @staticmethod
+    def device_metadata(insight=None, stage=None, lockin=None, demod=0):
+        """! Metadata of a frame from the devices' current parameters, to be
+        passed to append_cube. Devices not given and parameters not yet read
+        are left out.
+        @param insight (Insight) The laser: opo_wl and the *STB? status word.
+        @param stage (DelayStage) The delay stage: pos.
+        @param lockin (ZurichLockin) The lock-in: tc and rate of demod.
+        @param demod (int) Index of the demodulator recorded. Default: 0
+        @return (dict) Metadata fields, including the current time.
+        """
+        values = {'timestamp': time.time()}
+        if insight is not None:
+            values['opo_wl'] = insight._cond_vars.get('opo_wl')
+            values['stb'] = insight._status
+        if stage is not None:
+            values['pos'] = stage._cond_vars.get('pos')
+        if lockin is not None:
+            params = lockin._cond_vars.get('demod{}'.format(demod), {})
+            values['tc'] = params.get('tc')
+            values['rate'] = params.get('rate')
+        metadata = {}
+        for key, val in values.items():
+            try:
+                metadata[key] = float(val) if key != 'stb' else int(val)
+            except (TypeError, ValueError):
+                pass
+        return metadata
+
+    # Writer
+    ############################################################################
+    def _create_series(self, path, frame_shape, dtype, chunks, compression,
+                       compression_opts, shuffle, attrs=None):
+        """! Create an empty dataset appended to along its first axis by the
+        writer thread.
+        @return (h5py.Dataset) The dataset.
+        """
+        dset = self.file.create_dataset(
+                    path, shape=(0, *frame_shape), maxshape=(None, *frame_shape),
+                    dtype=dtype, chunks=chunks, compression=compression,
+                    compression_opts=compression_opts if compression == 'gzip' else None,
+                    shuffle=shuffle and compression is not None)
+        for key, val in (attrs or {}).items():
+            dset.attrs[key] = val
+        self._queue.put(((path, None),))
+        return dset
+
+    def _enqueue(self, item, block):
+        """! Queue (dataset path, frame) pairs for the writer, or drop them if
+        the queue is full.
+        @return (bool) True if queued, False if dropped.
+        """
+        try:
+            self._queue.put(item, block=block)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """! Wait until every queued frame has been written, including frames
+        of partly filled chunks, then flush the file.
+        @exception Exception The last error raised by the writer, if any.
+        """
+        with self._log_lock:
+            self._queue_logs(block=True)
+        self._queue.put(())
+        self._queue.join()
+        self.file.flush()
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
+
+    def _write_frames(self):
+        """! Writer thread. Each queue item is a tuple of (dataset path, frame)
+        pairs. A frame of None marks a dataset created anew, and a frame with
+        as many dimensions as its dataset is a batch of rows. Frames are
+        collected per dataset until a chunk is full and then written together.
+        A flush request, (), writes partly filled chunks too. Their frames are
+        kept, and the chunk is written again once it fills.
 
-    def write_logs(self,  logs):
-        """! Write logs to the appropriate dataset in the file."""
-        self.file['logs'][()] = logs
+        In SWMR mode, partly filled chunks are also written whenever the queue
+        is empty, so readers see every frame as soon as the writer keeps up.
+        The datasets written are flushed then, or every swmr_interval while
+        the writer is behind, before the valid frame counts are updated.
+        """
+        chunks = {}
+        written = {}
+        published = time.monotonic()
+        while True:
+            item = self._queue.get()
+            try:
+                if not item:
+                    self._write_partial(chunks, written)
+                    self._publish(written)
+                    if item is None:
+                        return
+                    continue
+                for path, frame in item:
+                    if frame is None:
+                        # The dataset was created anew
+                        chunks.pop(path, None)
+                        self._valid.pop(path, None)
+                        continue
+                    dset = self.file[path]
+                    if frame.ndim == dset.ndim:
+                        # A batch of rows, e.g. log records, written at once
+                        n = dset.shape[0]
+                        dset.resize(n + len(frame), axis=0)
+                        dset[n:] = frame
+                        written[path] = n + len(frame)
+                        continue
+                    start, frames = chunks.get(path, (dset.shape[0], []))
+                    if start > dset.shape[0]:
+                        # Frames held for a dataset since replaced without a
+                        # reset, which would otherwise be written into it
+                        start, frames = dset.shape[0], []
+                    frames.append(frame)
+                    if len(frames) == dset.chunks[0]:
+                        self._write_chunk(path, start, frames)
+                        start, frames = start + len(frames), []
+                        written[path] = start
+                    chunks[path] = (start, frames)
+                if self._live is None:
+                    self._publish(written)
+                elif self._queue.empty():
+                    self._write_partial(chunks, written)
+                    self._publish(written)
+                    published = time.monotonic()
+                elif time.monotonic() - published >= self.swmr_interval:
+                    self._publish(written)
+                    published = time.monotonic()
+            except Exception as err:
+                self._error = err
+            finally:
+                self._queue.task_done()
+
+    def _write_partial(self, chunks, written):
+        """! Write the frames of the partly filled chunks held by the writer.
+        @param chunks (dict[str]:tuple) Index of the first frame and the frames
+        held, by dataset path.
+        @param written (dict[str]:int) Frames written by dataset path, updated.
+        """
+        for path, (start, frames) in chunks.items():
+            if frames:
+                self._write_chunk(path, start, frames)
+                written[path] = start + len(frames)
+
+    def _publish(self, written):
+        """! Make frames written available through valid_frames. In SWMR mode
+        the datasets are flushed first, and then the frame counts read by
+        LiveReader, so readers never see a count ahead of the data.
+        @param written (dict[str]:int) Frames written by dataset path, since
+        the last call. Cleared.
+        """
+        if not written:
+            return
+        if self._live is not None:
+            for path in written:
+                self.file[path].flush()
+            counts = self.file['swmr/valid']
+            for path, count in written.items():
+                if path in self._live:
+                    counts[self._live[path]] = count
+            counts.flush()
+        self._valid.update(written)
+        written.clear()
+
+    def _write_chunk(self, path, start, frames):
+        """! Write the frames of one layer of chunks, starting at a chunk
+        boundary. Deflate-compressed datasets of plain (not structured) frames
+        are compressed here with zlib and written chunk by chunk with
+        write_direct_chunk. zlib releases the GIL while compressing, whereas
+        the HDF5 filter pipeline holds it, so other threads keep running.
+        @param path (str) The dataset.
+        @param start (int) Index of the first frame.
+        @param frames (list[np.ndarray]) The frames, at most one chunk deep.
+        """
+        dset = self.file[path]
+        if dset.shape[0] < start + len(frames):
+            dset.resize(start + len(frames), axis=0)
+        if dset.compression != 'gzip' or dset.dtype.names is not None:
+            dset[start:start + len(frames)] = np.stack(frames)
+            return
+        block = np.zeros((dset.chunks[0], *dset.shape[1:]), dtype=dset.dtype)
+        block[:len(frames)] = frames
+        tiles = [range(0, n, c) for n, c in zip(dset.shape[1:], dset.chunks[1:])]
+        for offset in itertools.product(*tiles):
+            index = tuple(slice(o, o + c) for o, c in zip(offset, dset.chunks[1:]))
+            chunk = block[(slice(None),) + index]
+            if chunk.shape != dset.chunks:
+                # Edge tile, padded to the full chunk
+                chunk = np.pad(chunk, [(0, c - n) for n, c
+                                       in zip(chunk.shape, dset.chunks)])
+            data = np.ascontiguousarray(chunk).view(np.uint8)
+            if dset.shuffle:
+                data = np.ascontiguousarray(data.reshape(-1, dset.dtype.itemsize).T)
+            dset.id.write_direct_chunk((start, *offset),
+                                       zlib.compress(data, dset.compression_opts))
+
+    # Live reading (SWMR)
+    ############################################################################
+    def start_swmr(self):
+        """! Let other processes read the file while it is written, in HDF5
+        single-writer/multiple-reader mode, e.g. with LiveReader. Create every
+        stack and cube needed beforehand: no datasets can be created in SWMR
+        mode. Scans finished in the meantime are held and written by end_swmr.
+
+        The group swmr holds the frame count readers may use for each
+        appendable dataset (valid, with the dataset paths as attribute paths)
+        and a flag set while the file is being written (live).
+        @exception OSError The file was created by an older HDF5 version
+        (before 1.10), which cannot be written in SWMR mode.
+        """
+        self.flush()
+        if 'swmr' in self.file:
+            del self.file['swmr']
+        paths = []
+        def appendable(name, obj):
+            if isinstance(obj, h5py.Dataset) and obj.maxshape[:1] == (None,):
+                paths.append(name)
+        self.file.visititems(appendable)
+        group = self.file.create_group('swmr')
+        valid = group.create_dataset('valid', dtype='i8',
+                                     data=[self.file[p].shape[0] for p in paths])
+        valid.attrs['paths'] = paths
+        group.create_dataset('live', data=[1], dtype='i1')
+        self.file.swmr_mode = True
+        self._live = {path: i for i, path in enumerate(paths)}
+
+    def end_swmr(self):
+        """! Leave SWMR mode once acquisition has stopped. Readers see the file
+        is no longer live. The file is reopened so that datasets can be
+        created again, and held scans are written.
+        """
+        if self._live is None:
+            return
+        self.flush()
+        self.file['swmr/live'][0] = 0
+        self.file.close()
+        self._live = None
+        # Readers may still have the file open, holding its lock. They no
+        # longer read new data once live is cleared.
+        self.file = self._open_file(locking=False)
+        for scan in self._held_scans:
+            self.write_scan(*scan)
+        self._held_scans = []
+
+    @property
+    def swmr(self) -> bool:
+        """! Whether the file is in SWMR mode."""
+        return self._live is not None
+
+    def valid_frames(self, path):
+        """! Number of frames of an appendable dataset written to the file, and
+        in SWMR mode visible to readers.
+        @param path (str) The dataset, e.g. 'stacks/frames' or
+        'cubes/name/data'.
+        @return (int) The frame count.
+        """
+        if path in self._valid:
+            return self._valid[path]
+        return self.file[path].shape[0]
+
+    def _check_writable(self):
+        """! Raise if datasets cannot be created because of SWMR mode."""
+        if self._live is not None:
+            raise RuntimeError('Datasets cannot be created in SWMR mode. '
+                               'Create them before start_swmr.')
+
+    def _open_file(self, locking=None):
+        """! Open the working file for appending. New files use the latest HDF5
+        file format, which SWMR mode requires.
+        @param locking (bool) Use file locking. Default: HDF5's default.
+        @return (h5py.File) The file.
+        """
+        return h5py.File(self._filename, 'a', libver='latest', locking=locking,
+                         rdcc_nbytes=self.chunk_cache, rdcc_nslots=10007)
+
+    def t0(self):
+        """! The time-zero position from the most recent T0 calibration stored
+        in the file, i.e. the position attribute of the last scans/t0_* dataset.
+        @return (float) Position in mm, or None if no calibration is stored.
+        """
+        if 'scans' not in self.file:
+            return None
+        names = sorted(name for name in self.file['scans'] if name.startswith('t0_'))
+        if not names:
+            return None
+        return float(self.file['scans/{}'.format(names[-1])].attrs['position'])
 
     def exit(self):
-        """! Shutdown procedure. Properly close the working file."""
+        """! Shutdown procedure. Write any queued frames and properly close the
+        working file.
+        """
+        self.end_swmr()
+        with self._log_lock:
+            self._queue_logs(block=True)
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
         self.file.close()
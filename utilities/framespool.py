@@ -0,0 +1,347 @@
+"""!
+@brief Crash-safe raw spooling of acquired frames to memory-mapped files, and
+their later consolidation into the ExperimentResult HDF5 layout.
+
+A spool is a directory holding:
+- spool.json, the header: frame dtype and shape, frames per segment, when
+  the spool was created and closed, and whether it was closed;
+- preallocated segments of raw frames, NNNNN.raw, memory-mapped while
+  written;
+- a sidecar index per segment, NNNNN.idx, with each frame's sequence number
+  and timestamp.
+
+Writing a frame is a single copy into the mapped segment, with no
+compression. The kernel writes the pages back to disk, so frames already
+spooled survive the process crashing. A frame counts only once its sequence
+number is in the index, which is written after the frame's data.
+
+Consolidation reads a spool and writes it as ordinary ExperimentResult stacks.
+It normally runs in a separate worker process (consolidate_async) or from the
+command line:
+
+    python -m utilities.framespool SPOOL [OUTPUT] [--name NAME] [--remove]
+
+Classes:
+FrameSpool
+
+Functions:
+read_spool
+consolidate
+consolidate_async
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import numpy as np
+
+from utilities.experimentresult import ExperimentResult
+
+## @var _SPOOL_VERSION
+# (int) Format version of the spool header.
+_SPOOL_VERSION = 1
+
+## @var INDEX_DTYPE
+# (np.dtype) Index entry of a spooled frame. The sequence number is -1 until
+# the frame is complete.
+INDEX_DTYPE = np.dtype([('sequence', 'i8'), ('timestamp', 'f8')])
+
+class FrameSpool:
+    """! Writer of a raw frame spool.
+
+    Frames are copied into the current segment, one slot after another. When
+    the segment is full, writing continues in the next segment, preallocated
+    while the previous one was written, and the one after is preallocated.
+    Nothing waits for the disk: the kernel writes mapped pages back in the
+    background. close() flushes the last segment and marks the spool
+    complete. A spool left incomplete by a crash can still be consolidated.
+
+    For frames to be spooled from the DAQ thread as they arrive, connect
+    consume to ZurichDaq.frame with Qt.DirectConnection.
+
+    Methods:
+    --------
+    consume(slot, sequence, timestamp) : Spool a frame from the ring.
+    write(frame, sequence, timestamp) : Spool a frame.
+    close() : Flush the last segment and mark the spool complete.
+    """
+    ## @var segment_frames
+    # (int) Default number of frames per segment.
+    segment_frames = 64
+
+    def __init__(self, directory: str, dtype, shape: tuple = (), ring=None,
+                 segment_frames: int = None):
+        """! The FrameSpool initializer. Creates the spool directory, its header
+        and the first segment.
+        @param directory (str) The spool directory. Must not exist yet.
+        @param dtype (np.dtype) Data type of a frame, e.g. ZurichDaq.dtype.
+        @param shape (tuple[int]) Shape of a frame. Default: () for structured
+        frames such as ZurichDaq's.
+        @param ring (FrameRing) The frame ring consume reads from. Optional if
+        frames are passed to write.
+        @param segment_frames (int) Frames per segment. Default: segment_frames
+        """
+        self.directory = directory
+        self.ring = ring
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        if segment_frames is not None:
+            self.segment_frames = segment_frames
+
+        ## @var created
+        # (str) ISO time the spool was created, kept in the header.
+        self.created = datetime.datetime.now().isoformat()
+
+        ## @var count
+        # (int) Frames spooled.
+        self.count = 0
+
+        ## @var _used
+        # (int) Slots used, including those of frames skipped while copying.
+        self._used = 0
+
+        ## @var skipped
+        # (int) Frames overwritten in the ring, or of a different dtype, which
+        # could not be spooled.
+        self.skipped = 0
+
+        ## @var _segment
+        # (int) Index of the current segment.
+        self._segment = 0
+
+        ## @var _maps
+        # (tuple[np.memmap]) Frames and index of the current segment.
+        self._maps = None
+
+        ## @var _next
+        # (tuple[np.memmap]) Frames and index of the preallocated next
+        # segment.
+        self._next = None
+
+        os.makedirs(directory)
+        self._write_header(complete=False)
+        self._maps = self._create_segment(0)
+        self._next = self._create_segment(1)
+
+    # Writing
+    ############################################################################
+    def consume(self, slot: int, sequence: int, timestamp: float = 0.):
+        """! Spool a frame from the frame ring. Matches the ZurichDaq.frame
+        signal.
+        @param slot (int) The ring slot.
+        @param sequence (int) The frame's sequence number.
+        @param timestamp (float) The frame's timestamp.
+        """
+        frame = self.ring.frame(slot, sequence)
+        if frame is None or frame.dtype != self.dtype:
+            self.skipped += 1
+            return
+        spool_slot = self._copy(frame)
+        if not self.ring.valid(slot, sequence):
+            # Overwritten while being copied. Leave the slot uncommitted.
+            self.skipped += 1
+            return
+        self._commit(spool_slot, sequence, timestamp)
+
+    def write(self, frame: np.ndarray, sequence: int = None, timestamp: float = 0.):
+        """! Spool a frame: copy it into the next slot, then commit its index
+        entry.
+        @param frame (np.ndarray) The frame.
+        @param sequence (int) The frame's sequence number. Default: count
+        @param timestamp (float) The frame's timestamp. Default: 0
+        """
+        slot = self._copy(frame)
+        self._commit(slot, self.count if sequence is None else sequence, timestamp)
+
+    def _copy(self, frame: np.ndarray) -> int:
+        """! Copy a frame into the next slot, rolling over to the next segment
+        if the current one is full.
+        @param frame (np.ndarray) The frame.
+        @return (int) The slot in the current segment.
+        """
+        slot = self._used % self.segment_frames
+        if slot == 0 and self._used:
+            self._roll_over()
+        self._maps[0][slot] = frame
+        self._used += 1
+        return slot
+
+    def _commit(self, slot: int, sequence: int, timestamp: float):
+        """! Write a copied frame's index entry, the sequence number last.
+        @param slot (int) The slot in the current segment.
+        @param sequence (int) The frame's sequence number.
+        @param timestamp (float) The frame's timestamp.
+        """
+        index = self._maps[1]
+        index['timestamp'][slot] = timestamp
+        index['sequence'][slot] = sequence
+        self.count += 1
+
+    def close(self):
+        """! Flush the last segment, remove the unused preallocated segment
+        and mark the spool complete.
+        """
+        if self._maps is None:
+            return
+        for mapped in self._maps:
+            mapped.flush()
+        self._maps = None
+        self._next = None
+        for ext in ('raw', 'idx'):
+            os.remove(self._segment_path(self._segment + 1, ext))
+        self._write_header(complete=True)
+
+    def _roll_over(self):
+        """! Switch to the preallocated next segment and preallocate the one
+        after. The full segment is unmapped without waiting for it to reach
+        the disk.
+        """
+        self._segment += 1
+        self._maps = self._next
+        self._next = self._create_segment(self._segment + 1)
+
+    # Files
+    ############################################################################
+    def _segment_path(self, segment: int, ext: str) -> str:
+        return os.path.join(self.directory, f'{segment:05d}.{ext}')
+
+    def _create_segment(self, segment: int) -> tuple:
+        """! Preallocate a segment. The frame file is sparse until written.
+        @param segment (int) Index of the segment.
+        @return (tuple[np.memmap]) Its frames and index, mapped.
+        """
+        frames = np.memmap(self._segment_path(segment, 'raw'), dtype=self.dtype,
+                           mode='w+', shape=(self.segment_frames, *self.shape))
+        index = np.memmap(self._segment_path(segment, 'idx'), dtype=INDEX_DTYPE,
+                          mode='w+', shape=(self.segment_frames,))
+        index['sequence'] = -1
+        return frames, index
+
+    def _write_header(self, complete: bool):
+        """! Write spool.json, replacing it atomically.
+        @param complete (bool) Whether the spool is closed.
+        """
+        header = {'version': _SPOOL_VERSION,
+                  'dtype': np.lib.format.dtype_to_descr(self.dtype),
+                  'shape': list(self.shape),
+                  'segment_frames': self.segment_frames,
+                  'created': self.created,
+                  'closed': datetime.datetime.now().isoformat() if complete else None,
+                  'complete': complete}
+        path = os.path.join(self.directory, 'spool.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(header, f)
+        os.replace(path + '.tmp', path)
+
+
+# Reading and consolidation
+################################################################################
+def read_spool(directory: str):
+    """! Read a spool segment by segment. Only committed frames are returned,
+    so a spool left by a crash reads up to its last complete frame.
+    @param directory (str) The spool directory.
+    @return (tuple) The header (dict), with dtype converted to np.dtype, and a
+    generator of (sequence, timestamp, frame) of each committed frame, in
+    sequence order within each segment. Frames are read-only and
+    memory-mapped.
+    """
+    with open(os.path.join(directory, 'spool.json'), 'r') as f:
+        header = json.load(f)
+    if header.get('version') != _SPOOL_VERSION:
+        raise ValueError(f'Unsupported spool version in {directory}.')
+    header['dtype'] = np.lib.format.descr_to_dtype(header['dtype'])
+    shape = tuple(header['shape'])
+
+    def frames():
+        for path in sorted(glob.glob(os.path.join(directory, '*.idx'))):
+            index = np.array(np.memmap(path, dtype=INDEX_DTYPE, mode='r'))
+            committed = np.flatnonzero(index['sequence'] >= 0)
+            if not len(committed):
+                continue
+            data = np.memmap(path[:-3] + 'raw', dtype=header['dtype'], mode='r',
+                             shape=(len(index), *shape))
+            for slot in committed[np.argsort(index['sequence'][committed], kind='stable')]:
+                yield int(index['sequence'][slot]), float(index['timestamp'][slot]), data[slot]
+    return header, frames()
+
+def consolidate(directory: str, output: str = None, name: str = 'spool',
+                remove: bool = False, compression: str = 'gzip',
+                compression_opts: int = 1) -> int:
+    """! Convert a spool into the ExperimentResult layout: one stack per frame
+    field, stacks/name/field (stacks/name/frames for plain frames), and the
+    index, stacks/name/index. Frames are written in sequence order.
+    @param directory (str) The spool directory.
+    @param output (str) The HDF5 file. Default: the spool directory with the
+    extension .h5
+    @param name (str) Group for the stacks in the stacks group.
+    Default: 'spool'
+    @param remove (bool) Delete the spool once consolidated. Default: False
+    @param compression (str) 'gzip', 'lzf' or None. Default: 'gzip'
+    @param compression_opts (int) gzip level (0-9). Default: 1
+    @return (int) Number of frames consolidated.
+    """
+    header, frames = read_spool(directory)
+    if output is None:
+        output = directory.rstrip(os.sep) + '.h5'
+    dtype = header['dtype']
+    fields = dtype.names or ('frames',)
+    result = ExperimentResult(os.path.dirname(os.path.abspath(output)),
+                              os.path.splitext(os.path.basename(output))[0])
+    try:
+        shape = tuple(header['shape'])
+        for field in fields:
+            field_dtype = dtype if dtype.names is None else dtype[field].base
+            field_shape = shape if dtype.names is None else shape + dtype[field].shape
+            result.create_stack(f'{name}/{field}', field_shape, field_dtype,
+                                compression=compression,
+                                compression_opts=compression_opts,
+                                attrs={'spool': os.path.abspath(directory)})
+        index = []
+        for sequence, timestamp, frame in frames:
+            for field in fields:
+                result.append(f'{name}/{field}',
+                              frame if dtype.names is None else frame[field],
+                              block=True)
+            index.append((sequence, timestamp))
+        result.flush()
+        index = np.array(index, dtype=INDEX_DTYPE)
+        result.file.create_dataset(f'stacks/{name}/index', data=index)
+        result.log(f'Consolidated {len(index)} frames from spool {directory}.')
+    finally:
+        result.exit()
+    if remove:
+        shutil.rmtree(directory)
+    return len(index)
+
+def consolidate_async(directory: str, **kwargs) -> concurrent.futures.Future:
+    """! Consolidate a spool in a worker process, so its compression and
+    writing use neither the GUI's nor the acquisition's CPU time.
+    @param directory (str) The spool directory.
+    @param kwargs Keyword arguments of consolidate.
+    @return (Future) Completes with the number of frames consolidated.
+    """
+    executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    future = executor.submit(consolidate, directory, **kwargs)
+    executor.shutdown(wait=False)
+    return future
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Consolidate a frame spool '
+                                     'into an experiment HDF5 file.')
+    parser.add_argument('spool', help='The spool directory.')
+    parser.add_argument('output', nargs='?', default=None,
+                        help='The HDF5 file. Default: SPOOL.h5')
+    parser.add_argument('--name', default='spool',
+                        help='Group for the stacks. Default: spool')
+    parser.add_argument('--remove', action='store_true',
+                        help='Delete the spool once consolidated.')
+    args = parser.parse_args()
+    count = consolidate(args.spool, args.output, args.name, args.remove)
+    print(f'Consolidated {count} frames.')
@@ -0,0 +1,127 @@
+"""!
+@brief Definition of the LiveReader class for reading an experiment file while
+it is being written, e.g. to analyse frames during a long acquisition.
+
+Classes:
+LiveReader
+"""
+
+import time
+import h5py
+
+class LiveReader:
+    """! Follows the appendable datasets of an ExperimentResult file in SWMR
+    mode (see ExperimentResult.start_swmr) from another process.
+
+    Each dataset is read incrementally: read_new returns only the frames
+    written since the previous call, up to the count published by the writer
+    in swmr/valid. That count is updated after the frames are flushed, so a
+    frame read is always complete. follow yields the new frames as they
+    arrive until the writer leaves SWMR mode.
+
+    Methods:
+    --------
+    paths : The datasets which can be followed.
+    valid(path) : Number of frames readable.
+    read_new(path) : Frames written since the last call.
+    follow(path) : Generator of new frames until writing ends.
+    live : Whether the file is still being written.
+    close() : Close the file.
+    """
+    def __init__(self, filename: str, poll: float = 0.2):
+        """! The LiveReader initializer. Opens the file for SWMR reading.
+        @param filename (str) Path to the experiment file.
+        @param poll (float) Time in seconds between checks for new frames in
+        follow. Default: 0.2
+        """
+        self.poll = poll
+
+        ## @var file
+        # (h5py.File) The experiment file, opened for SWMR reading.
+        self.file = h5py.File(filename, 'r', libver='latest', swmr=True)
+
+        ## @var _counts
+        # (h5py.Dataset) The valid frame count of each appendable dataset.
+        self._counts = self.file['swmr/valid']
+
+        ## @var _index
+        # (dict[str]:int) Index in _counts of each dataset, by path.
+        self._index = {path: i for i, path in enumerate(self._counts.attrs['paths'])}
+
+        ## @var _live
+        # (h5py.Dataset) Flag set while the file is being written.
+        self._live = self.file['swmr/live']
+
+        ## @var position
+        # (dict[str]:int) Frames already returned by read_new for each dataset.
+        self.position = dict.fromkeys(self._index, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def paths(self) -> list:
+        return list(self._index)
+
+    @property
+    def live(self) -> bool:
+        """! Whether the writer is still in SWMR mode."""
+        self._live.refresh()
+        return bool(self._live[0])
+
+    def valid(self, path: str) -> int:
+        """! Number of frames of a dataset which can be read.
+        @param path (str) The dataset, e.g. 'stacks/frames'.
+        @return (int) The frame count.
+        """
+        self._counts.refresh()
+        return int(self._counts[self._index[path]])
+
+    def read_new(self, path: str, limit: int = None):
+        """! Read the frames written since the last call.
+        @param path (str) The dataset.
+        @param limit (int) Most frames returned at once. Default: all
+        @return (np.ndarray) The frames, possibly none.
+        """
+        count = self.valid(path)
+        start = self.position[path]
+        if limit is not None:
+            count = min(count, start + limit)
+        dset = self.file[path]
+        dset.refresh()
+        frames = dset[start:count]
+        self.position[path] = max(count, start)
+        return frames
+
+    def follow(self, path: str, limit: int = None, timeout: float = None):
+        """! Generator of the new frames of a dataset as they are written.
+        Ends once the writer has left SWMR mode and every frame has been
+        returned, or no frame has arrived within timeout.
+        @param path (str) The dataset.
+        @param limit (int) Most frames yielded at once. Default: all
+        @param timeout (float) Time in seconds to wait for new frames.
+        Default: no limit
+        @return (np.ndarray) Yields blocks of one or more frames.
+        """
+        last = time.monotonic()
+        while True:
+            # Check the flag first: frames flushed before it was cleared are
+            # still read below
+            live = self.live
+            frames = self.read_new(path, limit)
+            if len(frames):
+                last = time.monotonic()
+                yield frames
+                continue
+            if not live:
+                return
+            if timeout is not None and time.monotonic() - last > timeout:
+                return
+            time.sleep(self.poll)
+
+    def close(self):
+        """! Close the file."""
+        self.file.close()